@@ -0,0 +1,49 @@
+#! /usr/bin/env python3
+"""
+Measure the time needed to render a frame of an effect.
+
+Effect.render (the whole frame at once) is compared to the previous rendering, which called
+get_color for each light.
+
+Usage: python benchmarks/bench_effects.py [--frames 200]
+"""
+
+import time
+import argparse
+
+import numpy
+
+from hyperion2boblight.lib.effects.rainbow import RainbowEffect
+from hyperion2boblight.lib.light_table import BoblightLight, LightTable
+
+def render_per_light(effect, lights, elapsed):
+    """ Reference implementation: one get_color call per light """
+    effect.seek(elapsed)
+    return numpy.array([effect.get_color(light) for light in lights.values()])
+
+def timed(function, frames):
+    """ Return the mean duration of a call to function for each frame (in microseconds) """
+    start = time.perf_counter()
+    for frame in range(frames):
+        function(frame * .1)
+    return (time.perf_counter() - start) / frames * 1e6
+
+def main():
+    """ Parse arguments and run benchmarks """
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    arg_parser.add_argument("--frames", type=int, default=200)
+    options = arg_parser.parse_args()
+
+    effect = RainbowEffect()
+    for count in (50, 300, 2000):
+        lights = LightTable.from_lights([
+            BoblightLight('light{}'.format(i), (i * 100 // count, (i + 1) * 100 // count), (0, 10))
+            for i in range(count)
+        ])
+        per_light = timed(lambda elapsed: render_per_light(effect, lights, elapsed), options.frames)
+        batch = timed(lambda elapsed: effect.render(lights, elapsed), options.frames)
+        print("{:5d} lights: render {:8.1f} us/frame | get_color per light {:8.1f} us/frame "
+              "({:.0f}x)".format(count, batch, per_light, per_light / batch))
+
+if __name__ == "__main__":
+    main()
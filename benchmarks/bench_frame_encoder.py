@@ -0,0 +1,58 @@
+#! /usr/bin/env python3
+"""
+Measure the time needed to encode a frame of boblight 'set light' commands.
+
+The FrameEncoder is compared to the formatting of one string per light, for full frames
+(every light changed) and sparse frames (10% of the lights changed).
+
+Usage: python benchmarks/bench_frame_encoder.py [--frames 200]
+"""
+
+import time
+import argparse
+
+import numpy
+
+from hyperion2boblight.lib.frame_encoder import FrameEncoder
+
+def format_frame(names, colors):
+    """ Reference implementation: format a string per light and encode the whole message """
+    message = ''
+    for name, color in zip(names, colors):
+        message += 'set light {0} rgb {1[0]:.6f} {1[1]:.6f} {1[2]:.6f}\n'.format(name, color)
+    return bytes(message, 'utf8')
+
+def timed(function, frames):
+    """ Return the mean duration of a call to function over the frames (in microseconds) """
+    start = time.perf_counter()
+    for colors in frames:
+        function(colors)
+    return (time.perf_counter() - start) / len(frames) * 1e6
+
+def main():
+    """ Parse arguments and run benchmarks """
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    arg_parser.add_argument("--frames", type=int, default=200)
+    options = arg_parser.parse_args()
+
+    random = numpy.random.RandomState(0)
+    for count in (50, 300, 2000):
+        names = ['light{}'.format(i) for i in range(count)]
+        full_frames = [random.rand(count, 3) for _ in range(options.frames)]
+        sparse_frames = [full_frames[0].copy()]
+        for _ in range(options.frames - 1):
+            colors = sparse_frames[-1].copy()
+            changed = random.rand(count) < .1
+            colors[changed] = random.rand(int(changed.sum()), 3)
+            sparse_frames.append(colors)
+
+        encoder = FrameEncoder(names, keyframe_interval=0)
+        full = timed(encoder.encode, full_frames)
+        encoder = FrameEncoder(names, keyframe_interval=0)
+        sparse = timed(encoder.encode, sparse_frames)
+        formatted = timed(lambda colors: format_frame(names, colors), full_frames)
+        print("{:5d} lights: encoder {:8.1f} us/frame full, {:8.1f} us/frame 10% changed "
+              "| str.format {:8.1f} us/frame".format(count, full, sparse, formatted))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#! /usr/bin/env python3
+"""
+Compare the threaded and the asyncio Hyperion servers.
+
+For each server mode, the server is started in a child process and:
+  * several client threads open a connection, send a serverinfo command, read the reply
+    and close the connection as fast as they can, to measure connections per second;
+  * many idle pollers are kept connected, to measure the resident memory and the number of
+    threads of the server process;
+  * the same pollers send serverinfo commands concurrently on their connection, to measure the
+    polls per second.
+The cost of a serverinfo command is also measured in process, with its cached reply and when
+the reply is rebuilt for each call (as when the priority list changes between the polls).
+
+Usage: python benchmarks/bench_hyperion_server.py [--duration 5] [--clients 8] [--pollers 100]
+"""
+
+import json
+import time
+import logging
+import socket
+import argparse
+import threading
+import multiprocessing
+
+from hyperion2boblight import PriorityList, HyperionServer, AsyncHyperionServer
+from hyperion2boblight.lib import json_codec
+from hyperion2boblight.lib.hyperion_server import HyperionCommandMixin
+from hyperion2boblight.lib.transform import ColorTransform
+from hyperion2boblight.lib.effects.registry import EffectRegistry
+
+SERVER_CLASSES = {
+    'threaded': HyperionServer,
+    'asyncio': AsyncHyperionServer
+}
+
+SERVER_INFO = bytes(json.dumps({'command': 'serverinfo'}) + '\n', 'utf-8')
+
+def run_server(mode, address, ready):
+    """ Child process target: run a server until killed """
+    server = SERVER_CLASSES[mode](address, PriorityList())
+    ready.set()
+    server.serve_forever()
+
+def request(sock):
+    """ Send a serverinfo command and wait for the full reply """
+    sock.sendall(SERVER_INFO)
+    data = b''
+    while not data.endswith(b'\n'):
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+def process_status(pid):
+    """ Return the resident memory (kB) and the number of threads of a process """
+    status = {}
+    with open('/proc/{}/status'.format(pid)) as status_file:
+        for line in status_file:
+            key, _, value = line.partition(':')
+            status[key] = value.strip()
+    return int(status['VmRSS'].split()[0]), int(status['Threads'])
+
+def connections_per_second(address, clients, duration):
+    """ Open/request/close connections from several threads during duration seconds """
+    counts = [0] * clients
+    deadline = time.monotonic() + duration
+
+    def worker(index):
+        while time.monotonic() < deadline:
+            with socket.create_connection(address) as sock:
+                request(sock)
+            counts[index] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / duration
+
+def idle_pollers(address, pid, pollers):
+    """ Keep pollers connected and measure the server process footprint """
+    sockets = []
+    try:
+        for _ in range(pollers):
+            sock = socket.create_connection(address)
+            request(sock)
+            sockets.append(sock)
+        time.sleep(0.5)
+        return process_status(pid)
+    finally:
+        for sock in sockets:
+            sock.close()
+
+def polls_per_second(address, pollers, duration):
+    """ Send serverinfo commands from all the pollers at once during duration seconds """
+    counts = [0] * pollers
+    start = threading.Barrier(pollers + 1)
+    deadline = [None]
+
+    def poller(index):
+        with socket.create_connection(address) as sock:
+            start.wait()
+            while time.monotonic() < deadline[0]:
+                request(sock)
+                counts[index] += 1
+
+    threads = [threading.Thread(target=poller, args=(i,)) for i in range(pollers)]
+    for thread in threads:
+        thread.start()
+    deadline[0] = time.monotonic() + duration
+    start.wait()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / duration
+
+class ServerInfoHandler(HyperionCommandMixin):
+    """ Command handler without connection, to time the serverinfo command alone """
+
+    def __init__(self, priority_list):
+        self.server = self
+        self.server_info = None
+        self.hyperion_priority_list = priority_list
+        self.hyperion_transform = ColorTransform()
+        self.hyperion_effects = EffectRegistry(entry_points=False)
+        self.codec = json_codec.get_codec()
+        self.logger = logging.getLogger("ServerInfoHandler")
+
+def server_info_cost(calls):
+    """ Return the mean duration of a cached and of a rebuilt serverinfo (in microseconds) """
+    priority_list = PriorityList()
+    for priority in range(0, 200, 20):
+        priority_list.put(priority, [priority, priority, priority])
+    handler = ServerInfoHandler(priority_list)
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        handler._server_info() # pylint: disable=protected-access
+    cached = (time.perf_counter() - start) / calls * 1e6
+    start = time.perf_counter()
+    for _ in range(calls):
+        handler.server_info = None
+        handler._server_info() # pylint: disable=protected-access
+    rebuilt = (time.perf_counter() - start) / calls * 1e6
+    return (cached, rebuilt)
+
+def bench(mode, address, options):
+    """ Run the whole benchmark for one server mode """
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=run_server, args=(mode, address, ready))
+    process.start()
+    try:
+        ready.wait(10)
+        time.sleep(0.2)
+        base_rss, base_threads = process_status(process.pid)
+        rate = connections_per_second(address, options.clients, options.duration)
+        rss, threads = idle_pollers(address, process.pid, options.pollers)
+        polls = polls_per_second(address, options.pollers, options.duration)
+    finally:
+        process.terminate()
+        process.join()
+    print("{:>9}: {:8.0f} conn/s | {:6d} kB RSS idle, {:6d} kB with {} pollers "
+          "| {} -> {} threads | {:8.0f} serverinfo/s from {} pollers".format(
+              mode, rate, base_rss, rss, options.pollers, base_threads, threads, polls,
+              options.pollers))
+
+def main():
+    """ Parse arguments and run benchmarks """
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    arg_parser.add_argument("--port", type=int, default=19555)
+    arg_parser.add_argument("--duration", type=float, default=5.)
+    arg_parser.add_argument("--clients", type=int, default=8)
+    arg_parser.add_argument("--pollers", type=int, default=100)
+    arg_parser.add_argument(
+        "--mode", action="append", choices=sorted(SERVER_CLASSES.keys()))
+    options = arg_parser.parse_args()
+
+    (cached, rebuilt) = server_info_cost(10000)
+    print("serverinfo: {:.2f} us cached | {:.2f} us rebuilt ({:.0f}x)".format(
+        cached, rebuilt, rebuilt / cached))
+    for port_offset, mode in enumerate(options.mode or ['threaded', 'asyncio']):
+        bench(mode, ("localhost", options.port + port_offset), options)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#! /usr/bin/env python3
+"""
+Measure the time needed to parse the Hyperion commands and to encode the replies.
+
+Each available JSON codec is compared to the previous handling, which decoded each line to a
+string, stripped it and parsed it with json, then encoded the reply to a string and to bytes.
+
+Usage: python benchmarks/bench_json_codec.py [--stream FILE] [--repeat 20]
+where FILE is a captured command stream: one JSON command per line.
+"""
+
+import json
+import time
+import base64
+import argparse
+
+from hyperion2boblight.lib import json_codec
+
+def sample_stream():
+    """ Return a stream of commands representative of a Hyperion client """
+    lines = []
+    image = base64.b64encode(bytes(range(256)) * (64 * 36 * 3 // 256)).decode('ascii')
+    for i in range(200):
+        lines.append({'command': 'color', 'priority': 128, 'color': [i % 256, 64, 255 - i % 256]})
+        if i % 4 == 0:
+            lines.append({'command': 'image', 'priority': 100, 'imagewidth': 64,
+                          'imageheight': 36, 'imagedata': image})
+        if i % 50 == 0:
+            lines.append({'command': 'serverinfo'})
+            lines.append({'command': 'effect', 'priority': 50,
+                          'effect': {'name': 'Rainbow', 'args': {}}})
+    return [(json.dumps(line) + '\n').encode('utf-8') for line in lines]
+
+def previous_loads(line):
+    """ Reference implementation of the parsing """
+    return json.loads(str(line, 'utf-8').strip())
+
+def previous_dumps(reply):
+    """ Reference implementation of the reply encoding """
+    return bytes(json.dumps(reply) + '\n', 'utf-8')
+
+def timed(function, items, repeat):
+    """ Return the mean duration of a call to function for each item (in microseconds) """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            function(item)
+    return (time.perf_counter() - start) / (repeat * len(items)) * 1e6
+
+def main():
+    """ Parse arguments and run benchmarks """
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    arg_parser.add_argument("--stream", help="captured command stream, one command per line")
+    arg_parser.add_argument("--repeat", type=int, default=20)
+    options = arg_parser.parse_args()
+
+    if options.stream:
+        with open(options.stream, 'rb') as stream:
+            lines = [line for line in stream if line.strip()]
+    else:
+        lines = sample_stream()
+    replies = [{'success': True}, {'success': False, 'error': 'Unknown command'}]
+    print("{} commands, {:.0f} bytes on average".format(
+        len(lines), sum(len(line) for line in lines) / len(lines)))
+
+    parse = timed(previous_loads, lines, options.repeat)
+    encode = timed(previous_dumps, replies, options.repeat * 100)
+    print("{:>8}: parse {:7.2f} us/command | encode {:5.2f} us/reply".format(
+        'previous', parse, encode))
+    for (name, codec) in sorted(json_codec.CODECS.items()):
+        codec_parse = timed(lambda line: codec.loads(memoryview(line)), lines, options.repeat)
+        codec_encode = timed(codec.dumps, replies, options.repeat * 100)
+        print("{:>8}: parse {:7.2f} us/command ({:.1f}x) | encode {:5.2f} us/reply ({:.1f}x)"
+              .format(name, codec_parse, parse / codec_parse, codec_encode,
+                      encode / codec_encode))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#! /usr/bin/env python3
+"""
+Measure the per-frame cost of computing the lights colors from an image.
+
+The summed-area table sampler (LightRegionSampler) is compared to a direct mean of each
+scanning area, for 50, 300 and 2000 lights with random overlapping areas.
+
+Usage: python benchmarks/bench_light_regions.py [--width 64] [--height 36] [--frames 200]
+"""
+
+import time
+import argparse
+
+import numpy
+
+from hyperion2boblight.lib.boblight_client import BoblightLight
+from hyperion2boblight.lib.image import LightRegionSampler, light_rectangles
+
+def random_lights(count, random):
+    """ Create count lights with random scanning areas """
+    lights = []
+    for i in range(count):
+        left, right = sorted(random.randint(0, 101, 2))
+        top, bottom = sorted(random.randint(0, 101, 2))
+        lights.append(BoblightLight(str(i), (left, right), (top, bottom)))
+    return lights
+
+def direct_means(pixels, bounds):
+    """ Reference implementation: one mean per scanning area """
+    x_0, x_1, y_0, y_1 = bounds
+    return [
+        pixels[y_0[i]:y_1[i], x_0[i]:x_1[i]].reshape(-1, 3).mean(axis=0) / 255.
+        for i in range(len(x_0))
+    ]
+
+def timed(function, frames):
+    """ Return the mean duration of a call to function over the frames (in microseconds) """
+    start = time.perf_counter()
+    for pixels in frames:
+        function(pixels)
+    return (time.perf_counter() - start) / len(frames) * 1e6
+
+def main():
+    """ Parse arguments and run benchmarks """
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    arg_parser.add_argument("--width", type=int, default=64)
+    arg_parser.add_argument("--height", type=int, default=36)
+    arg_parser.add_argument("--frames", type=int, default=200)
+    options = arg_parser.parse_args()
+
+    random = numpy.random.RandomState(0)
+    frames = [
+        random.randint(0, 256, (options.height, options.width, 3)).astype(numpy.uint8)
+        for _ in range(16)
+    ]
+    frames = (frames * (options.frames // len(frames) + 1))[:options.frames]
+
+    print("{}x{} frames".format(options.width, options.height))
+    for count in (50, 300, 2000):
+        lights = random_lights(count, random)
+        sampler = LightRegionSampler(lights, options.width, options.height)
+        bounds = light_rectangles(lights, options.width, options.height)
+        sat = timed(sampler.sample, frames)
+        direct = timed(lambda pixels: direct_means(pixels, bounds), frames)
+        print("{:5d} lights: summed-area table {:8.1f} us/frame | direct means {:9.1f} us/frame"
+              .format(count, sat, direct))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#! /usr/bin/env python3
+"""
+Measure the cost of the metrics on the commands handling.
+
+Color commands are handled by the Hyperion command handler, without connection, with the
+metrics disabled and enabled. Both are run several times in turn, the best run is kept.
+
+Usage: python benchmarks/bench_metrics.py [--commands 20000]
+"""
+
+import json
+import time
+import logging
+import argparse
+
+from hyperion2boblight import PriorityList
+from hyperion2boblight.lib import json_codec
+from hyperion2boblight.lib.hyperion_server import HyperionCommandMixin
+from hyperion2boblight.lib.metrics import Metrics
+
+class CommandHandler(HyperionCommandMixin):
+    """ Command handler without connection """
+
+    def __init__(self, metrics):
+        self.server = self
+        self.metrics = metrics
+        self.hyperion_priority_list = PriorityList()
+        self.codec = json_codec.get_codec()
+        self.logger = logging.getLogger("CommandHandler")
+
+def timed(handler, lines):
+    """ Return the mean duration of the handling of a command (in microseconds) """
+    start = time.perf_counter()
+    for line in lines:
+        handler.process_commands((line,))
+    return (time.perf_counter() - start) / len(lines) * 1e6
+
+def main():
+    """ Parse arguments and run benchmarks """
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    arg_parser.add_argument("--commands", type=int, default=20000)
+    arg_parser.add_argument("--runs", type=int, default=5)
+    options = arg_parser.parse_args()
+
+    lines = [
+        bytes(json.dumps({'command': 'color', 'priority': 100, 'color': [i % 256, 0, 0]}) + '\n',
+              'utf-8')
+        for i in range(options.commands)]
+    (disabled, enabled) = (float('inf'), float('inf'))
+    for _ in range(options.runs):
+        disabled = min(disabled, timed(CommandHandler(None), lines))
+        enabled = min(enabled, timed(CommandHandler(Metrics()), lines))
+    print("color command: {:.2f} us without metrics | {:.2f} us with metrics (+{:.2f} us)"
+          .format(disabled, enabled, enabled - disabled))
+
+if __name__ == "__main__":
+    main()
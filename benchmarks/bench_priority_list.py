@@ -0,0 +1,135 @@
+#! /usr/bin/env python3
+"""
+Measure the PriorityList throughput with many handler threads putting items.
+
+Producer threads put colors at random priorities (most of them below the first item, as
+background sources do) while consumers wait for the changes of the first item. The heap
+based PriorityList is compared to the previous implementation, which sorted all the priorities
+on each access and woke up every waiter on each change. The heap based PriorityList consumers
+either wait for a new generation or read their own subscription.
+
+Usage: python benchmarks/bench_priority_list.py [--threads 16] [--duration 3] [--priorities 200]
+"""
+
+import time
+import random
+import argparse
+import threading
+
+from hyperion2boblight import PriorityList, Empty
+
+class SortedPriorityList(object):
+    """ Previous implementation, kept as a reference """
+    def __init__(self):
+        self.data = {}
+        self.condition = threading.Condition(threading.RLock())
+        self.wakeups = 0
+
+    def get_priorities(self):
+        with self.condition:
+            result = list(self.data.keys())
+            result.sort()
+        return result
+
+    def put(self, priority, data=None):
+        with self.condition:
+            self.data[priority] = data
+            self.condition.notify_all()
+
+    def get_first(self):
+        with self.condition:
+            priorities = self.get_priorities()
+            if priorities:
+                return (priorities[0], self.data[priorities[0]])
+            raise Empty()
+
+    def wait_new_item(self):
+        with self.condition:
+            while True:
+                try:
+                    current_first = self.get_first()
+                except Empty:
+                    current_first = None
+                self.condition.wait()
+                self.wakeups += 1
+                new_first = self.get_first()
+                if new_first != current_first:
+                    break
+        return new_first
+
+def bench(priority_list, options, subscribe=False):
+    """ Run the producers and the consumers, return puts/s and consumers wakeups """
+    stop = threading.Event()
+    counts = [0] * options.threads
+    wakeups = [0] * options.consumers
+    priority_list.put(1, [0, 0, 0])
+
+    def producer(index):
+        rand = random.Random(index)
+        while not stop.is_set():
+            priority = rand.randint(1, options.priorities)
+            priority_list.put(priority, [rand.randint(0, 255)] * 3)
+            counts[index] += 1
+
+    def consumer(index):
+        generation = getattr(priority_list, 'generation', None)
+        if subscribe:
+            with priority_list.subscribe() as subscription:
+                while not stop.is_set():
+                    try:
+                        subscription.get(0.1)
+                    except Empty:
+                        continue
+                    wakeups[index] += 1
+            return
+        while not stop.is_set():
+            if generation is None:
+                priority_list.wait_new_item()
+            else:
+                (generation, _) = priority_list.wait_generation(generation, 0.1)
+                wakeups[index] += 1
+
+    threads = [threading.Thread(target=producer, args=(i,)) for i in range(options.threads)]
+    for index in range(options.consumers):
+        threading.Thread(target=consumer, args=(index,), daemon=True).start()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(options.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    priority_list.put(0, 'quit')
+    return sum(counts) / elapsed, getattr(priority_list, 'wakeups', sum(wakeups))
+
+def bench_get_first(priority_list, options):
+    """ Return the duration of get_first() (in microseconds) with many items """
+    for priority in range(options.priorities):
+        priority_list.put(priority + 1, [priority] * 3)
+    start = time.perf_counter()
+    for _ in range(10000):
+        priority_list.get_first()
+    return (time.perf_counter() - start) / 10000 * 1e6
+
+def main():
+    """ Parse arguments and run benchmarks """
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    arg_parser.add_argument("--threads", type=int, default=16)
+    arg_parser.add_argument("--duration", type=float, default=3.)
+    arg_parser.add_argument("--priorities", type=int, default=200)
+    arg_parser.add_argument("--consumers", type=int, default=3)
+    options = arg_parser.parse_args()
+
+    for name, priority_list, subscribe in (
+            ('sorted', SortedPriorityList(), False),
+            ('heap', PriorityList(), False),
+            ('subscribe', PriorityList(), True)):
+        rate, wakeups = bench(priority_list, options, subscribe)
+        get_first = bench_get_first(priority_list, options)
+        print("{:>9}: {:9.0f} puts/s from {} threads, {:7d} wakeups of {} consumers "
+              "| get_first {:5.2f} us".format(
+                  name, rate, options.threads, wakeups, options.consumers, get_first))
+
+if __name__ == "__main__":
+    main()
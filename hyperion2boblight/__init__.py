@@ -3,7 +3,10 @@ Hyperion2Boblight package contains all necessary classes/modules to run a hyperi
 server. See the documentation of the following modules:
     * priority_list
     * boblight_client
+    * boblight_fanout
     * hyperion_server
+    * async_hyperion_server
+    * transform
     * effects package
     """
 
@@ -11,12 +14,17 @@ server. See the documentation of the following modules:
 from .lib import effects
 from .lib.priority_list import PriorityList, Empty
 from .lib.boblight_client import BoblightClient
+from .lib.boblight_fanout import BoblightFanout
 from .lib.hyperion_server import HyperionServer, HyperionRequestHandler
+from .lib.async_hyperion_server import AsyncHyperionServer
+from .lib.transform import ColorTransform
 
 __all__ = [
     'effects',
     'PriorityList', 'Empty',
-    'BoblightClient',
-    'HyperionServer', 'HyperionRequestHandler'
+    'BoblightClient', 'BoblightFanout',
+    'HyperionServer', 'HyperionRequestHandler',
+    'AsyncHyperionServer',
+    'ColorTransform'
 ]
 
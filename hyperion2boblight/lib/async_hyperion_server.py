@@ -0,0 +1,171 @@
+"""
+Asyncio TCP Server to handle Hyperion clients connections
+
+It serves the same commands as the threaded HyperionServer, but all the connections are handled
+by a single event loop instead of one thread per client.
+"""
+
+import socket
+import asyncio
+import logging
+import threading
+
+from . import json_codec
+from .hyperion_server import HyperionCommandMixin
+from .line_reader import LineReader
+from .led_stream import LedStream
+from .priority_list import Empty
+from .transform import ColorTransform
+from .effects.registry import EffectRegistry
+
+class AsyncHyperionServer:
+    """ Asyncio TCP Server waiting for hyperion client connections.
+
+    It mimics the socketserver API (serve_forever, shutdown, server_close) so that it can be used
+    as a drop-in replacement of the HyperionServer.
+    """
+
+    def __init__(self, server_address, priority_list, transform=None, effects=None,
+                 codec=None, led_stream=None, metrics=None):
+        """
+        server_address: (host, port) on which to bind the server
+        priority_list: shared PriorityList which will contain commands
+        transform: shared ColorTransform changed by the transform command (a new one is
+            created if None)
+        effects: EffectRegistry of the effects reported by the serverinfo command (a new one
+            is created if None)
+        codec: JSON codec of the commands and replies (the fastest available if None)
+        led_stream: LedStream of the colors sent to the lights, streamed to the clients
+            sending the ledcolors command (a new one is created if None)
+        metrics: Metrics recording the commands handling, and reported by the metrics command
+            (None to disable them)
+        """
+        self.logger = logging.getLogger("AsyncHyperionServer")
+        self.priority_list = priority_list
+        self.transform = transform if transform is not None else ColorTransform()
+        self.effects = effects if effects is not None else EffectRegistry()
+        self.codec = codec if codec is not None else json_codec.get_codec()
+        self.led_stream = led_stream if led_stream is not None else LedStream(codec=self.codec)
+        self.metrics = metrics
+        self.server_info = None # (versions, encoded reply) of the last serverinfo command
+        self.loop = asyncio.new_event_loop()
+        self.is_shut_down = threading.Event()
+        self.is_shut_down.set()
+        self.loop_thread_id = None
+        self.connections = set()
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            self.socket.bind(server_address)
+            self.socket.listen(socket.SOMAXCONN)
+        except socket.error:
+            self.socket.close()
+            raise
+        self.socket.setblocking(False)
+        self.server_address = self.socket.getsockname()
+
+    def serve_forever(self):
+        """ Run the event loop until shutdown() is called """
+        self.is_shut_down.clear()
+        self.loop_thread_id = threading.get_ident()
+        asyncio.set_event_loop(self.loop)
+        try:
+            server = self.loop.run_until_complete(
+                self.loop.create_server(
+                    lambda: AsyncHyperionProtocol(self),
+                    sock=self.socket))
+            self.loop.run_forever()
+            server.close()
+            for connection in list(self.connections):
+                connection.transport.close()
+            self.loop.run_until_complete(server.wait_closed())
+        finally:
+            self.is_shut_down.set()
+
+    def shutdown(self):
+        """
+        Stop the serve_forever loop.
+
+        When called from another thread, wait until the loop is actually stopped. When called
+        from the loop itself (e.g. by the quit command), only schedule the stop.
+        """
+        if self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if threading.get_ident() != self.loop_thread_id:
+            self.is_shut_down.wait()
+
+    def server_close(self):
+        """ Clean up the server """
+        if not self.loop.is_running() and not self.loop.is_closed():
+            self.loop.close()
+        self.socket.close()
+
+class AsyncHyperionProtocol(HyperionCommandMixin, asyncio.Protocol):
+    """
+    The class which will be instantiated for any new connection on the server to process the
+    requests.
+    """
+
+    # Streamed frames are dropped while more bytes than this wait to be sent to the client
+    LED_STREAM_HIGH_WATER = 65536
+
+    def __init__(self, server):
+        self.server = server
+        self.hyperion_priority_list = server.priority_list
+        self.hyperion_transform = server.transform
+        self.hyperion_effects = server.effects
+        self.codec = server.codec
+        self.logger = logging.getLogger("AsyncHyperionProtocol")
+        self.transport = None
+        self.reader = LineReader()
+        self.led_frames = None # Mailbox of the streamed frames
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server.connections.add(self)
+
+    def data_received(self, data):
+        self.reader.feed(data)
+        # Commands are separated by new lines, the commands received together are handled as
+        # one batch and their replies are written together
+        lines = []
+        line = self.reader.next_line()
+        while line is not None:
+            if not line.isspace():
+                lines.append(line)
+            line = self.reader.next_line()
+        if lines:
+            self.transport.write(self.process_commands(lines))
+
+    def connection_lost(self, exc):
+        self.stop_led_stream()
+        self.server.connections.discard(self)
+
+    def start_led_stream(self):
+        """ Stream the colors sent to the lights, written by the event loop """
+        if self.led_frames is None:
+            self.led_frames = self.server.led_stream.subscribe(
+                lambda: self.server.loop.call_soon_threadsafe(self._write_led_frame))
+
+    def stop_led_stream(self):
+        """ Stop streaming the colors sent to the lights """
+        if self.led_frames is not None:
+            self.server.led_stream.unsubscribe(self.led_frames)
+            self.led_frames = None
+
+    def _write_led_frame(self):
+        """ Write the pending streamed frame, unless the client is too slow to read it """
+        mailbox = self.led_frames
+        if mailbox is None or self.transport.is_closing():
+            return
+        try:
+            data = mailbox.get(timeout=0)
+        except Empty:
+            # Already written by a previous call
+            return
+        if self.transport.get_write_buffer_size() > self.LED_STREAM_HIGH_WATER:
+            mailbox.drop()
+            return
+        self.transport.write(data)
@@ -1,109 +1,119 @@
 """ BoblightClient is a module used to send commands to a BoblightServer
 It fetch the commands from a priority list, send the most prioritary one
 and keep the connection active.
-It can launch some effects located in hyperemote2boblight.lib.effects
+It can launch some effects located in hyperemote2boblight.lib.effects, and smooth the
+transitions between colors. Both are rendered at a fixed rate by a single EffectScheduler
+thread.
 """
+import time
 import socket
 import logging
 import threading
-from .effects import rainbow
 
-from hyperion2boblight import Empty
-
-class BoblightLight:
-    """
-    A light as defined in the Boblight config file.
-
-    It can be used by the Effect objects to return expected color given
-    the scanning area of a light.
-
-    To instanciate a light object, you must pass to its constructor values
-    returned by the boblight server. Nevertheless, internally coordinates
-    are stored in a relative manner : left-top corner is (0, 0) and
-    right-bottom one is (1.0, 1.0).
-    """
-
-    def __init__(self, name, hscan, vscan):
-        """
-        Create a new light.
-
-        name is the name of the light. It's not very useful except for debug
-        informations.
-        hscan and vscan are tuples, representing the scanning area coordinates,
-        according to the boblight configuration (i.e. with values between 0
-        and 100).
-        """
-        self.name = name
-        self.left = float(hscan[0])/100
-        self.right = float(hscan[1])/100.
-        self.top = float(vscan[0])/100
-        self.bottom = float(vscan[1])/100.
-
-    @property
-    def width(self):
-        """
-        The width property is the width of the scanning area of the light.
-        """
-        try:
-            return self.width
-        except AttributeError:
-            self.width = self.right - self.left
-
-    @property
-    def height(self):
-        """
-        The height property is the height of the scanning area of the light.
-        """
-        try:
-            return self.height
-        except AttributeError:
-            self.height = self.bottom - self.right
-
-    def contains(self, coord):
-        """
-        Check that light reacts to the point with coordinates coord.
-        """
-        return (
-            coord[0] > self.left and coord[0] < self.right and
-            coord[1] > self.top and coord[1] < self.bottom
-        )
-
-    def __str__(self):
-        return "-<O {} ({:.2f}-{:.2f}, {:.2f}|{:.2f})".format(
-            self.name,
-            self.left, self.right,
-            self.top, self.bottom)
-
-    def __repr__(self):
-        return "BoblightLight({}, ({:d}, {:d}), ({:d}, {:d}))".format(
-            self.name,
-            int(self.left * 100), int(self.right * 100),
-            int(self.top * 100), int(self.bottom *100))
+import numpy
 
+from .effects.registry import EffectRegistry
+from .effects.scheduler import EffectScheduler
+from .image import HyperionImage
+from .mapping_cache import MappingCache
+from .frame_encoder import FrameEncoder
+from .boblight_connection import BoblightConnection
+from .smoothing import Smoothing
+from .light_table import BoblightLight, LightTable # BoblightLight kept for compatibility
 
 class BoblightClient:
     """
     Client which connect to a Boblight server and send it commands from a PriorityList
     """
-    def __init__(self, server_address, priority_list):
+    def __init__(self, server_address, priority_list, mapping_cache=None,
+                 tolerance=0., keyframe_interval=100, ping_interval=5., output_fps=10.,
+                 transform=None, smoothing=None, smoothing_time=.1, effects=None,
+                 effect_pool=None, led_stream=None, metrics=None):
+        """
+        server_address: (host, port) of the boblight server
+        priority_list: shared PriorityList from which commands are fetched
+        mapping_cache: MappingCache used to map images on the lights (a memory only one is
+            created if None)
+        tolerance: a light is sent only if one of its components changed by more than
+            tolerance (0. to 1.) since it was last sent
+        keyframe_interval: every keyframe_interval frames, all the lights are sent whether
+            they changed or not (0 to disable)
+        ping_interval: delay (in seconds) between two pings of the server, used to measure
+            the round-trip time and to detect stalled connections (0 to disable)
+        output_fps: number of frames per second rendered for effects and smoothing
+        transform: ColorTransform applied to the frames before they are sent (None to send
+            them as is)
+        smoothing: 'linear' or 'exponential' to smooth the transitions between colors, None
+            to send colors as soon as they are received. When enabled, frames are only sent
+            at output_fps.
+        smoothing_time: settling time (linear) or time constant (exponential) of the
+            smoothing, in seconds
+        effects: EffectRegistry of the effects which can be launched (a new one is created if
+            None)
+        effect_pool: EffectWorkerPool rendering the effects in other processes (None to render
+            them in the scheduler thread)
+        led_stream: LedStream to which the colors of the frames sent are published (None to
+            publish them nowhere)
+        metrics: Metrics recording the latencies, frames and bytes sent (None to disable them)
+        """
         self.logger = logging.getLogger("BoblightClient")
         self.priority_list = priority_list # Priority list from which get the command
 
-        self.lights = {} # Boblight server lights
-        self.message = "" # Message to send to the server
-
-        self.effect_threads = [] # List of launched effect
-        self.effect_stop_event = threading.Event() # Threading event to stop effects
-
+        self.lights = LightTable() # Boblight server lights
+        self.lights_layout = None # Hash of the lights layout, key of the mapping cache
+        self.mapping_cache = mapping_cache if mapping_cache is not None else MappingCache()
+        self.message = bytearray() # Commands to send to the server before the frame
+
+        self.tolerance = tolerance
+        self.keyframe_interval = keyframe_interval
+        self.encoder = FrameEncoder([], tolerance, keyframe_interval) # Lights frames encoder
+        self.frame = numpy.zeros((0, 3)) # Colors of the lights in the next frame
+        self.frame_pending = False # Whether the frame must be sent
+        self.priority = None # Last priority set on the server
+        self.frames_sent = 0 # Number of frames sent
+        self.bytes_sent = 0 # Number of bytes sent
+        self.sends = 0 # Number of writes to the server
+        self.send_latency = 0. # Duration of the last write (in seconds)
+        self.send_latency_max = 0. # Longest write duration (in seconds)
+        self.send_latency_total = 0. # Total writes duration (in seconds)
+        self.transform = transform
+        self.led_stream = led_stream
+        self.metrics = metrics
+        self.command_received = None # Reception time of the command to send, if measured
+
+        # Serialize the frames preparation and sending between the commands handling and
+        # the effects rendering
+        self.lock = threading.RLock()
+        self.effect_scheduler = EffectScheduler(self.render_frame, output_fps)
+        self.smoothing = None if smoothing is None else Smoothing(smoothing, smoothing_time)
+        self.effects = effects if effects is not None else EffectRegistry()
+        self.effect_pool = effect_pool
+        self.client_effects = {} # Effects rendered for this client only, by name
+
+        # The connection restores the client state each time it is (re)established
+        self.connection = BoblightConnection(
+            server_address, self.handshake, ping_interval=ping_interval,
+            lost=self._connection_lost)
         try:
-            self.socket = socket.create_connection(server_address)
-        except socket.error as socket_error:
-            logging.error(
-                "Unable to create the connection to boblight server '%s:%d'",
+            self.connection.open()
+        except socket.error:
+            self.logger.error(
+                "Unable to create the connection to boblight server '%s:%d', will retry",
                 server_address[0],
                 server_address[1])
-            raise socket_error
-        self.logger.info('Boblight connection accepted.')
+
+        # The changes of the first item of the priority list are posted in a mailbox. If
+        # they happen faster than they are sent, only the newest one is sent.
+        self.subscription = priority_list.subscribe(listener=self._priority_list_changed)
+        self.mailbox = self.subscription.mailbox # Latest (generation, command) to send
+        if transform is not None:
+            # Send the current command again, through the new transform
+            transform.add_listener(self.mailbox.repeat)
+
+    @property
+    def socket(self):
+        """ The socket currently connected to the boblight server (None if disconnected) """
+        return self.connection.socket
 
 
     def run(self):
@@ -111,37 +121,99 @@ class BoblightClient:
         This function will send command to the Boblight server indefinitely. It can be
         used as a target for a threading.Thread object
         """
-        self.say_hello()
-        self.get_lights()
-
-        try:
-            command = self.priority_list.get_first()
-            self.handle_command(command)
-        except Empty:
-            pass
-
-        # wait for new command
-        while True:
-            try:
-                command = self.priority_list.wait_new_item()
-                if command[1] == 'quit':
+        effect_thread = threading.Thread(
+            target=self.effect_scheduler.run,
+            name="{}-effects".format(threading.current_thread().name))
+        effect_thread.start()
+
+        ping_thread = None
+        # The handshake changes the lights and the frame: the effects wait for it
+        with self.lock:
+            connected = self.connection.connect()
+        if connected:
+            ping_thread = threading.Thread(
+                target=self.connection.ping_forever,
+                name="{}-ping".format(threading.current_thread().name))
+            ping_thread.start()
+
+            # wait for new command
+            while True:
+                (_, command) = self.subscription.get()
+                if command is not None and command[1] == 'quit':
                     break
-            except Empty:
-                command = None
-            self.handle_command(command)
+                if self.metrics is not None:
+                    self._command_delivered(command)
+                try:
+                    self.handle_command(command)
+                except Exception: # pylint: disable=broad-except
+                    # A bad command must not stop the client: the next ones are still sent
+                    self.logger.exception("Unable to handle the command %s", command)
+
+        self.logger.info(
+            'Shutting Down (%d of %d commands dropped)',
+            self.mailbox.dropped, self.mailbox.posted)
+        self.logger.info(
+            '%d frames sent, %.1f bytes per frame, %d of %d light updates skipped',
+            self.frames_sent, self.bytes_per_frame, self.encoder.lights_skipped,
+            self.encoder.lights_skipped + self.encoder.lights_sent)
+        self.logger.info(
+            '%d effect frames rendered, %d missed deadlines',
+            self.effect_scheduler.frames, self.effect_scheduler.missed)
+        self.subscription.close()
+        self.effect_scheduler.close()
+        effect_thread.join()
+        if self.effect_pool is not None:
+            for effect in self.client_effects.values():
+                effect.close()
+        self.connection.close()
+        if ping_thread is not None:
+            ping_thread.join()
+
+    def _priority_list_changed(self, generation, command):
+        """
+        Subscription listener, called by the thread changing the priority list: on the quit
+        command, stop any connection attempt, so that a client whose server is down can quit
+        too.
+        """
+        if command is not None and command[1] == 'quit':
+            self.connection.abort()
 
-        self.logger.info('Shutting Down')
-        self.effect_stop_event.set()
-        for thread in self.effect_threads:
-            thread.join()
-        self.socket.shutdown(socket.SHUT_RDWR)
-        self.socket.close()
+    def _connection_lost(self):
+        """
+        Connection listener, called by the ping thread when the server does not answer:
+        handle the current command again, so that this thread reconnects and restores the
+        server state even if nothing else is sent.
+        """
+        self.mailbox.repeat()
+
+    def _command_delivered(self, command):
+        """ Measure the delay between the reception of the command and its delivery """
+        if command is None:
+            return
+        received = self.priority_list.get_timestamp(command[0])
+        if received is not None:
+            self.metrics.histogram('delivery_latency').observe(time.monotonic() - received)
+            with self.lock:
+                self.command_received = received
 
     def handle_command(self, command):
         """ Main worker """
+        with self.lock:
+            self._handle_command(command)
+            if self.smoothing is not None and self.frame_pending:
+                # The scheduler sends the frames of the transition
+                self.smoothing.set_target(self.frame)
+                self.effect_scheduler.animate()
+                return
+            # Actually send commands to the Boblight server
+            self.send()
+
+    def _handle_command(self, command):
+        """ Prepare the message and the frame matching the command """
         # No command given, turn off lights
         if command is None:
             self.logger.debug("Turning off the lights")
+            self.effect_scheduler.hide()
             self.set_priority(0)
             self.set_all_lights((0, 0, 0))
         else:
@@ -150,33 +222,93 @@ class BoblightClient:
                 command[0],
                 command[1]
             )
+            # Handle effects
+            if isinstance(command[1], str) and command[1] in self.effects:
+                try:
+                    # The clients of other servers render the same effects at their own pace
+                    effect = self.client_effects.get(command[1])
+                    if effect is None:
+                        if self.effect_pool is not None:
+                            effect = self.effect_pool.effect(command[1])
+                        else:
+                            effect = self.effects.create(command[1])
+                        self.client_effects[command[1]] = effect
+                except (ImportError, AttributeError) as error:
+                    self.logger.error("Unable to load effect %s: %s", command[1], error)
+                    effect = None
+                if effect is not None:
+                    self.set_priority(command[0])
+                    # The scheduler renders its first frame as soon as possible
+                    self.effect_scheduler.show(command[0], effect)
+                    return
             # Stop any running effect
-            self.effect_stop_event.set()
+            self.effect_scheduler.show(command[0], None)
             # Handle classic 'color' command
             if isinstance(command[1], list):
                 self.set_priority(command[0])
                 self.set_all_lights(
                     tuple([float(color)/255 for color in command[1]])
                 )
-            # Handle rainbow effect
-            elif isinstance(command[1], str) and command[1] == 'Rainbow':
+            # Handle 'image' command: each light takes the mean color of its scanning area
+            elif isinstance(command[1], HyperionImage):
                 self.set_priority(command[0])
-                self.effect_threads.append(self.EffectThread(self, rainbow.RainbowEffect()))
-                self.effect_threads[-1].start()
+                self.set_image(command[1])
             else:
                 self.logger.warning(
                     "Command not recognized : %s",
                     command[0]
                 )
-        # Actually send commands to the Boblight server
+
+    def render_frame(self, priority, effect, elapsed):
+        """
+        Render and send a frame of the effect, if it is still the displayed one, and of the
+        smoothing transition.
+        elapsed is the time (in seconds) since the effect started.
+        Return True while the smoothing transition is not over.
+        """
+        with self.lock:
+            if effect is not None:
+                if not self.effect_scheduler.is_displayed(priority, effect):
+                    return False
+                if self.metrics is not None:
+                    start = time.monotonic()
+                    colors = effect.render(self.lights, elapsed)
+                    self.metrics.histogram('effect_render_time').observe(
+                        time.monotonic() - start)
+                else:
+                    colors = effect.render(self.lights, elapsed)
+                if colors is None:
+                    # Frame skipped by the effect worker pool
+                    return False
+                self.set_lights(colors)
+                if self.smoothing is not None:
+                    self.smoothing.set_target(self.frame)
+            moving = False
+            if self.smoothing is not None:
+                moving = self.smoothing.step()
+                self.frame_pending = True
+            self.send()
+            return moving
+
+    def handshake(self):
+        """
+        Initiate the communication and restore the state of the server: priority and
+        colors of the lights. It is run by the connection each time it is established, by
+        the thread holding the client lock, which is the only one reconnecting.
+        """
+        self.say_hello()
+        self.get_lights()
+        if self.priority is not None:
+            self.set_priority(self.priority)
+            self.frame_pending = True
         self.send()
 
     def say_hello(self):
         """ Initiate communication with a hand shaking """
-        self.message = 'hello\n'
+        self.message += b'hello\n'
         self.send()
 
-        data = self.socket.recv(4096)
+        data = self.connection.readline()
         if data != bytes('hello\n', "utf8"):
             self.logger.critical(
                 ":say_hello(): Incorrect response from boblight server: '%s'",
@@ -184,76 +316,149 @@ class BoblightClient:
 
     def get_lights(self):
         """ Get lights connected to the Boblight server """
-        self.message = 'get lights\n'
+        self.message += b'get lights\n'
         self.send()
 
-        data = str(self.socket.recv(4096), "utf-8").strip()
-        lines = data.split('\n')
-        if lines[0].split()[0] != "lights":
+        # The listing can be split in many segments: read up to the announced count
+        header = str(self.connection.readline(), "utf-8")
+        lines = [header]
+        previous_lights = self.lights
+        names = []
+        bounds = []
+        if header.split()[:1] != ["lights"]:
             self.logger.error("Unable to enumerate lights")
         else:
+            count = int(header.split()[1])
+            lines += [str(line, "utf-8") for line in self.connection.readlines(count)]
             for line in lines[1:]:
-                (_, name, _, vscan_0, vscan_1, hscan_0, hscan_1) = line.split(' ')
-                self.lights[name] = BoblightLight(
-                    name,
-                    (hscan_0, hscan_1),
-                    (vscan_0, vscan_1)
-                )
-            if int(lines[0].split()[1]) != len(self.lights):
+                try:
+                    (_, name, _, vscan_0, vscan_1, hscan_0, hscan_1) = line.split()
+                    bounds.append(
+                        (float(hscan_0), float(hscan_1), float(vscan_0), float(vscan_1)))
+                except ValueError:
+                    self.logger.warning("Invalid light description: '%s'", line.strip())
+                    continue
+                names.append(name)
+            if count != len(names):
                 self.logger.warning(
                     "%s light(s) announced and %s found.",
-                    lines[0].split()[1], len(self.lights)
+                    count, len(names)
                 )
+        # Boblight scanning areas are given in percents
+        self.lights = LightTable(names, numpy.array(bounds, dtype=numpy.float64) / 100.)
+        self.lights_layout = None
         self.logger.debug("Found %s lights: %s", len(self.lights), self.lights)
-        return data
+        if self.lights.names != previous_lights.names:
+            self.encoder = FrameEncoder(
+                list(self.lights), self.tolerance, self.keyframe_interval)
+            self.frame = numpy.zeros((len(self.lights), 3))
+            if self.smoothing is not None:
+                self.smoothing.reset(self.frame)
+        else:
+            # Same lights as before a reconnection: send them all again
+            self.encoder.reset()
+        return ''.join(lines).strip()
 
     def set_light(self, light, color):
-        """ Set the message to set the light to the passed color.
+        """ Set the light to the passed color in the next frame.
         color must be an (r,g,b) tuple with values between 0 and 1. """
-        self.message += 'set light {0} rgb {1[0]:.6f} {1[1]:.6f} {1[2]:.6f}\n'.format(
-            light.name,
-            color
-        )
+        self.frame[self.lights.index[light.name]] = color
+        self.frame_pending = True
 
+    def set_lights(self, colors):
+        """ Set the color of each light in the next frame.
+        colors must be a (len(lights), 3) array with values between 0 and 1, in the order
+        of self.lights. """
+        self.frame[:] = colors
+        self.frame_pending = True
 
     def set_all_lights(self, color):
-        """ Set the message to turn all lights to the asked color.
+        """ Set all lights to the asked color in the next frame.
         color must be an (r,g,b) tuple with values between 0.0 and 1.0. """
-        for light in self.lights.values():
-            self.set_light(light, color)
+        self.frame[:] = color
+        self.frame_pending = True
+
+    def set_image(self, image):
+        """ Set the message to turn each light to the mean color of its scanning area in
+        the image. """
+        if not self.lights:
+            return
+        if self.lights_layout is None:
+            self.lights_layout = MappingCache.layout_hash(self.lights)
+        sampler = self.mapping_cache.get(
+            self.lights, image.width, image.height, self.lights_layout)
+        self.set_lights(sampler.sample(image.pixels))
 
     def set_priority(self, priority):
         """ Set the message to define the priority of the client """
-        self.message += 'set priority {}\n'.format(priority)
+        self.message += b'set priority %d\n' % priority
+        self.priority = priority
 
     def send(self):
         """
-        Send the current message to the the server and reset it.
+        Send the current message and the pending frame to the the server, with a single
+        write, and reset them.
+        Only the lights whose color changed since they were last sent are part of the frame.
         """
-        if self.message != "":
-            self.socket.sendall(bytes(self.message, "utf8"))
-            self.message = ""
-
-
-    # Define a thread to handle effects
-
-    class EffectThread(threading.Thread):
-        """ An effect thread which sends data to the boblight server while the
-        boblight client wait for new commands. """
-
-        def __init__(self, client, effect, speed=1):
-            super(BoblightClient.EffectThread, self).__init__()
-            self.client = client
-            self.effect = effect
-            self.speed = speed/10.
-
-        def run(self):
-            self.client.effect_stop_event.clear()
-            while not self.client.effect_stop_event.wait(self.speed):
-                for light in self.client.lights.values():
-                    color = self.effect.get_color(light)
-                    self.client.set_light(light, color)
-                self.client.send()
-                self.effect.increment()
-
+        frame = self.frame_pending and len(self.encoder) > 0
+        if frame:
+            colors = self.frame if self.smoothing is None else self.smoothing.colors
+            if self.transform is not None:
+                colors = self.transform.apply(colors)
+            if self.led_stream is not None:
+                self.led_stream.publish(colors)
+            data = self.encoder.encode(colors, self.message)
+            self.frames_sent += 1
+        else:
+            data = self.message
+        self.frame_pending = False
+        # Reset before writing: if the connection is lost, the handshake of the new one sends
+        # its own commands, and the dropped ones must not be sent with them
+        self.message = bytearray()
+        if data:
+            start = time.monotonic()
+            if not self.connection.sendall(data):
+                # Dropped: the reconnection time is not a write latency
+                return
+            self.send_latency = time.monotonic() - start
+            self.send_latency_max = max(self.send_latency_max, self.send_latency)
+            self.send_latency_total += self.send_latency
+            self.sends += 1
+            self.bytes_sent += len(data)
+            if self.metrics is not None:
+                self._sent(data, frame)
+
+    def _sent(self, data, frame):
+        """ Record the write of data, holding a frame or not """
+        metrics = self.metrics
+        metrics.histogram('send_time').observe(self.send_latency)
+        metrics.counter('bytes').add(len(data))
+        if frame:
+            metrics.counter('frames').add()
+        if self.command_received is not None:
+            metrics.histogram('end_to_end_latency').observe(
+                time.monotonic() - self.command_received)
+            self.command_received = None
+
+    def stats(self):
+        """ Return a dict of statistics about this client and its connection """
+        return {
+            'address': '{}:{}'.format(*self.connection.server_address),
+            'connected': self.connection.connected,
+            'reconnects': self.connection.reconnects,
+            'rtt': self.connection.rtt,
+            'frames': self.frames_sent,
+            'bytes': self.bytes_sent,
+            'dropped': self.mailbox.dropped,
+            'send_latency': self.send_latency,
+            'send_latency_avg': self.send_latency_total / max(self.sends, 1),
+            'send_latency_max': self.send_latency_max,
+            'effect_frames': self.effect_scheduler.frames,
+            'effect_missed': self.effect_scheduler.missed,
+            'output_fps': self.effect_scheduler.actual_fps,
+        }
 
+    @property
+    def bytes_per_frame(self):
+        """ Mean number of bytes sent per frame """
+        return self.bytes_sent / max(self.frames_sent, 1)
@@ -0,0 +1,202 @@
+""" The BoblightConnection manages the socket connected to a boblight server.
+If the server is not reachable or if the connection is lost, it reconnects with an exponential
+backoff and runs a handshake callback to restore the client state (hello, lights, priority...).
+It also pings the server periodically to measure the round-trip time and to detect stalled
+links. A failed ping only closes the socket: the reconnection, and so the handshake, is left to
+the thread sending the data, which owns the client state.
+This module is thread-proof.
+"""
+
+import time
+import socket
+import logging
+import threading
+
+from .line_reader import LineReader
+
+class BoblightConnection(object):
+    """ A connection to a boblight server, reconnecting automatically """
+
+    def __init__(self, server_address, handshake=None, timeout=5.,
+                 min_backoff=.5, max_backoff=30., ping_interval=5., lost=None):
+        """
+        server_address: (host, port) of the boblight server
+        handshake: callable run after each (re)connection, with the connection locked. Any
+            socket.error raised by it triggers a new connection attempt.
+        timeout: timeout (in seconds) of the socket operations. A server which does not
+            answer within this delay is considered as lost.
+        min_backoff, max_backoff: bounds of the delay between two connection attempts
+        ping_interval: delay between two pings (0 to disable them)
+        lost: callable run by the pinging thread when a ping fails, without the connection
+            locked, so that the sending thread reconnects even if it has nothing to send
+        """
+        self.logger = logging.getLogger("BoblightConnection")
+        self.server_address = server_address
+        self.handshake = handshake
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.ping_interval = ping_interval
+        self.lost = lost
+
+        self.lock = threading.RLock() # Serialize the use of the socket
+        self.closed = threading.Event()
+        self.socket = None
+        self.reader = LineReader(self._recv) # Buffers the received data not read yet
+        self.connecting = False # True while the handshake is running
+
+        self.reconnects = 0 # Number of connections lost and restored
+        self.pings = 0 # Number of pings answered
+        self.rtt = None # Last measured round-trip time (in seconds)
+
+    @property
+    def connected(self):
+        """ Whether the connection is currently established """
+        return self.socket is not None
+
+    def open(self):
+        """ Try to open the socket once, raise socket.error on failure """
+        with self.lock:
+            self.socket = socket.create_connection(self.server_address, self.timeout)
+            self.reader.reset()
+            self.logger.info('Boblight connection accepted.')
+
+    def connect(self):
+        """
+        Open the socket (if needed) and run the handshake, retrying with an exponential
+        backoff until it succeeds.
+        Return False if the connection has been closed in the meantime.
+        """
+        backoff = self.min_backoff
+        with self.lock:
+            while not self.closed.is_set():
+                try:
+                    if self.socket is None:
+                        self.open()
+                    if self.handshake is not None:
+                        self.connecting = True
+                        self.handshake()
+                    return True
+                except socket.error as socket_error:
+                    self.logger.warning(
+                        "Unable to connect to boblight server '%s:%d' (%s), retrying in %.1fs",
+                        self.server_address[0], self.server_address[1],
+                        socket_error, backoff)
+                    self._close_socket()
+                finally:
+                    self.connecting = False
+                self.closed.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+        return False
+
+    def reconnect(self):
+        """ Drop the current socket and connect again """
+        with self.lock:
+            self._close_socket()
+            if self.connect():
+                self.reconnects += 1
+                self.logger.info('Boblight connection restored (%d reconnections)',
+                                 self.reconnects)
+
+    def sendall(self, data):
+        """
+        Send data to the server.
+        If the connection is lost, reconnect: the data is dropped and it is up to the
+        handshake to restore the state of the server.
+        Return True if the data was written, False if it was dropped.
+        """
+        with self.lock:
+            if self.closed.is_set():
+                return False
+            try:
+                if self.socket is None:
+                    raise socket.error('not connected')
+                self.socket.sendall(data)
+                return True
+            except socket.error as socket_error:
+                if self.connecting:
+                    raise
+                self.logger.error("Boblight connection lost: %s", socket_error)
+                self.reconnect()
+                return False
+
+    def readline(self):
+        """ Read a line sent by the server, raise socket.error on failure """
+        with self.lock:
+            line = self.reader.readline()
+            if not line.endswith(b'\n'):
+                raise socket.error('connection closed by the server')
+            return line
+
+    def readlines(self, count):
+        """ Read count lines sent by the server, raise socket.error on failure """
+        with self.lock:
+            lines = self.reader.readlines(count)
+            if len(lines) < count:
+                raise socket.error('connection closed by the server')
+            return lines
+
+    def recv(self, size):
+        """ Read at most size bytes, buffered data first """
+        with self.lock:
+            return self.reader.read(size)
+
+    def _recv(self, size):
+        """ Receive data from the socket, for the reader """
+        if self.socket is None:
+            raise socket.error('not connected')
+        return self.socket.recv(size)
+
+    def ping(self):
+        """
+        Send a ping command and wait for the answer to measure the round-trip time.
+        If the server does not answer, close the socket: the next sendall reconnects.
+        """
+        with self.lock:
+            if self.socket is None or self.closed.is_set():
+                return
+            try:
+                start = time.monotonic()
+                self.socket.sendall(b'ping\n')
+                reply = self.readline()
+                self.rtt = time.monotonic() - start
+                self.pings += 1
+                if not reply.startswith(b'ping'):
+                    self.logger.warning("Unexpected reply to ping: %s", reply)
+                return
+            except socket.error as socket_error:
+                self.logger.error("Boblight server does not answer to ping: %s", socket_error)
+                self._close_socket()
+        if self.lost is not None:
+            self.lost()
+
+    def ping_forever(self):
+        """ Ping the server every ping_interval seconds until the connection is closed. It can
+        be used as a target for a threading.Thread object """
+        if self.ping_interval <= 0:
+            return
+        while not self.closed.wait(self.ping_interval):
+            self.ping()
+
+    def abort(self):
+        """
+        Stop any reconnection attempt and any sending, without waiting for the thread using
+        the connection. close() must still be called to release the socket.
+        """
+        self.closed.set()
+
+    def close(self):
+        """ Close the connection, and stop any reconnection attempt """
+        self.closed.set()
+        with self.lock:
+            self._close_socket()
+
+    def _close_socket(self):
+        """ Close the socket if it is open """
+        if self.socket is not None:
+            try:
+                self.socket.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            self.socket.close()
+            self.socket = None
@@ -0,0 +1,90 @@
+""" BoblightFanout drives several boblight servers from the same priority list.
+Each server gets its own BoblightClient, running in its own thread with its own latest-wins
+mailbox, so that a slow or dead server never delays the others: it only misses frames.
+"""
+
+import logging
+import threading
+
+from .boblight_client import BoblightClient
+
+class BoblightFanout:
+    """
+    Run one BoblightClient per boblight server, and report their send latencies
+    """
+
+    def __init__(self, server_addresses, priority_list, report_interval=60., led_stream=None,
+                 **client_options):
+        """
+        server_addresses: list of (host, port) of the boblight servers
+        priority_list: shared PriorityList from which commands are fetched
+        report_interval: delay (in seconds) between two logs of the clients statistics
+            (0 to disable)
+        led_stream: LedStream to which the client of the first server publishes its colors
+        client_options: other arguments given to each BoblightClient
+        """
+        self.logger = logging.getLogger("BoblightFanout")
+        self.report_interval = report_interval
+        self.clients = [
+            BoblightClient(
+                server_address, priority_list,
+                led_stream=led_stream if index == 0 else None, **client_options)
+            for (index, server_address) in enumerate(server_addresses)
+        ]
+        metrics = client_options.get('metrics')
+        if metrics is not None:
+            metrics.gauge('dropped_frames', self.dropped_frames)
+            metrics.gauge('clients', self.stats)
+
+    def run(self):
+        """
+        Run the clients until they all quit. It can be used as a target for a
+        threading.Thread object
+        """
+        threads = [
+            threading.Thread(
+                target=client.run,
+                name="BoblightClient-{}:{}".format(*client.connection.server_address))
+            for client in self.clients
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(self.report_interval or None)
+                if thread.is_alive():
+                    self.report()
+        self.report()
+
+    def stats(self):
+        """ Return the statistics of each client """
+        return [client.stats() for client in self.clients]
+
+    def dropped_frames(self):
+        """ Return the number of commands and effect frames dropped by all the clients """
+        return sum(stats['dropped'] + stats['effect_missed'] for stats in self.stats())
+
+    def report(self):
+        """ Log the statistics of each client """
+        for stats in self.stats():
+            self.logger.info(
+                "%s: %s, %d frames, send latency %.2f/%.2f/%.2f ms (last/avg/max), "
+                "%d dropped, %d reconnections, %d effect frames (%d missed)",
+                stats['address'],
+                'connected' if stats['connected'] else 'disconnected',
+                stats['frames'],
+                stats['send_latency'] * 1e3,
+                stats['send_latency_avg'] * 1e3,
+                stats['send_latency_max'] * 1e3,
+                stats['dropped'],
+                stats['reconnects'],
+                stats['effect_frames'],
+                stats['effect_missed'])
+        effect_pool = self.clients[0].effect_pool if self.clients else None
+        if effect_pool is not None:
+            for (name, stats) in effect_pool.stats().items():
+                self.logger.info(
+                    "Effect %s: %d frames rendered in %.1f ms of CPU on average, %d missed",
+                    name, stats['frames'],
+                    stats['cpu_time'] / max(stats['frames'], 1) * 1e3,
+                    stats['missed'])
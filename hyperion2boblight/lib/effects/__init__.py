@@ -1,5 +1,19 @@
 """
 The effect package will contain and load effects that can be executed by the hyperion server.
+Effects are found by the EffectRegistry, and their modules are only imported when needed.
 """
 
-from .rainbow import RainbowEffect
+import importlib
+
+from .registry import EffectRegistry
+
+# Effect classes importable from this package, with their module
+_EFFECT_MODULES = {
+    'RainbowEffect': '.rainbow'
+}
+
+def __getattr__(name):
+    """ Import the effect classes on first access """
+    if name in _EFFECT_MODULES:
+        return getattr(importlib.import_module(_EFFECT_MODULES[name], __name__), name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -1,5 +1,7 @@
 """ Base class for any effect """
 
+import numpy
+
 class _Singleton(type):
     def __call__(cls, *args, **kwargs):
         try:
@@ -11,6 +13,8 @@ class _Singleton(type):
 class Effect(metaclass=_Singleton):
     """ Base class to inherit from for effects """
 
+    step_duration = 0.1 # Duration of a time step (in seconds)
+
     def __init__(self):
         self.time_step = 0
 
@@ -23,7 +27,36 @@ class Effect(metaclass=_Singleton):
         """
         raise NotImplementedError('get_color function must be overridden in subclasses')
 
+    def render(self, lights, elapsed):
+        """ Return the colors of all the lights at the time elapsed (in seconds) since the
+        effect started.
+
+        lights: The LightTable of the lights to render.
+        returns a (len(lights), 3) array of 0. to 1. values
+
+        Effects should override it to compute all the colors at once with NumPy, from the
+        arrays of the light table. By default, get_color is called for each light.
+        """
+        self.seek(elapsed)
+        colors = numpy.empty((len(lights), 3))
+        for index, light in enumerate(lights.values()):
+            colors[index] = self.get_color(light)
+        return colors
+
     def increment(self):
         """ Jump to next time step """
         self.time_step += 1
 
+    def reset(self):
+        """ Go back to the first time step """
+        self.time_step = 0
+
+    def seek(self, elapsed):
+        """ Jump to the time step matching the time elapsed (in seconds) since the effect
+        started. Subclasses can override it to compute their state directly from elapsed. """
+        time_step = int(elapsed / self.step_duration)
+        if time_step < self.time_step:
+            self.reset()
+        while self.time_step < time_step:
+            self.increment()
+
@@ -5,6 +5,8 @@ red, yellow, green, turquoise, blue, purple.
 
 import colorsys
 
+import numpy
+
 from .effect import Effect
 
 class RainbowEffect(Effect):
@@ -17,8 +19,21 @@ class RainbowEffect(Effect):
     def get_color(self, light=None):
         return tuple([round(x, 4) for x in colorsys.hsv_to_rgb(self.hue, 1.0, 1.0)])
 
+    def render(self, lights, elapsed):
+        # Every light has the same color: compute it once
+        self.seek(elapsed)
+        return numpy.broadcast_to(self.get_color(), (len(lights), 3))
+
     def increment(self):
         self.hue += self.hue_increment
         if self.hue > 1.0:
             self.hue -= 1.0
 
+    def reset(self):
+        super(RainbowEffect, self).reset()
+        self.hue = 0.0
+
+    def seek(self, elapsed):
+        self.time_step = int(elapsed / self.step_duration)
+        self.hue = (elapsed / self.step_duration * self.hue_increment) % 1.0
+
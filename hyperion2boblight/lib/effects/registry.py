@@ -0,0 +1,147 @@
+""" The effect registry knows the available effects without importing them.
+Effects are discovered from JSON descriptors in some directories (this package one first) and
+from the entry points of the installed packages. Only their metadata is read at startup: the
+module of an effect is imported the first time the effect is requested.
+A descriptor looks like:
+    {"name": "Rainbow", "script": "Rainbow.py", "args": {},
+     "module": ".rainbow", "class": "RainbowEffect"}
+where a relative module is relative to this package. An entry point of the
+'hyperion2boblight.effects' group is named after the effect and refers to its class.
+This module is thread-proof.
+"""
+
+import os
+import json
+import logging
+import threading
+import importlib
+from collections import OrderedDict
+
+try:
+    from importlib import metadata as importlib_metadata
+except ImportError: # Python < 3.8
+    importlib_metadata = None
+
+class EffectRegistry(object):
+    """ The effects available, by name """
+
+    ENTRY_POINT_GROUP = 'hyperion2boblight.effects'
+    DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+    def __init__(self, directories=(), entry_points=True):
+        """
+        directories: directories of JSON descriptors, in addition to this package one
+        entry_points: whether to discover the effects registered by installed packages
+        """
+        self.logger = logging.getLogger("EffectRegistry")
+        self.lock = threading.Lock()
+        self.version = 0 # Incremented each time the effects list changes
+        self.descriptors = OrderedDict() # Metadata of each effect, by name
+        self.scripts = {} # Effect names by script name
+        self.loaders = {} # Callable returning the class of each effect not loaded yet
+        self.classes = {} # Class of each loaded effect
+        self.info = [] # Effects list reported by serverinfo
+
+        for directory in (self.DIRECTORY,) + tuple(directories):
+            self.discover_directory(directory)
+        if entry_points:
+            self.discover_entry_points()
+
+    def discover_directory(self, directory):
+        """ Register the effects described by the JSON files of the directory """
+        try:
+            filenames = sorted(os.listdir(directory))
+        except OSError as error:
+            self.logger.warning("Unable to list effects in %s: %s", directory, error)
+            return
+        for filename in filenames:
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                with open(path, encoding='utf-8') as descriptor_file:
+                    descriptor = json.load(descriptor_file)
+                (module, class_name) = (descriptor.pop('module'), descriptor.pop('class'))
+            except (OSError, ValueError, KeyError) as error:
+                self.logger.warning("Invalid effect descriptor %s: %s", path, error)
+                continue
+            self.register(
+                descriptor,
+                lambda module=module, class_name=class_name: getattr(
+                    importlib.import_module(module, __package__), class_name))
+
+    def discover_entry_points(self):
+        """ Register the effects of the installed packages entry points """
+        if importlib_metadata is None:
+            return
+        entry_points = importlib_metadata.entry_points()
+        if hasattr(entry_points, 'select'):
+            entry_points = entry_points.select(group=self.ENTRY_POINT_GROUP)
+        else: # Python < 3.10
+            entry_points = entry_points.get(self.ENTRY_POINT_GROUP, [])
+        for entry_point in entry_points:
+            self.register(
+                {'name': entry_point.name, 'script': entry_point.name + '.py', 'args': {}},
+                entry_point.load)
+
+    def register(self, descriptor, loader):
+        """
+        Register an effect.
+        descriptor: dict with the name, script and args of the effect
+        loader: callable returning the Effect subclass, called on first use
+        """
+        name = descriptor['name']
+        descriptor = {
+            'name': name,
+            'script': descriptor.get('script', name + '.py'),
+            'args': descriptor.get('args', {})
+        }
+        with self.lock:
+            if name in self.descriptors:
+                self.logger.warning("Effect %s registered twice, keeping the first one", name)
+                return
+            self.descriptors[name] = descriptor
+            self.scripts.setdefault(descriptor['script'], name)
+            self.loaders[name] = loader
+            # Replaced, not modified, so that a published list never changes
+            self.info = self.info + [descriptor]
+            self.version += 1
+
+    def names(self):
+        """ Return the names of the effects """
+        with self.lock:
+            return list(self.descriptors)
+
+    def __contains__(self, name):
+        return name in self.descriptors or name in self.scripts
+
+    def get(self, name):
+        """
+        Return the instance of the effect, given its name or its script name. The module of
+        the effect is imported on first use.
+        Raise a KeyError if the effect is unknown.
+        """
+        return self._effect_class(name)()
+
+    def create(self, name):
+        """
+        Return a new instance of the effect, given its name or its script name, instead of
+        the instance shared by all the callers of get: effects keep their animation state,
+        so each thread rendering them needs its own instance.
+        Raise a KeyError if the effect is unknown.
+        """
+        # Effects are singletons: bypass their metaclass
+        return type.__call__(self._effect_class(name))
+
+    def _effect_class(self, name):
+        """ Return the class of the effect, imported on first use """
+        with self.lock:
+            if name not in self.descriptors:
+                name = self.scripts.get(name, name)
+            try:
+                effect_class = self.classes[name]
+            except KeyError:
+                loader = self.loaders[name]
+                self.logger.debug("Loading effect %s", name)
+                effect_class = self.classes[name] = loader()
+        return effect_class
@@ -0,0 +1,140 @@
+""" The effect scheduler renders the displayed effect at a fixed rate.
+A single thread renders the frames on a monotonic clock. Effects are computed as a function
+of the time elapsed since they started, so when a frame deadline is missed the late frames are
+skipped (and counted) without slowing the animation down.
+The same loop renders the transitions of the smoothing stage, which only need frames until they
+settle.
+"""
+
+import time
+import logging
+import threading
+
+class EffectScheduler(object):
+    """
+    Render the displayed effect at a fixed rate.
+
+    There is exactly one effect per priority: starting an effect at a priority replaces the
+    previous one. Only the displayed one is rendered.
+    """
+
+    def __init__(self, render, fps=10.):
+        """
+        render: callable(priority, effect, elapsed) rendering and sending a frame of the
+            effect, elapsed being the time (in seconds) since the effect started. When no effect
+            is displayed but an animation is requested, it is called with None as priority and
+            effect, and it must return True while more frames are needed.
+        fps: number of frames per second
+        """
+        self.logger = logging.getLogger("EffectScheduler")
+        self.render = render
+        self.period = 1. / fps
+        self.condition = threading.Condition()
+        self.effects = {} # (effect, start time) for each priority
+        self.displayed = None # Priority of the displayed effect
+        self.animations = 0 # Number of animations requested
+        self.animated = 0 # Value of animations when the last animation settled
+        self.closed = False
+
+        self.frames = 0 # Number of rendered frames
+        self.missed = 0 # Number of frames skipped because their deadline was missed
+        self.actual_fps = 0. # Frames rendered per second, over the last second
+
+    def show(self, priority, effect=None):
+        """
+        Display the effect at the given priority.
+        If effect is None, stop displaying effects and forget the effect of this priority.
+        An effect already running at this priority keeps its start time.
+        """
+        with self.condition:
+            if effect is None:
+                self.effects.pop(priority, None)
+                self.displayed = None
+            else:
+                if self.effects.get(priority, (None,))[0] is not effect:
+                    self.effects[priority] = (effect, time.monotonic())
+                self.displayed = priority
+            self.condition.notify()
+
+    def animate(self):
+        """ Render frames, even if no effect is displayed, until render returns False """
+        with self.condition:
+            self.animations += 1
+            self.condition.notify()
+
+    def hide(self):
+        """ Stop displaying effects and forget all of them """
+        with self.condition:
+            self.effects.clear()
+            self.displayed = None
+            self.condition.notify()
+
+    def is_displayed(self, priority, effect):
+        """ Check that the effect is the one displayed """
+        with self.condition:
+            return (self.displayed == priority and
+                    self.effects.get(priority, (None,))[0] is effect)
+
+    def run(self):
+        """
+        Render frames until close() is called. It can be used as a target for a
+        threading.Thread object
+        """
+        next_frame = None
+        rendered = None # Last rendered (priority, effect)
+        window_start = time.monotonic()
+        window_frames = 0
+        with self.condition:
+            while not self.closed:
+                now = time.monotonic()
+                if self.displayed is not None:
+                    (priority, (effect, start)) = (self.displayed, self.effects[self.displayed])
+                elif self.animations != self.animated:
+                    (priority, effect, start) = (None, None, now)
+                else:
+                    next_frame = None
+                    self.condition.wait()
+                    continue
+                if next_frame is None:
+                    # Idle time does not count in the actual rate
+                    window_start = now
+                    window_frames = 0
+                if next_frame is None or rendered != (priority, effect):
+                    # Render a new effect immediately
+                    next_frame = now
+                    rendered = (priority, effect)
+                if now < next_frame:
+                    # Woken up earlier if the displayed effect changes
+                    self.condition.wait(next_frame - now)
+                    continue
+                late = int((now - next_frame) / self.period)
+                if late:
+                    self.missed += late
+                    next_frame += late * self.period
+                next_frame += self.period
+
+                animations = self.animations
+                self.condition.release()
+                try:
+                    animating = self.render(priority, effect, now - start)
+                except Exception: # pylint: disable=broad-except
+                    # A failing frame must not stop the effects and the transitions
+                    self.logger.exception("Unable to render a frame of %s", effect)
+                    animating = False
+                finally:
+                    self.condition.acquire()
+                if not animating and animations == self.animations:
+                    # No animation requested while rendering
+                    self.animated = animations
+                self.frames += 1
+                window_frames += 1
+                if now - window_start >= 1.:
+                    self.actual_fps = window_frames / (now - window_start)
+                    window_start = now
+                    window_frames = 0
+
+    def close(self):
+        """ Stop the run() loop """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
@@ -0,0 +1,213 @@
+""" The effect worker pool runs the effects in other processes.
+A CPU-heavy effect then never holds the GIL of the process handling the commands and sending
+the frames. Each client effect owns a shared memory block holding the bounds of the lights
+and the rendered frame, so that only the effect name and the time are sent to the workers.
+Frames are asked without waiting for them: each call returns the previous frame, so that the
+client never waits for the workers. Rendering a frame must end within a deadline: a late frame
+is skipped, and no new frame is asked to the effect until the previous one is over, so a slow
+effect only lowers its own frame rate.
+The CPU time used by each effect is accounted.
+"""
+
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+try:
+    from multiprocessing import shared_memory
+except ImportError: # Python < 3.8
+    shared_memory = None
+
+from .registry import EffectRegistry
+from ..light_table import LightTable
+from ..mapping_cache import MappingCache
+
+# Worker processes state
+_REGISTRY = None # EffectRegistry of the worker
+_BLOCKS = {} # Shared memory blocks attached by the worker, by name
+_TABLES = {} # LightTable of the layouts already seen by the worker
+_CACHE_SIZE = 16 # Number of blocks and tables kept by each worker
+
+def _initialize_worker(directories):
+    """ Create the effect registry of a worker process """
+    global _REGISTRY
+    _REGISTRY = EffectRegistry(directories)
+
+def _remember(cache, key, value):
+    """ Store a value in a worker cache, evicting the oldest entry if it is full """
+    if len(cache) >= _CACHE_SIZE:
+        oldest = next(iter(cache))
+        evicted = cache.pop(oldest)
+        if hasattr(evicted, 'close'):
+            evicted.close()
+    cache[key] = value
+
+def _render(name, block_name, count, layout, elapsed, names=None):
+    """
+    Render a frame of the effect in a worker process, into the shared memory block.
+    The light names are only sent when the layout is unknown by the worker: None is returned
+    then, and the frame must be asked again with the names.
+    Return the CPU time spent (in seconds).
+    """
+    block = _BLOCKS.get(block_name)
+    if block is None:
+        # Spawned workers share the resource tracker of the client process, which removes
+        # the block
+        block = shared_memory.SharedMemory(block_name)
+        _remember(_BLOCKS, block_name, block)
+    table = _TABLES.get(layout)
+    if table is None:
+        if names is None:
+            return None
+        bounds = numpy.ndarray((count, 4), numpy.float64, block.buf)
+        table = LightTable(names, bounds.copy())
+        _remember(_TABLES, layout, table)
+
+    start = time.process_time()
+    frame = numpy.ndarray((count, 3), numpy.float64, block.buf, offset=count * 4 * 8)
+    frame[:] = _REGISTRY.get(name).render(table, elapsed)
+    return time.process_time() - start
+
+def _set_finish_time(future):
+    """ Done callback recording when a frame was rendered """
+    future.finished = time.monotonic()
+
+class EffectWorkerPool(object):
+    """ A pool of processes rendering effects """
+
+    def __init__(self, processes=2, deadline=.1, directories=()):
+        """
+        processes: number of worker processes
+        deadline: maximal duration (in seconds) of the rendering of a frame
+        directories: directories of effect descriptors, as given to the EffectRegistry
+        """
+        if shared_memory is None:
+            raise RuntimeError("Effect worker processes require Python 3.8 or newer")
+        self.logger = logging.getLogger("EffectWorkerPool")
+        self.deadline = deadline
+        # Workers are spawned, since forking a process running threads is unsafe
+        self.executor = ProcessPoolExecutor(
+            processes, multiprocessing.get_context('spawn'),
+            initializer=_initialize_worker, initargs=(tuple(directories),))
+        # Start the workers now rather than on the first frames
+        for _ in range(processes):
+            self.executor.submit(time.sleep, 0)
+        self.lock = threading.Lock()
+        self.effects = {} # Statistics of each effect
+
+    def effect(self, name):
+        """ Return a new effect rendered by the pool, with its own shared memory """
+        return PooledEffect(self, name)
+
+    def account(self, name, cpu_time=0., frames=0, missed=0):
+        """ Add to the statistics of an effect """
+        with self.lock:
+            stats = self.effects.setdefault(
+                name, {'frames': 0, 'missed': 0, 'cpu_time': 0.})
+            stats['frames'] += frames
+            stats['missed'] += missed
+            stats['cpu_time'] += cpu_time
+
+    def stats(self):
+        """ Return the frames rendered and missed and the CPU time used by each effect """
+        with self.lock:
+            return {name: dict(stats) for (name, stats) in self.effects.items()}
+
+    def close(self):
+        """ Stop the workers """
+        self.executor.shutdown(wait=True)
+
+class PooledEffect(object):
+    """
+    An effect rendered by an EffectWorkerPool, for the lights of a client.
+    It has the render() method of the Effect objects, except that it returns the previous frame,
+    and None when it is skipped.
+    """
+
+    def __init__(self, pool, name):
+        self.pool = pool
+        self.name = name
+        self.block = None # Shared memory block: bounds then frame of the lights
+        self.lights = None # LightTable whose bounds are in the block
+        self.layout = None
+        self.known = False # Whether the workers are known to have seen the layout
+        self.pending = None # Future of the frame being rendered
+
+    def render(self, lights, elapsed):
+        """
+        Ask a frame to the pool, and return the (len(lights), 3) colors of the previous one,
+        or None if it is skipped: it missed its deadline, it is not over (no frame is asked
+        then), or it was rendered for other lights.
+        """
+        colors = None
+        if self.pending is not None:
+            if not self.pending.done():
+                self.pool.account(self.name, missed=1)
+                return None
+            colors = self._finished()
+        if lights is not self.lights:
+            self._set_lights(lights)
+            colors = None
+        # The light names are only sent while the workers may not know the layout
+        future = self.pool.executor.submit(
+            _render, self.name, self.block.name, len(lights), self.layout, elapsed,
+            None if self.known else lights.names)
+        future.submitted = time.monotonic()
+        future.add_done_callback(_set_finish_time)
+        self.pending = future
+        return colors
+
+    def _finished(self):
+        """ Account the frame rendered by a worker, and return a copy of it if in time """
+        (future, self.pending) = (self.pending, None)
+        try:
+            cpu_time = future.result()
+        except Exception as error: # pylint: disable=broad-except
+            # The frame is lost, but the output goes on
+            self.pool.logger.error("Effect %s failed: %r", self.name, error)
+            self.pool.account(self.name, missed=1)
+            return None
+        if cpu_time is None:
+            # This worker did not know the layout: the next frame is asked with the names
+            self.known = False
+            self.pool.account(self.name, missed=1)
+            return None
+        self.known = True
+        # The done callback may not have run yet
+        finished = getattr(future, 'finished', time.monotonic())
+        if finished - future.submitted > self.pool.deadline:
+            self.pool.account(self.name, cpu_time, missed=1)
+            return None
+        self.pool.account(self.name, cpu_time, frames=1)
+        count = len(self.lights)
+        # Copied, since the next frame is rendered in the block
+        return numpy.ndarray(
+            (count, 3), numpy.float64, self.block.buf, offset=count * 4 * 8).copy()
+
+    def _set_lights(self, lights):
+        """ Copy the bounds of the lights in a shared memory block large enough """
+        size = max(len(lights) * 7 * 8, 1)
+        if self.block is None or self.block.size < size:
+            self.close()
+            self.block = shared_memory.SharedMemory(create=True, size=size)
+        bounds = numpy.ndarray((len(lights), 4), numpy.float64, self.block.buf)
+        bounds[:] = lights.bounds
+        self.lights = lights
+        # Blocks are reused for new layouts: the workers know them by the layout hash
+        self.layout = (self.block.name, MappingCache.layout_hash(lights))
+        self.known = False
+
+    def close(self):
+        """ Release the shared memory block """
+        if self.block is not None:
+            if self.pending is not None:
+                # A worker may still be writing in the block
+                self._finished()
+            self.block.close()
+            self.block.unlink()
+            self.block = None
+            self.lights = None
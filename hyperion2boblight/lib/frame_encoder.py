@@ -0,0 +1,125 @@
+""" The frame encoder turns an array of lights colors into the boblight 'set light' commands.
+The lines of every light are pre-encoded once in a bytes template, where only the digits of
+the colors are rewritten for each frame. The colors are converted to ASCII digits with NumPy
+for all the lights at once, and frames are written in reusable buffers, so that no string is
+formatted nor allocated per light.
+Only the lights whose color changed since they were last sent are encoded, except on
+keyframes which contain all the lights.
+"""
+
+import numpy
+
+# Each color component is written as 'd.dddddd', like the '{:.6f}' format would do
+COMPONENT_SIZE = 8
+# 'r.rrrrrr g.gggggg b.bbbbbb\n'
+COLOR_SIZE = 3 * (COMPONENT_SIZE + 1)
+# Offsets of the 7 digits in a component
+DIGIT_OFFSETS = numpy.array([0, 2, 3, 4, 5, 6, 7])
+# Divisors giving each digit of a component value scaled by 10^6
+DIGIT_DIVISORS = 10 ** numpy.arange(6, -1, -1, dtype=numpy.int64)
+
+class FrameEncoder:
+    """
+    Encode frames of colors of a fixed set of lights into boblight commands.
+    """
+
+    def __init__(self, names, tolerance=0., keyframe_interval=100):
+        """
+        names: names of the lights, in the order of the colors arrays
+        tolerance: a light is encoded only if one of its components changed by more than
+            tolerance (0. to 1.) since it was last encoded
+        keyframe_interval: every keyframe_interval frames, all the lights are encoded whether
+            they changed or not (0 to disable)
+        """
+        self.tolerance = tolerance
+        self.keyframe_interval = keyframe_interval
+
+        prefixes = [bytes('set light {} rgb '.format(name), 'utf-8') for name in names]
+        template = bytearray(b''.join(
+            prefix + b'0.000000 0.000000 0.000000\n' for prefix in prefixes))
+        self.line_lengths = numpy.array(
+            [len(prefix) + COLOR_SIZE for prefix in prefixes], dtype=numpy.intp)
+        self.line_starts = numpy.cumsum(self.line_lengths) - self.line_lengths
+        # Positions of the digits of each component of each light in the template
+        color_starts = self.line_starts + self.line_lengths - COLOR_SIZE
+        self.digit_positions = (
+            color_starts[:, numpy.newaxis, numpy.newaxis] +
+            (numpy.arange(3) * (COMPONENT_SIZE + 1))[numpy.newaxis, :, numpy.newaxis] +
+            DIGIT_OFFSETS[numpy.newaxis, numpy.newaxis, :])
+
+        self.template = template
+        self.template_array = numpy.frombuffer(self.template, dtype=numpy.uint8)
+        self.buffer = bytearray(len(template))
+        self.buffer_array = numpy.frombuffer(self.buffer, dtype=numpy.uint8)
+
+        self.sent = numpy.full((len(prefixes), 3), numpy.nan)
+        self.keyframe = True # Encode all the lights in the next frame
+        self.frames = 0 # Number of frames encoded
+        self.lights_sent = 0 # Number of light updates encoded
+        self.lights_skipped = 0 # Number of light updates skipped because unchanged
+
+    def __len__(self):
+        return len(self.line_lengths)
+
+    def reset(self):
+        """ Forget the colors already sent: the next frame will be a keyframe """
+        self.sent.fill(numpy.nan)
+        self.keyframe = True
+
+    def encode(self, colors, header=b''):
+        """
+        Encode a frame.
+
+        colors: (len(lights), 3) array of 0. to 1. (r, g, b) values
+        header: commands to write before the lights (e.g. 'set priority')
+        returns a memoryview on the encoded commands. It is only valid until the next call.
+        """
+        colors = numpy.asarray(colors, dtype=numpy.float64)
+        if self.keyframe:
+            changed = numpy.ones(len(self), dtype=bool)
+        else:
+            changed = ~(numpy.abs(colors - self.sent) <= self.tolerance).all(axis=1)
+        count = int(numpy.count_nonzero(changed))
+        self.lights_sent += count
+        self.lights_skipped += len(self) - count
+        self.frames += 1
+        self.keyframe = (
+            self.keyframe_interval > 0 and self.frames % self.keyframe_interval == 0)
+
+        if count:
+            self.sent[changed] = colors[changed]
+            self._write_digits(colors[changed], self.digit_positions[changed])
+        return self._gather(changed, count, header)
+
+    def _write_digits(self, colors, positions):
+        """ Write the ASCII digits of the colors at their positions in the template """
+        values = numpy.rint(numpy.clip(colors, 0., 1.) * 1e6).astype(numpy.int64)
+        digits = (values[..., numpy.newaxis] // DIGIT_DIVISORS) % 10
+        self.template_array[positions] = digits + ord('0')
+
+    def _gather(self, changed, count, header):
+        """ Copy the header and the lines of the changed lights in the output buffer """
+        header_size = len(header)
+        if count == len(self):
+            size = header_size + len(self.template)
+            self._reserve(size)
+            self.buffer_array[header_size:size] = self.template_array
+        else:
+            starts = self.line_starts[changed]
+            lengths = self.line_lengths[changed]
+            lines_size = int(lengths.sum())
+            size = header_size + lines_size
+            self._reserve(size)
+            # Index of every byte of the changed lines in the template
+            indices = (
+                numpy.repeat(starts - (numpy.cumsum(lengths) - lengths), lengths) +
+                numpy.arange(lines_size))
+            numpy.take(self.template_array, indices, out=self.buffer_array[header_size:size])
+        self.buffer[:header_size] = header
+        return memoryview(self.buffer)[:size]
+
+    def _reserve(self, size):
+        """ Grow the output buffer if needed """
+        if len(self.buffer) < size:
+            self.buffer = bytearray(size)
+            self.buffer_array = numpy.frombuffer(self.buffer, dtype=numpy.uint8)
@@ -2,10 +2,19 @@
 Threaded TCP Server to handle Hyperion clients connections
 """
 
-import json
+import time
+import socket
 import logging
+import threading
 from socketserver import ThreadingTCPServer, StreamRequestHandler
 
+from . import json_codec
+from .image import HyperionImage
+from .led_stream import LedStream
+from .line_reader import LineReader
+from .transform import ColorTransform
+from .effects.registry import EffectRegistry
+
 class HyperionServer(ThreadingTCPServer):
     """ Threaded TCP Server waiting for hyperion client connections.
 
@@ -13,48 +22,112 @@ class HyperionServer(ThreadingTCPServer):
     process it.
     """
 
-    def __init__(self, server_address, priority_list):
+    def __init__(self, server_address, priority_list, transform=None, effects=None,
+                 codec=None, led_stream=None, metrics=None):
         """
         server_address: (host, port) on which to bind the server
         priority_list: shared PriorityList which will contain commands
+        transform: shared ColorTransform changed by the transform command (a new one is
+            created if None)
+        effects: EffectRegistry of the effects reported by the serverinfo command (a new one
+            is created if None)
+        codec: JSON codec of the commands and replies (the fastest available if None)
+        led_stream: LedStream of the colors sent to the lights, streamed to the clients
+            sending the ledcolors command (a new one is created if None)
+        metrics: Metrics recording the commands handling, and reported by the metrics command
+            (None to disable them)
         """
         self.allow_reuse_address = True
         super(HyperionServer, self).__init__(server_address, HyperionRequestHandler)
         self.priority_list = priority_list
+        self.transform = transform if transform is not None else ColorTransform()
+        self.effects = effects if effects is not None else EffectRegistry()
+        self.codec = codec if codec is not None else json_codec.get_codec()
+        self.led_stream = led_stream if led_stream is not None else LedStream(codec=self.codec)
+        self.metrics = metrics
+        self.server_info = None # (versions, encoded reply) of the last serverinfo command
 
-class HyperionRequestHandler(StreamRequestHandler):
+class HyperionCommandMixin:
     """
-    The class which will be instantiated for any new connection on the server to process the
-    request.
+    Implementation of the Hyperion JSON commands.
+
+    It is shared by the threaded request handler and the asyncio protocol. Classes using it must
+    define the server, hyperion_priority_list, hyperion_transform, hyperion_effects, codec and
+    logger attributes, the server having a server_info attribute (initially None), and
+    led_stream and metrics attributes. They must also implement start_led_stream() and
+    stop_led_stream().
     """
 
-    def setup(self):
-        super(HyperionRequestHandler, self).setup()
-        self.hyperion_priority_list = self.server.priority_list
-        self.logger = logging.getLogger("HyperionRequestHandler")
+    received = None # Time when the commands being handled were received, if measured
+    handled = 0 # Number of commands handled by this connection, if measured
 
-    def handle(self):
-        # Read data until the connection is closed
-        while True:
-            # Read a full line of data
-            # TODO: check that this is a good way to separate commands
-            data = str(self.rfile.readline(), 'utf-8').strip()
-            if data:
-                # Parse and handle command
-                self.rqst = json.loads(data)
-                command = self.rqst['command']
-                rply = None
-                try:
-                    # Call the right command handler
-                    rply = self.handlers[command](self)
-                except IndexError:
-                    self.logger.warning('Command not recognized : %s', command)
-                    rply = self.handlers['error'](self)
-                self.wfile.write(
-                    bytes(json.dumps(rply) + '\n', 'utf-8'))
-            else:
-                # If there is no more data (connection closed), quit this handler
-                break
+    def process_commands(self, lines):
+        """
+        Handle the lines received together (bytes) as one transaction of the priority list,
+        so that they are published at once, and return their joined replies.
+        """
+        metrics = self.server.metrics
+        if metrics is None:
+            with self.hyperion_priority_list.transaction():
+                return b''.join([self.process_command(line) for line in lines])
+
+        self.received = time.monotonic()
+        handled = self.handled
+        with self.hyperion_priority_list.transaction():
+            replies = b''.join([self.process_command(line) for line in lines])
+        metrics.histogram('command_time').observe(time.monotonic() - self.received)
+        metrics.counter('commands').add(self.handled - handled)
+        return replies
+
+    def process_command(self, data):
+        """
+        Parse a line of JSON data (bytes), call the right command handler and return the
+        encoded reply.
+        The line may hold an array of commands, handled as one transaction of the priority
+        list and answered with the array of their replies. An invalid command is answered
+        with an error in its slot, the other ones being handled anyway.
+        """
+        try:
+            rqst = self.codec.loads(data)
+        except ValueError as error:
+            self.logger.warning('Invalid JSON: %s', error)
+            return self._encode({'success':False, 'error':'Invalid JSON: {}'.format(error)})
+        if isinstance(rqst, list):
+            with self.hyperion_priority_list.transaction():
+                replies = [self._encode(self.handle_command(command)) for command in rqst]
+            return b'[' + b','.join(reply.rstrip(b'\n') for reply in replies) + b']\n'
+        return self._encode(self.handle_command(rqst))
+
+    def handle_command(self, rqst):
+        """
+        Call the right command handler, and return its reply.
+        Handlers return a dict to encode, or an already encoded reply. A command with missing
+        or invalid arguments is answered with an error, so that the connection and the other
+        commands received with it are not lost.
+        """
+        self.rqst = rqst
+        command = rqst.get('command') if isinstance(rqst, dict) else None
+        if self.received is not None:
+            self.handled += 1
+        try:
+            handler = self.handlers[command]
+        except KeyError:
+            self.logger.warning('Command not recognized : %s', command)
+            handler = self.handlers['error']
+        try:
+            return handler(self)
+        except KeyError as error:
+            self.logger.warning('Missing argument in %s command: %s', command, error)
+            return {'success':False, 'error':'Missing argument: {}'.format(error.args[0])}
+        except (TypeError, ValueError) as error:
+            self.logger.warning('Invalid %s command: %s', command, error)
+            return {'success':False, 'error':str(error)}
+
+    def _encode(self, rply):
+        """ Return the encoded reply """
+        if isinstance(rply, bytes):
+            return rply
+        return self.codec.dumps(rply)
 
     def _quit(self):
         """
@@ -64,45 +137,45 @@ class HyperionRequestHandler(StreamRequestHandler):
         """
         self.server.shutdown()
         self.hyperion_priority_list.put(0, 'quit')
-        return {'success': True}
+        return json_codec.SUCCESS
 
     def _server_info(self):
         """
         Return Hyperion server informations
 
         Currently returned info are:
-          * effects list (hard coded)
+          * effects list, as discovered by the effect registry
           * list of priorities
-          * transformation values (hard coded)
+          * transformation values
 
-        TODO:
-          * Improve server to handle effect discovery
-          * Improve server to actually use transformation
+        The encoded reply is shared by all the connections of the server, and only rebuilt
+        when the priorities, the effect registry or the transform changed: the data of the
+        items, which change on every frame while streaming, are not part of the reply.
         """
         self.logger.debug('serverinfo')
+        # Versions are read before the data, so that a reply built while they change is
+        # rebuilt on the next call
+        versions = (
+            self.hyperion_priority_list.priorities_version,
+            self.hyperion_effects.version,
+            self.hyperion_transform.version
+        )
+        cached = self.server.server_info
+        if cached is not None and cached[0] == versions:
+            return cached[1]
         rply = {
             'success':True,
             'info':{
-                'effects':[{
-                    'name':'Rainbow',
-                    'script':'Rainbow.py',
-                    'args':{}
-                }],
+                'effects':self.hyperion_effects.info,
                 'priorities':[],
-                'transform':{
-                    'id':'default',
-                    'valueGain':1.0,
-                    'saturationGain':1.0,
-                    'gamma':[1.0, 1.0, 1.0],
-                    'threshold':[0.0, 0.0, 0.0],
-                    'whitelevel':[1.0, 1.0, 1.0],
-                    'blacklevel':[0.0, 0.0, 0.0]
-                }
+                'transform':self.hyperion_transform.to_dict()
             }
         }
         priorities = self.hyperion_priority_list.get_priorities()
         for priority in priorities:
             rply['info']['priorities'].append({'priority':priority})
+        rply = self.codec.dumps(rply)
+        self.server.server_info = (versions, rply)
         return rply
 
     def _color(self):
@@ -116,9 +189,40 @@ class HyperionRequestHandler(StreamRequestHandler):
         )
         self.hyperion_priority_list.put(
             int(self.rqst['priority']),
-            self.rqst['color']
+            self.rqst['color'],
+            self._duration(),
+            self.received
+        )
+        return json_codec.SUCCESS
+
+    def _image(self):
+        """
+        Add an image to the priority list.
+        The image is decoded here, the lights colors are computed by the Boblight client which
+        knows the scanning areas.
+        """
+        self.logger.debug(
+            'image[%s]=%sx%s',
+            self.rqst['priority'],
+            self.rqst['imagewidth'],
+            self.rqst['imageheight']
+        )
+        try:
+            image = HyperionImage.from_base64(
+                self.rqst['imagedata'],
+                int(self.rqst['imagewidth']),
+                int(self.rqst['imageheight'])
+            )
+        except ValueError as error:
+            self.logger.warning('Invalid image: %s', error)
+            return {'success':False, 'error':str(error)}
+        self.hyperion_priority_list.put(
+            int(self.rqst['priority']),
+            image,
+            self._duration(),
+            self.received
         )
-        return {'success':True}
+        return json_codec.SUCCESS
 
     def _effect(self):
         """
@@ -134,9 +238,23 @@ class HyperionRequestHandler(StreamRequestHandler):
         )
         self.hyperion_priority_list.put(
             int(self.rqst['priority']),
-            self.rqst['effect']['name']
+            self.rqst['effect']['name'],
+            self._duration(),
+            self.received
         )
-        return {'success':True}
+        return json_codec.SUCCESS
+
+    def _transform(self):
+        """
+        Change the color transform applied to the lights.
+        """
+        self.logger.debug('transform=%s', self.rqst['transform'])
+        try:
+            self.hyperion_transform.update(self.rqst['transform'])
+        except (AttributeError, TypeError, ValueError) as error:
+            self.logger.warning('Invalid transform: %s', error)
+            return {'success':False, 'error':str(error)}
+        return json_codec.SUCCESS
 
     def _clear(self):
         """
@@ -147,7 +265,7 @@ class HyperionRequestHandler(StreamRequestHandler):
             self.rqst['priority']
         )
         self.hyperion_priority_list.remove(int(self.rqst['priority']))
-        return {'success':True}
+        return json_codec.SUCCESS
 
     def _clearall(self):
         """
@@ -155,19 +273,131 @@ class HyperionRequestHandler(StreamRequestHandler):
         """
         self.logger.debug('clearall')
         self.hyperion_priority_list.clear()
-        return {'success':True}
+        return json_codec.SUCCESS
+
+    def _ledcolors(self):
+        """
+        Start or stop streaming the colors sent to the lights to this client.
+        """
+        subcommand = self.rqst.get('subcommand')
+        self.logger.debug('ledcolors %s', subcommand)
+        if subcommand == 'ledstream-start':
+            self.start_led_stream()
+        elif subcommand == 'ledstream-stop':
+            self.stop_led_stream()
+        else:
+            return {'success':False, 'error':'Unsupported subcommand: {}'.format(subcommand)}
+        return json_codec.SUCCESS
+
+    def _metrics(self):
+        """
+        Return the metrics of the commands handling and of the boblight clients.
+        """
+        metrics = self.server.metrics
+        if metrics is None:
+            return {'success':False, 'error':'Metrics are disabled'}
+        return {'success':True, 'info':metrics.to_dict()}
+
+    def _duration(self):
+        """
+        Return the duration (in seconds) of the command, None if it must last forever.
+        Hyperion clients give it in milliseconds, a missing or non positive value meaning
+        forever.
+        """
+        duration = self.rqst.get('duration')
+        if duration is None or int(duration) <= 0:
+            return None
+        return int(duration) / 1000.
 
     def _error(self):
         """ Just return the classic error message to the client. """
-        return {'success': False}
+        return json_codec.FAILURE
 
     handlers = {
         'quit': _quit,
         'serverinfo': _server_info,
         'color': _color,
+        'image': _image,
         'effect': _effect,
+        'transform': _transform,
         'clear': _clear,
         'clearall': _clearall,
+        'ledcolors': _ledcolors,
+        'metrics': _metrics,
         'error': _error
     }
 
+class HyperionRequestHandler(HyperionCommandMixin, StreamRequestHandler):
+    """
+    The class which will be instantiated for any new connection on the server to process the
+    request.
+    """
+
+    def setup(self):
+        super(HyperionRequestHandler, self).setup()
+        self.hyperion_priority_list = self.server.priority_list
+        self.hyperion_transform = self.server.transform
+        self.hyperion_effects = self.server.effects
+        self.codec = self.server.codec
+        self.logger = logging.getLogger("HyperionRequestHandler")
+        self.write_lock = threading.Lock() # Serialize the replies and the streamed frames
+        self.led_frames = None # Mailbox of the streamed frames
+
+    def handle(self):
+        # Commands are separated by new lines. They are parsed from the received bytes, and
+        # the commands received together are handled as one batch, their replies being sent
+        # together.
+        reader = LineReader(self.request.recv)
+        # Read data until the connection is closed
+        while True:
+            line = reader.readline()
+            if not line:
+                # If there is no more data (connection closed), quit this handler
+                break
+            lines = []
+            while line is not None:
+                if not line.isspace():
+                    lines.append(line)
+                line = reader.next_line()
+            if lines:
+                # Parse and handle commands, the replies are written before any frame
+                # streamed because of them
+                with self.write_lock:
+                    self.wfile.write(self.process_commands(lines))
+
+    def finish(self):
+        self.stop_led_stream()
+        super(HyperionRequestHandler, self).finish()
+
+    def start_led_stream(self):
+        """ Stream the colors sent to the lights, from another thread """
+        if self.led_frames is not None:
+            return
+        self.led_frames = self.server.led_stream.subscribe()
+        threading.Thread(
+            target=self._write_led_frames, args=(self.led_frames,),
+            name="{}-ledstream".format(threading.current_thread().name), daemon=True).start()
+
+    def stop_led_stream(self):
+        """
+        Stop streaming the colors sent to the lights. The streaming thread is not waited
+        for, since it may be waiting for the replies to be written.
+        """
+        if self.led_frames is None:
+            return
+        self.server.led_stream.unsubscribe(self.led_frames)
+        self.led_frames.put(None)
+        self.led_frames = None
+
+    def _write_led_frames(self, mailbox):
+        """ Streaming thread: write the frames until None is posted """
+        while True:
+            data = mailbox.get()
+            if data is None:
+                return
+            try:
+                with self.write_lock:
+                    self.wfile.write(data)
+            except socket.error:
+                # The connection is lost, it is up to the handler to notice it
+                return
@@ -0,0 +1,145 @@
+""" The image module handles the images sent by Hyperion clients (e.g. grabbers).
+An image is decoded into a NumPy array and each light takes the mean color of the
+pixels inside its scanning area.
+"""
+
+import base64
+import threading
+
+import numpy
+
+from .light_table import light_bounds
+
+class HyperionImage:
+    """
+    An RGB image received from a Hyperion client.
+
+    The pixels attribute is a (height, width, 3) array of uint8 values.
+    Images are compared by identity, so that putting a new frame in the priority list is always
+    seen as a change.
+    """
+
+    def __init__(self, pixels):
+        self.pixels = pixels
+
+    @classmethod
+    def from_base64(cls, data, width, height):
+        """
+        Decode a base64 string of packed RGB pixels (as sent in the imagedata field of the
+        Hyperion image command).
+        Raise a ValueError if the dimensions are not positive or if the data size does not
+        match them.
+        """
+        if width <= 0 or height <= 0:
+            raise ValueError("Invalid image dimensions {}x{}".format(width, height))
+        raw = base64.b64decode(data)
+        if len(raw) != width * height * 3:
+            raise ValueError(
+                "Image data has {} bytes, expected {}x{}x3".format(len(raw), width, height))
+        return cls(numpy.frombuffer(raw, dtype=numpy.uint8).reshape(height, width, 3))
+
+    @property
+    def width(self):
+        """ Width of the image in pixels """
+        return self.pixels.shape[1]
+
+    @property
+    def height(self):
+        """ Height of the image in pixels """
+        return self.pixels.shape[0]
+
+    def __repr__(self):
+        return "HyperionImage({}x{})".format(self.width, self.height)
+
+
+def light_rectangles(lights, width, height):
+    """
+    Convert the relative scanning areas of the lights into pixel bounds.
+
+    Return four integer arrays (x0, x1, y0, y1) so that the scanning area of the i-th light is
+    pixels[y0[i]:y1[i], x0[i]:x1[i]]. Each area contains at least one pixel.
+    """
+    bounds = light_bounds(lights)
+    x_0 = numpy.clip(numpy.floor(bounds[:, 0] * width), 0, width - 1).astype(numpy.intp)
+    x_1 = numpy.clip(numpy.ceil(bounds[:, 1] * width), x_0 + 1, width).astype(numpy.intp)
+    y_0 = numpy.clip(numpy.floor(bounds[:, 2] * height), 0, height - 1).astype(numpy.intp)
+    y_1 = numpy.clip(numpy.ceil(bounds[:, 3] * height), y_0 + 1, height).astype(numpy.intp)
+    return x_0, x_1, y_0, y_1
+
+class LightRegionSampler:
+    """
+    Compute the mean color of the scanning area of each light, for frames of a given size.
+
+    It relies on a summed-area table (integral image): once the table is built for a frame,
+    the sum of any rectangle is obtained from its four corners. So the cost per light is
+    constant whatever the size of its scanning area, and overlapping areas cost nothing more.
+    The corners of all the lights are gathered with a single indexing operation.
+    A sampler can be shared by several threads (e.g. the clients of several boblight servers):
+    each one fills its own table.
+    """
+
+    def __init__(self, lights, width, height):
+        """
+        lights: a LightTable or a sequence of BoblightLight
+        width, height: size of the frames to sample
+        """
+        x_0, x_1, y_0, y_1 = light_rectangles(lights, width, height)
+        # Flat indices in the (height + 1, width + 1) table of the corners of each area:
+        # sum = table[y_1, x_1] + table[y_0, x_0] - table[y_0, x_1] - table[y_1, x_0]
+        stride = width + 1
+        corners = numpy.stack([
+            y_1 * stride + x_1,
+            y_0 * stride + x_0,
+            y_0 * stride + x_1,
+            y_1 * stride + x_0,
+        ])
+        scales = 1. / ((x_1 - x_0) * (y_1 - y_0) * 255.)[:, numpy.newaxis]
+        self._set_mapping(corners, scales, width, height)
+
+    @classmethod
+    def from_mapping(cls, corners, scales, width, height):
+        """
+        Create a sampler from a precomputed mapping (see the corners and scales attributes),
+        without any geometry computation.
+        """
+        sampler = cls.__new__(cls)
+        sampler._set_mapping(corners, scales, width, height)
+        return sampler
+
+    def _set_mapping(self, corners, scales, width, height):
+        """ Store the mapping """
+        self.width = width
+        self.height = height
+        self.corners = corners
+        self.scales = scales
+        self.tables = threading.local() # Summed-area table of each thread, allocated once
+
+    def __len__(self):
+        return self.corners.shape[1]
+
+    def sample(self, pixels):
+        """
+        Return a (len(lights), 3) array of 0. to 1. (r, g, b) values for the given
+        (height, width, 3) pixels array.
+        """
+        table = getattr(self.tables, 'table', None)
+        if table is None:
+            # The first row and column stay at 0, so that no bound check is needed
+            table = self.tables.table = numpy.zeros(
+                (self.height + 1, self.width + 1, 3), dtype=numpy.int64)
+        integral = table[1:, 1:]
+        numpy.cumsum(pixels, axis=0, out=integral)
+        numpy.cumsum(integral, axis=1, out=integral)
+        corners = table.reshape(-1, 3)[self.corners]
+        return (corners[0] + corners[1] - corners[2] - corners[3]) * self.scales
+
+
+def light_colors(image, lights):
+    """
+    Compute the color of each light as the mean of the pixels inside its scanning area.
+
+    image: a HyperionImage
+    lights: a LightTable or a sequence of BoblightLight
+    returns a (len(lights), 3) array of 0. to 1. (r, g, b) values
+    """
+    return LightRegionSampler(lights, image.width, image.height).sample(image.pixels)
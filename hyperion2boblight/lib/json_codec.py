@@ -0,0 +1,62 @@
+""" The JSON codec parses the Hyperion commands and encodes the replies.
+Commands are parsed directly from the received bytes, and replies are encoded to bytes lines,
+without intermediate strings. The orjson backend is used when it is installed, the standard
+json module otherwise.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class JsonCodec(object):
+    """ Standard library backend """
+
+    name = 'json'
+
+    @staticmethod
+    def loads(data):
+        """ Parse a JSON document from bytes (or bytearray or memoryview) """
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+    @staticmethod
+    def dumps(obj):
+        """ Encode an object in a JSON line (bytes ending with a new line) """
+        return (json.dumps(obj) + '\n').encode('utf-8')
+
+class OrjsonCodec(JsonCodec):
+    """ orjson backend """
+
+    name = 'orjson'
+
+    @staticmethod
+    def loads(data):
+        return orjson.loads(data)
+
+    @staticmethod
+    def dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+
+CODECS = {'json': JsonCodec}
+if orjson is not None:
+    CODECS['orjson'] = OrjsonCodec
+
+def get_codec(name=None):
+    """
+    Return the codec of the given backend name, or the fastest available one if name is None.
+    Raise a ValueError if the backend is not available.
+    """
+    if name is None:
+        name = 'orjson' if 'orjson' in CODECS else 'json'
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError("JSON backend not available: {}".format(name))
+
+# Constant replies, encoded once
+SUCCESS = JsonCodec.dumps({'success': True})
+FAILURE = JsonCodec.dumps({'success': False})
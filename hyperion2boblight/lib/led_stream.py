@@ -0,0 +1,100 @@
+""" The LED stream broadcasts the colors sent to the lights to the Hyperion clients which asked
+for them with the ledcolors command (as the Hyperion live view does).
+The boblight client publishes the colors of each frame it sends. A broadcaster thread encodes
+them once, at most fps times per second, and posts the same bytes in the mailbox of each
+subscriber. A slow subscriber only misses frames: it never delays the output nor the other
+subscribers. The broadcaster thread only runs while there are subscribers.
+This module is thread-proof.
+"""
+
+import time
+import logging
+import threading
+
+import numpy
+
+from . import json_codec
+from .mailbox import FrameMailbox
+from .priority_list import Empty
+
+class LedStream(object):
+    """ A rate capped broadcaster of the lights colors """
+
+    def __init__(self, fps=10., codec=None):
+        """
+        fps: maximal number of frames per second sent to the subscribers
+        codec: JSON codec of the frames (the fastest available if None)
+        """
+        self.logger = logging.getLogger("LedStream")
+        self.interval = 1. / fps
+        self.codec = codec if codec is not None else json_codec.get_codec()
+        self.lock = threading.Lock()
+        self.subscribers = [] # (mailbox, listener) of each subscriber
+        self.colors = None # Last published colors
+        self.frames = FrameMailbox() # Colors waiting to be broadcast, latest wins
+        self.encoded = 0 # Number of frames encoded
+        self.thread = None
+
+    def subscribe(self, listener=None):
+        """
+        Return a new mailbox receiving the encoded frames (bytes lines).
+        listener: callable() called after each frame posted in the mailbox, by the
+            broadcaster thread. It must not block.
+        """
+        mailbox = FrameMailbox()
+        with self.lock:
+            self.subscribers = self.subscribers + [(mailbox, listener)]
+            colors = self.colors
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self._broadcast, name="LedStream", daemon=True)
+                self.thread.start()
+        if colors is not None:
+            # The new subscriber gets the current colors, even if they do not change
+            self.frames.put(colors)
+        return mailbox
+
+    def unsubscribe(self, mailbox):
+        """ Stop posting frames in the mailbox """
+        with self.lock:
+            self.subscribers = [
+                subscriber for subscriber in self.subscribers if subscriber[0] is not mailbox]
+
+    def publish(self, colors):
+        """ Publish the colors sent to the lights, a (len(lights), 3) array of 0. to 1. """
+        colors = numpy.array(colors, dtype=numpy.float64)
+        self.colors = colors
+        if self.subscribers:
+            self.frames.put(colors)
+
+    def encode(self, colors):
+        """ Return the ledcolors update of the colors, a JSON line """
+        leds = numpy.rint(numpy.clip(colors, 0., 1.) * 255.).astype(numpy.uint8)
+        return self.codec.dumps({
+            'command': 'ledcolors-ledstream-update',
+            'result': {'leds': leds.ravel().tolist()},
+            'success': True
+        })
+
+    def _broadcast(self):
+        """ Broadcaster thread: encode the published colors and post them to the subscribers """
+        while True:
+            try:
+                colors = self.frames.get(timeout=self.interval * 10)
+            except Empty:
+                colors = None
+            with self.lock:
+                subscribers = self.subscribers
+                if not subscribers:
+                    self.thread = None
+                    return
+            if colors is None:
+                continue
+            data = self.encode(colors)
+            self.encoded += 1
+            for (mailbox, listener) in subscribers:
+                mailbox.put(data)
+                if listener is not None:
+                    listener()
+            # Cap the rate: the colors published meanwhile are coalesced in the mailbox
+            time.sleep(self.interval)
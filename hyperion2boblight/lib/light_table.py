@@ -0,0 +1,188 @@
+""" The light table stores the lights of a boblight server as NumPy arrays.
+Names, scanning areas, centers and sizes of all the lights are kept in contiguous arrays, so
+that geometric computations (image mapping, spatial effects...) handle all the lights at once.
+For compatibility, the table also behaves like the dict of BoblightLight it replaces.
+"""
+
+import numpy
+
+class BoblightLight:
+    """
+    A light as defined in the Boblight config file.
+
+    It can be used by the Effect objects to return expected color given
+    the scanning area of a light.
+
+    To instanciate a light object, you must pass to its constructor values
+    returned by the boblight server. Nevertheless, internally coordinates
+    are stored in a relative manner : left-top corner is (0, 0) and
+    right-bottom one is (1.0, 1.0).
+    """
+
+    __slots__ = ('name', 'left', 'right', 'top', 'bottom')
+
+    def __init__(self, name, hscan, vscan):
+        """
+        Create a new light.
+
+        name is the name of the light. It's not very useful except for debug
+        informations.
+        hscan and vscan are tuples, representing the scanning area coordinates,
+        according to the boblight configuration (i.e. with values between 0
+        and 100).
+        """
+        self.name = name
+        self.left = float(hscan[0])/100
+        self.right = float(hscan[1])/100.
+        self.top = float(vscan[0])/100
+        self.bottom = float(vscan[1])/100.
+
+    @property
+    def width(self):
+        """
+        The width property is the width of the scanning area of the light.
+        """
+        return self.right - self.left
+
+    @property
+    def height(self):
+        """
+        The height property is the height of the scanning area of the light.
+        """
+        return self.bottom - self.top
+
+    def contains(self, coord):
+        """
+        Check that light reacts to the point with coordinates coord.
+        """
+        return (
+            coord[0] > self.left and coord[0] < self.right and
+            coord[1] > self.top and coord[1] < self.bottom
+        )
+
+    def __str__(self):
+        return "-<O {} ({:.2f}-{:.2f}, {:.2f}|{:.2f})".format(
+            self.name,
+            self.left, self.right,
+            self.top, self.bottom)
+
+    def __repr__(self):
+        return "BoblightLight({}, ({:d}, {:d}), ({:d}, {:d}))".format(
+            self.name,
+            int(self.left * 100), int(self.right * 100),
+            int(self.top * 100), int(self.bottom *100))
+
+
+def light_bounds(lights):
+    """
+    Return a (len(lights), 4) float64 array of the (left, right, top, bottom) relative
+    bounds of the lights, which can be a LightTable or a sequence of BoblightLight.
+    """
+    if isinstance(lights, LightTable):
+        return lights.bounds
+    return numpy.array(
+        [(light.left, light.right, light.top, light.bottom) for light in lights],
+        dtype=numpy.float64).reshape(-1, 4)
+
+class LightTable:
+    """
+    The lights of a boblight server, in the order announced by the server.
+
+    The table is read-only once built. It behaves like a dict of BoblightLight keyed by
+    light names: the light objects are only created when they are accessed.
+
+    Array attributes (one row per light, relative coordinates):
+        bounds: (N, 4) (left, right, top, bottom), whose columns are also available as the
+            left, right, top and bottom (N,) arrays
+        centers: (N, 2) (x, y) centers of the scanning areas
+        sizes: (N, 2) (width, height) of the scanning areas
+    """
+
+    def __init__(self, names=(), bounds=None):
+        """
+        names: sequence of the names of the lights
+        bounds: (len(names), 4) array of the (left, right, top, bottom) relative bounds of the
+            scanning areas (values between 0 and 1)
+        """
+        self.names = list(names)
+        self.index = {name: index for (index, name) in enumerate(self.names)}
+        if bounds is None:
+            bounds = numpy.zeros((len(self.names), 4))
+        self.bounds = numpy.ascontiguousarray(bounds, dtype=numpy.float64).reshape(-1, 4)
+        if len(self.bounds) != len(self.names):
+            raise ValueError("{} names for {} bounds".format(len(self.names), len(self.bounds)))
+        self.bounds.flags.writeable = False
+        (self.left, self.right, self.top, self.bottom) = self.bounds.T
+        self.sizes = numpy.stack([self.right - self.left, self.bottom - self.top], axis=1)
+        self.centers = numpy.stack(
+            [self.left + self.sizes[:, 0] / 2, self.top + self.sizes[:, 1] / 2], axis=1)
+        self._lights = [None] * len(self.names)
+
+    @classmethod
+    def from_lights(cls, lights):
+        """ Create a table from a sequence of BoblightLight """
+        lights = list(lights)
+        return cls([light.name for light in lights], light_bounds(lights))
+
+    def light(self, index):
+        """ Return the BoblightLight at the given index """
+        light = self._lights[index]
+        if light is None:
+            light = BoblightLight.__new__(BoblightLight)
+            light.name = self.names[index]
+            (light.left, light.right, light.top, light.bottom) = self.bounds[index].tolist()
+            self._lights[index] = light
+        return light
+
+    def contains(self, points):
+        """
+        Check which lights react to which points.
+
+        points: (M, 2) array of (x, y) relative coordinates
+        returns a (M, N) boolean array, True where the point is inside the scanning area of
+            the light
+        """
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        x = points[:, 0, numpy.newaxis]
+        y = points[:, 1, numpy.newaxis]
+        return (x > self.left) & (x < self.right) & (y > self.top) & (y < self.bottom)
+
+    def nearest(self, points):
+        """
+        Find the light whose center is the nearest of each point.
+
+        points: (M, 2) array of (x, y) relative coordinates
+        returns a (M,) array of light indices
+        """
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        if not self.names:
+            raise ValueError("No light in the table")
+        distances = ((points[:, numpy.newaxis, :] - self.centers) ** 2).sum(axis=2)
+        return distances.argmin(axis=1)
+
+    def keys(self):
+        """ Names of the lights """
+        return list(self.names)
+
+    def values(self):
+        """ BoblightLight objects of the lights """
+        return [self.light(index) for index in range(len(self.names))]
+
+    def items(self):
+        """ (name, BoblightLight) of the lights """
+        return list(zip(self.names, self.values()))
+
+    def __getitem__(self, name):
+        return self.light(self.index[name])
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __repr__(self):
+        return "LightTable({})".format(self.names)
@@ -0,0 +1,88 @@
+""" The line reader splits a stream of bytes (e.g. a socket) into lines.
+Data is received in large chunks into a single buffer, and lines are cut from it as they are
+requested, whatever the way they were fragmented by the network. A partial line stays in the
+buffer until the rest of it is received, and the bytes already searched for a line end are not
+searched again.
+This module is not thread-proof: the callers must serialize the reads.
+"""
+
+class LineReader(object):
+    """ A buffered reader of lines ending with b'\\n' """
+
+    def __init__(self, recv=None, chunk_size=65536):
+        """
+        recv: callable(size) returning at most size bytes, and b'' at the end of the stream
+            (e.g. socket.recv). If None, data must be given with feed().
+        chunk_size: maximum number of bytes asked to recv at once
+        """
+        self.recv = recv
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        self.start = 0 # Offset of the first byte not read yet
+        self.scanned = 0 # Offset up to which the buffer is known not to contain a line end
+
+    def __len__(self):
+        """ Number of bytes buffered and not read yet """
+        return len(self.buffer) - self.start
+
+    def feed(self, data):
+        """ Append received data to the buffer """
+        if self.start and self.start * 2 >= len(self.buffer):
+            # Drop the bytes already read, once they are the larger part of the buffer
+            del self.buffer[:self.start]
+            self.scanned -= self.start
+            self.start = 0
+        self.buffer += data
+
+    def reset(self):
+        """ Drop the buffered data, e.g. when the stream is reopened """
+        self.buffer = bytearray()
+        self.start = 0
+        self.scanned = 0
+
+    def next_line(self):
+        """ Return the next buffered line (with its line end), or None if there is no whole
+        line in the buffer. Nothing is received. """
+        end = self.buffer.find(b'\n', max(self.scanned, self.start))
+        if end < 0:
+            self.scanned = len(self.buffer)
+            return None
+        line = bytes(self.buffer[self.start:end + 1])
+        self.start = self.scanned = end + 1
+        return line
+
+    def readline(self):
+        """
+        Return the next line, with its line end, receiving data until it is complete.
+        At the end of the stream, return the remaining partial line (b'' if there is none).
+        """
+        line = self.next_line()
+        while line is None:
+            data = self.recv(self.chunk_size)
+            if not data:
+                line = bytes(self.buffer[self.start:])
+                self.reset()
+                break
+            self.feed(data)
+            line = self.next_line()
+        return line
+
+    def readlines(self, count):
+        """ Return the count next lines. The list is shorter if the stream ends before. """
+        lines = []
+        while len(lines) < count:
+            line = self.readline()
+            if not line.endswith(b'\n'):
+                break
+            lines.append(line)
+        return lines
+
+    def read(self, size):
+        """ Return at most size bytes, the buffered ones first """
+        if len(self):
+            data = bytes(self.buffer[self.start:self.start + size])
+            self.start += len(data)
+            if self.start == len(self.buffer):
+                self.reset()
+            return data
+        return self.recv(size)
@@ -0,0 +1,73 @@
+""" The frame mailbox is a bounded, latest-wins queue between a producer and a consumer.
+Producers never wait: once the mailbox is full, a new item overwrites the oldest pending one,
+if the consumer did not take it yet. With the default size of one item, the consumer always
+gets the newest item, so it never works on outdated frames however fast items are produced.
+This module is thread-proof.
+"""
+
+import threading
+from collections import deque
+
+from .priority_list import Empty
+
+class FrameMailbox(object):
+    """ A latest-wins mailbox counting the items overwritten before being consumed """
+    def __init__(self, maxsize=1):
+        """ maxsize: number of pending items kept, the oldest ones being dropped first """
+        super(FrameMailbox, self).__init__()
+        if maxsize < 1:
+            raise ValueError("A mailbox must hold at least one item")
+        self.condition = threading.Condition(threading.Lock())
+        self.maxsize = maxsize
+        self.items = deque() # Pending items, oldest first
+        self.last = None # Last item consumed
+        self.consumed = False # Whether an item has been consumed
+        self.posted = 0 # Number of items put in the mailbox
+        self.dropped = 0 # Number of items overwritten before being consumed
+
+    @property
+    def pending(self):
+        """ Whether an item is waiting to be consumed """
+        return bool(self.items)
+
+    def __len__(self):
+        """ Number of items waiting to be consumed """
+        return len(self.items)
+
+    def put(self, item):
+        """ Post an item, replacing the oldest pending one if the mailbox is full """
+        with self.condition:
+            if len(self.items) >= self.maxsize:
+                self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.posted += 1
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """
+        Wait for an item and return the oldest pending one.
+        Raise Empty if no item is posted before timeout (in seconds) expires.
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.items, timeout):
+                raise Empty()
+            item = self.items.popleft()
+            self.last = item
+            self.consumed = True
+        return item
+
+    def repeat(self):
+        """
+        Post again the last consumed item, so that it is handled again (e.g. because the way
+        to handle it changed). Nothing is done if a newer item is pending.
+        """
+        with self.condition:
+            if self.consumed and not self.items:
+                self.items.append(self.last)
+                self.condition.notify()
+
+    def drop(self):
+        """ Count a consumed item as dropped, because the consumer could not handle it """
+        with self.condition:
+            self.dropped += 1
@@ -0,0 +1,130 @@
+""" The mapping cache keeps the pixel to light mappings (LightRegionSampler) already computed.
+A mapping only depends on the lights layout and on the frame resolution, so it is built on the
+first frame of a given resolution and reused for the next ones.
+The few most recently used mappings are kept in memory, and they can also be stored on disk
+so that a restarted server does not have to compute them again.
+"""
+
+import os
+import logging
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy
+
+from .image import LightRegionSampler
+from .light_table import LightTable, light_bounds
+
+class MappingCache:
+    """
+    LRU cache of LightRegionSampler keyed by the lights layout and the frame resolution.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, size=4, directory=None):
+        """
+        size: number of mappings kept in memory
+        directory: if not None, directory where mappings are stored, named after a hash of
+            the layout and the resolution.
+        """
+        self.logger = logging.getLogger("MappingCache")
+        self.size = size
+        self.directory = directory
+        self.samplers = OrderedDict()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def layout_hash(cls, lights):
+        """ Return a hash identifying the names and scanning areas of the lights """
+        digest = hashlib.sha1(str(cls.FORMAT_VERSION).encode('ascii'))
+        names = lights.names if isinstance(lights, LightTable) else [
+            light.name for light in lights]
+        for (name, bounds) in zip(names, light_bounds(lights)):
+            digest.update(name.encode('utf-8'))
+            digest.update(bounds.tobytes())
+        return digest.hexdigest()
+
+    def get(self, lights, width, height, layout=None):
+        """
+        Return the sampler of the lights for frames of the given size.
+
+        layout is the layout_hash of the lights. It is computed if not given, but callers
+        should compute it once when the lights are fetched.
+        """
+        if layout is None:
+            layout = self.layout_hash(lights)
+        key = (layout, width, height)
+        with self.lock:
+            try:
+                self.samplers.move_to_end(key)
+                return self.samplers[key]
+            except KeyError:
+                pass
+
+        sampler = self._load(key)
+        if sampler is None or len(sampler) != len(lights):
+            sampler = LightRegionSampler(lights, width, height)
+            self._store(key, sampler)
+
+        with self.lock:
+            self.samplers[key] = sampler
+            while len(self.samplers) > self.size:
+                self.samplers.popitem(last=False)
+        return sampler
+
+    def _path(self, key):
+        """ Return the path of the file storing the mapping """
+        return os.path.join(self.directory, "{}-{}x{}.npz".format(*key))
+
+    def _load(self, key):
+        """ Load a mapping from disk, return None if not available """
+        if self.directory is None:
+            return None
+        try:
+            with numpy.load(self._path(key)) as mapping:
+                (corners, scales) = (mapping['corners'], mapping['scales'])
+        except (OSError, KeyError, ValueError):
+            return None
+        if not self._valid_mapping(corners, scales, key[1], key[2]):
+            self.logger.warning("Invalid mapping %sx%s on disk, computing it", key[1], key[2])
+            return None
+        sampler = LightRegionSampler.from_mapping(corners, scales, key[1], key[2])
+        self.logger.debug("Mapping %sx%s loaded from disk", key[1], key[2])
+        return sampler
+
+    @staticmethod
+    def _valid_mapping(corners, scales, width, height):
+        """ Check that a mapping read from disk can sample frames of the given size """
+        if (corners.ndim != 2 or corners.shape[0] != 4 or
+                not numpy.issubdtype(corners.dtype, numpy.integer)):
+            return False
+        if scales.shape != (corners.shape[1], 1):
+            return False
+        return corners.size == 0 or (
+            corners.min() >= 0 and corners.max() < (width + 1) * (height + 1))
+
+    def _store(self, key, sampler):
+        """ Write a mapping on disk, failures are only logged """
+        if self.directory is None:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write in a temporary file first, so that a concurrent reader never sees
+            # a partial file
+            (handle, tmp_path) = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        except OSError as error:
+            self.logger.warning("Unable to store mapping: %s", error)
+            return
+        try:
+            with os.fdopen(handle, 'wb') as tmp_file:
+                numpy.savez(tmp_file, corners=sampler.corners, scales=sampler.scales)
+            os.replace(tmp_path, self._path(key))
+        except OSError as error:
+            self.logger.warning("Unable to store mapping: %s", error)
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
@@ -0,0 +1,131 @@
+""" The metrics follow the commands from their reception to the frames sent to the lights.
+Counters count events (commands, frames, bytes...) and report their rate, histograms sort
+durations into fixed buckets, and gauges are functions only called when the metrics are read.
+The Hyperion servers record the monotonic time when commands are received, which the priority
+list keeps with the items, so that the boblight clients can measure the delivery and the
+end-to-end latencies.
+Metrics are disabled by passing None instead of a Metrics object: the instrumented code then
+only checks an attribute.
+This module is thread-proof.
+"""
+
+import time
+import bisect
+import threading
+
+# Upper bounds (in seconds) of the latency buckets, from 50 microseconds to 5 seconds
+LATENCY_BOUNDS = (
+    .00005, .0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5.)
+
+class Counter(object):
+    """ A count of events """
+
+    __slots__ = ('lock', 'value')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def add(self, amount=1):
+        """ Count amount more events """
+        with self.lock:
+            self.value += amount
+
+class Histogram(object):
+    """ Durations sorted into fixed buckets """
+
+    __slots__ = ('lock', 'bounds', 'counts', 'count', 'total', 'max')
+
+    def __init__(self, bounds=LATENCY_BOUNDS):
+        """ bounds: increasing upper bounds of the buckets, a last one holds larger values """
+        self.lock = threading.Lock()
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+
+    def observe(self, value):
+        """ Add a value """
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def to_dict(self):
+        """ Return the count, mean, max and bucket counts of the values """
+        with self.lock:
+            return {
+                'count': self.count,
+                'mean': self.total / self.count if self.count else 0.,
+                'max': self.max,
+                'buckets': [
+                    [bound, count] for (bound, count) in zip(self.bounds + (None,), self.counts)]
+            }
+
+class Metrics(object):
+    """ Named counters, histograms and gauges """
+
+    def __init__(self, rate_interval=10.):
+        """ rate_interval: minimal duration (in seconds) over which the rates are computed """
+        self.lock = threading.Lock()
+        self.rate_interval = rate_interval
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.start = time.monotonic()
+        # Time and counter values from which the rates are computed, and the next ones, taken
+        # at least rate_interval later
+        self.reference = self.candidate = (self.start, {})
+
+    def counter(self, name):
+        """ Return the counter of the given name, created if needed """
+        with self.lock:
+            counter = self.counters.get(name)
+            if counter is None:
+                counter = self.counters[name] = Counter()
+            return counter
+
+    def histogram(self, name, bounds=LATENCY_BOUNDS):
+        """ Return the histogram of the given name, created if needed """
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(bounds)
+            return histogram
+
+    def gauge(self, name, function):
+        """ Report the value returned by function() when the metrics are read """
+        with self.lock:
+            self.gauges[name] = function
+
+    def to_dict(self):
+        """
+        Return all the metrics: the total and the rate (per second) of the counters, the
+        histograms and the gauges values.
+        """
+        now = time.monotonic()
+        with self.lock:
+            counters = {name: counter.value for (name, counter) in self.counters.items()}
+            histograms = dict(self.histograms)
+            gauges = dict(self.gauges)
+            if now - self.candidate[0] >= self.rate_interval:
+                self.reference = self.candidate
+                self.candidate = (now, counters)
+            (start, previous) = self.reference
+        elapsed = now - start
+        return {
+            'uptime': now - self.start,
+            'counters': {
+                name: {
+                    'total': value,
+                    'rate': (value - previous.get(name, 0)) / elapsed if elapsed > 0 else 0.
+                }
+                for (name, value) in counters.items()},
+            'histograms': {
+                name: histogram.to_dict() for (name, histogram) in histograms.items()},
+            'gauges': {name: function() for (name, function) in gauges.items()}
+        }
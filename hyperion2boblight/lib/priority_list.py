@@ -1,63 +1,187 @@
 """ The priority list implement a kind of ... priority list !!!
 Each item is associated to a priority. The lowest priority item is the first item
 to be retrieved.
+Priorities are kept in a heap, so the first item is found without sorting the whole list, and a
+generation number is incremented each time the first item changes. Waiters are only woken up
+when it happens, and they can wait for a generation newer than the one they already handled,
+so that no change is missed. A version number is also incremented on any modification of the
+list, for the readers caching something computed from the whole list, and a priorities
+version only when the set of priorities changes, for the ones which ignore the data.
+Consumers can also subscribe to the changes of the first item: each subscription gets them in
+its own bounded mailbox, so that a change costs one post per subscriber and only wakes up the
+consumers, which never miss the latest state.
+Several modifications can be grouped in a transaction: other threads only see the list once
+they are all done, and the change of the first item is published once, at the end.
+Items can be put with the (monotonic) time when their command was received, which is kept
+alongside them to measure the latency of their handling.
+Items can be put with a duration, after which they are removed. All the expiries of a list are
+handled by a single scheduler thread, running only while some items have a duration.
 This module is thread-proof.
 """
 
+import time
+import heapq
 import threading
+from contextlib import contextmanager
 from queue import Empty as QEmpty
 
 class Empty(QEmpty):
     pass
 
 class PriorityList(object):
-    """docstring for PriorityList"""
+    """ A thread-safe list of items sorted by priority """
     def __init__(self):
         super(PriorityList, self).__init__()
         self.data = {}
-        self.condition = threading.Condition(threading.RLock())
+        self.heap = [] # Priorities of the items, removed ones are dropped lazily
+        self.generation = 0 # Incremented each time the first item changes
+        self.version = 0 # Incremented each time the list is modified
+        self.priorities_version = 0 # Incremented each time a priority is added or removed
+        self.timestamps = {} # Reception time of the items put with one
+        self.lock = threading.RLock()
+        self.condition = threading.Condition(self.lock)
+        self._batch_depth = 0 # Number of nested transactions in progress
+        self._batch_changed = False # Whether the first item changed during the transaction
+        self.subscriptions = [] # Subscriptions to the changes of the first item
+
+        self.deadlines = {} # (deadline, sequence) of the items with a duration
+        self.expiries = [] # Heap of (deadline, sequence, priority), outdated ones are skipped
+        self.sequence = 0 # Distinguish successive puts of the same priority
+        self.expiry_condition = threading.Condition(self.lock)
+        self.expiry_thread = None
 
     def get_priorities(self):
         """ Return a list of priorities in the list """
         with self.condition:
-            result = list(self.data.keys())
-            result.sort()
+            result = sorted(self.data)
         return result
 
-    def put(self, priority, data=None):
-        """ Add a new item to the list """
+    @contextmanager
+    def transaction(self):
+        """
+        Group the modifications done in the with block: the lock is held during the whole
+        block, and waiters are only woken up once at its end, if the first item changed.
+        Transactions can be nested.
+        """
+        with self.condition:
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+                if self._batch_depth == 0 and self._batch_changed:
+                    self._batch_changed = False
+                    self._first_changed()
+
+    def put(self, priority, data=None, duration=None, timestamp=None):
+        """ Add a new item to the list.
+        If duration is given, the item is removed after duration seconds, unless it is
+        replaced in the meantime.
+        timestamp is the time.monotonic() time when the command of the item was received. """
         if isinstance(priority, (tuple, list)):
             data = priority[1]
             priority = priority[0]
 
         with self.condition:
+            self._set_duration(priority, duration)
+            first = self._first_priority()
+            if priority in self.data:
+                previous = self.data[priority]
+                changed = priority == first and not (previous is data or previous == data)
+            else:
+                heapq.heappush(self.heap, priority)
+                self.priorities_version += 1
+                changed = first is None or priority < first
             self.data[priority] = data
-            self.condition.notify_all()
+            if timestamp is not None:
+                self.timestamps[priority] = timestamp
+            elif self.timestamps:
+                self.timestamps.pop(priority, None)
+            self.version += 1
+            if changed:
+                self._first_changed()
 
     def remove(self, priority):
         """ Remove the item with the priority _priority_ """
         with self.condition:
             if priority in self.data:
+                first = self._first_priority()
                 del self.data[priority]
-                self.condition.notify_all()
+                self.deadlines.pop(priority, None)
+                self.timestamps.pop(priority, None)
+                self.version += 1
+                self.priorities_version += 1
+                if priority == first:
+                    self._first_changed()
 
     def clear(self):
         """ Clear the list. Remove every item """
         with self.condition:
-            self.data.clear()
-            self.condition.notify_all()
+            if self.data:
+                self.data.clear()
+                self.heap = []
+                self.deadlines.clear()
+                self.timestamps.clear()
+                self.expiries = []
+                self.version += 1
+                self.priorities_version += 1
+                self._first_changed()
 
     def get_first(self):
         """ Return the first (lowest priority) item.
-        If no item are present, return (None, None) """
+        If no item are present, raise Empty """
         with self.condition:
-            priorities = self.get_priorities()
-            if len(priorities) > 0:
-                result = (priorities[0], self.data[priorities[0]])
-            else:
+            priority = self._first_priority()
+            if priority is None:
                 raise Empty()
+            result = (priority, self.data[priority])
         return result
 
+    def get_timestamp(self, priority):
+        """ Return the reception time of the item, None if it was put without one """
+        return self.timestamps.get(priority)
+
+    def wait_generation(self, generation, timeout=None):
+        """
+        Wait until the first item changed after the given generation, or until timeout (in
+        seconds) expires.
+        Return a (generation, first item) tuple, the first item being None if the list is
+        empty. Passing the returned generation to the next call ensures that no change is
+        missed.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.generation > generation, timeout)
+            priority = self._first_priority()
+            if priority is None:
+                result = (self.generation, None)
+            else:
+                result = (self.generation, (priority, self.data[priority]))
+        return result
+
+    def subscribe(self, maxsize=1, listener=None):
+        """
+        Return a new Subscription to the changes of the first item.
+        maxsize: number of changes kept until they are consumed, the oldest being dropped
+        listener: callable(generation, first item) called with the list locked, by the thread
+            modifying it, on each change. It must not block.
+        The current first item, if any, is posted at once (without calling the listener).
+        """
+        # The mailbox module depends on this one
+        from .mailbox import FrameMailbox
+        subscription = Subscription(self, FrameMailbox(maxsize), listener)
+        with self.condition:
+            self.subscriptions.append(subscription)
+            priority = self._first_priority()
+            if priority is not None:
+                subscription.mailbox.put((self.generation, (priority, self.data[priority])))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """ Stop posting changes to the subscription """
+        with self.condition:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+
     def wait_new_item(self):
         """
         Wait until the current first item change.
@@ -67,20 +191,116 @@ class PriorityList(object):
         then it will return the new first item.
         """
         with self.condition:
-            while True:
-                try:
-                    current_first = self.get_first()
-                except Empty:
-                    current_first = None
-                self.condition.wait()
-                new_first = self.get_first() # If exception raised, it's the calling thread that
-                # must handle it
-                if new_first != current_first:
-                    break
+            (_, new_first) = self.wait_generation(self.generation)
+            if new_first is None:
+                # It's the calling thread that must handle it
+                raise Empty()
         return new_first
 
     def size(self):
         """ Return the number of item currently in the list """
         with self.condition:
-            result = len(self.data.keys())
+            result = len(self.data)
         return result
+
+    def _first_priority(self):
+        """ Return the lowest priority (None if empty), the lock must be held """
+        heap = self.heap
+        while heap and heap[0] not in self.data:
+            heapq.heappop(heap)
+        if len(heap) > 2 * len(self.data) + 16:
+            # Too many removed priorities are waiting to be dropped
+            self.heap = heap = list(self.data)
+            heapq.heapify(heap)
+        return heap[0] if heap else None
+
+    def _set_duration(self, priority, duration):
+        """ Schedule the expiry of an item (or cancel it), the lock must be held """
+        if duration is None:
+            self.deadlines.pop(priority, None)
+            return
+        self.sequence += 1
+        deadline = time.monotonic() + duration
+        self.deadlines[priority] = (deadline, self.sequence)
+        heapq.heappush(self.expiries, (deadline, self.sequence, priority))
+        if len(self.expiries) > 2 * len(self.deadlines) + 16:
+            # Too many outdated expiries are waiting to be dropped
+            self.expiries = [
+                (deadline, sequence, priority)
+                for (priority, (deadline, sequence)) in self.deadlines.items()]
+            heapq.heapify(self.expiries)
+        if self.expiry_thread is None:
+            self.expiry_thread = threading.Thread(
+                target=self._expire, name="PriorityList-expiry", daemon=True)
+            self.expiry_thread.start()
+        elif self.expiries[0][1] == self.sequence:
+            # The scheduler must wake up earlier than planned
+            self.expiry_condition.notify()
+
+    def _expire(self):
+        """ Scheduler thread: remove the items when their duration is over """
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                expiries = self.expiries
+                while expiries and expiries[0][0] <= now:
+                    (deadline, sequence, priority) = heapq.heappop(expiries)
+                    if self.deadlines.get(priority) == (deadline, sequence):
+                        self.remove(priority)
+                if not expiries:
+                    self.expiry_thread = None
+                    return
+                self.expiry_condition.wait(expiries[0][0] - now)
+
+    def _first_changed(self):
+        """ Publish a change of the first item, the lock must be held """
+        if self._batch_depth:
+            # Published at the end of the transaction
+            self._batch_changed = True
+            return
+        self.generation += 1
+        self.condition.notify_all()
+        if self.subscriptions:
+            priority = self._first_priority()
+            first = None if priority is None else (priority, self.data[priority])
+            for subscription in self.subscriptions:
+                subscription.post(self.generation, first)
+
+class Subscription(object):
+    """
+    A feed of the changes of the first item of a PriorityList, as (generation, first item)
+    tuples, the first item being None when the list is empty.
+    """
+
+    def __init__(self, priority_list, mailbox, listener=None):
+        self.priority_list = priority_list
+        self.mailbox = mailbox
+        self.listener = listener
+
+    def post(self, generation, first):
+        """ Post a change, called by the priority list with its lock held """
+        if self.listener is not None:
+            self.listener(generation, first)
+        self.mailbox.put((generation, first))
+
+    def get(self, timeout=None):
+        """
+        Wait for a change and return its (generation, first item) tuple.
+        Raise Empty if there is no change before timeout (in seconds) expires.
+        """
+        return self.mailbox.get(timeout)
+
+    @property
+    def dropped(self):
+        """ Number of changes overwritten before being consumed """
+        return self.mailbox.dropped
+
+    def close(self):
+        """ Stop receiving the changes """
+        self.priority_list.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,94 @@
+""" The smoothing stage makes the lights settle progressively toward their target colors, as the
+Hyperion smoothing does.
+Each time the target changes, the lights move from their current colors to the new target,
+either linearly (reaching it after the time constant) or exponentially (covering 63% of the
+remaining distance every time constant). Frames are computed for all the lights at once with
+NumPy, at the rate of the render loop calling step().
+This module is not thread-proof: the callers must serialize the calls.
+"""
+
+import math
+import time
+
+import numpy
+
+class Smoothing(object):
+    """ Move the colors of the lights toward a target """
+
+    KINDS = ('linear', 'exponential')
+
+    def __init__(self, kind='linear', time_constant=.1, threshold=1. / 512):
+        """
+        kind: 'linear' or 'exponential'
+        time_constant: settling time (in seconds) of the linear smoothing, time constant of
+            the exponential one
+        threshold: the exponential smoothing snaps to the target once all the components are
+            closer than threshold
+        """
+        if kind not in self.KINDS:
+            raise ValueError("Unknown smoothing: {}".format(kind))
+        self.kind = kind
+        self.time_constant = time_constant
+        self.threshold = threshold
+        self.colors = numpy.zeros((0, 3)) # Current colors of the lights
+        self.origin = numpy.zeros((0, 3)) # Colors when the target was set
+        self.target = numpy.zeros((0, 3))
+        self.start = 0. # Time from which the transition toward the target is computed
+        self.last = 0. # Time of the last step
+        self.settled = True
+
+    def reset(self, colors):
+        """ Jump to the colors, without transition """
+        self.colors = numpy.array(colors, dtype=numpy.float64).reshape(-1, 3)
+        self.origin = self.colors.copy()
+        self.target = self.colors.copy()
+        self.settled = True
+
+    def set_target(self, colors, now=None):
+        """ Start moving toward the colors, a (len(lights), 3) array """
+        now = time.monotonic() if now is None else now
+        if numpy.shape(colors) != self.colors.shape:
+            # The lights changed, there is nothing to move from
+            self.reset(colors)
+            return
+        if numpy.array_equal(colors, self.target):
+            # The transition in progress goes on
+            return
+        self.target[:] = colors
+        self.origin[:] = self.colors
+        if self.settled:
+            self.start = self.last = now
+        else:
+            # The transition continues from the last step: targets set on every frame (effects,
+            # streams) would otherwise be restarted before the colors had time to move
+            self.start = self.last
+        self.settled = False
+
+    def step(self, now=None):
+        """
+        Compute the colors of the lights at the current time, in the colors attribute.
+        Return True while the target is not reached.
+        """
+        if self.settled:
+            return False
+        now = time.monotonic() if now is None else now
+        if self.time_constant <= 0:
+            progress = 1.
+        elif self.kind == 'linear':
+            progress = min((now - self.start) / self.time_constant, 1.)
+        else:
+            progress = 1. - math.exp(-(now - self.last) / self.time_constant)
+        self.last = now
+
+        if self.kind == 'linear':
+            numpy.subtract(self.target, self.origin, out=self.colors)
+            self.colors *= progress
+            self.colors += self.origin
+            self.settled = progress >= 1.
+        else:
+            self.colors += (self.target - self.colors) * progress
+            self.settled = progress >= 1. or (
+                numpy.abs(self.target - self.colors).max(initial=0.) < self.threshold)
+        if self.settled:
+            self.colors[:] = self.target
+        return not self.settled
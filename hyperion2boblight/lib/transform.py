@@ -0,0 +1,139 @@
+""" The color transform calibrates the colors sent to the lights, as the Hyperion transform does.
+The HSV value and saturation gains are applied to all the lights at once with NumPy. Then each
+channel goes through a lookup table of 256 entries, computed only when the parameters change:
+    output = 0 if input < threshold else blacklevel + (whitelevel - blacklevel) * input ** gamma
+The identity transform (the default one) costs nothing and leaves the colors untouched.
+This module is thread-proof.
+"""
+
+import logging
+import threading
+
+import numpy
+
+class ColorTransform(object):
+    """ A color transform shared by the Hyperion servers and the boblight clients """
+
+    DEFAULTS = {
+        'id': 'default',
+        'valueGain': 1.0,
+        'saturationGain': 1.0,
+        'gamma': [1.0, 1.0, 1.0],
+        'threshold': [0.0, 0.0, 0.0],
+        'whitelevel': [1.0, 1.0, 1.0],
+        'blacklevel': [0.0, 0.0, 0.0]
+    }
+    CHANNEL_PARAMETERS = ('gamma', 'threshold', 'whitelevel', 'blacklevel')
+
+    def __init__(self, parameters=None):
+        """ parameters: dict of Hyperion transform parameters, overriding the defaults """
+        self.logger = logging.getLogger("ColorTransform")
+        self.lock = threading.Lock()
+        self.version = 0 # Incremented each time the parameters change
+        self.listeners = [] # Called after each change
+        self.parameters = {
+            name: list(value) if isinstance(value, list) else value
+            for (name, value) in self.DEFAULTS.items()}
+        # (value gain, saturation gain, flat lookup tables or None), replaced as a whole so
+        # that apply() never sees a partial update
+        self.state = (1., 1., None)
+        if parameters:
+            self.update(parameters)
+
+    @property
+    def identity(self):
+        """ Whether the transform leaves the colors untouched """
+        (value_gain, saturation_gain, tables) = self.state
+        return value_gain == 1. and saturation_gain == 1. and tables is None
+
+    def add_listener(self, listener):
+        """ Call listener() after each change of the parameters """
+        self.listeners.append(listener)
+
+    def update(self, parameters):
+        """
+        Change some parameters, given as in the Hyperion transform command (unknown ones are
+        ignored), and rebuild the lookup tables.
+        Raise a ValueError if a parameter is invalid, no parameter is changed then.
+        """
+        with self.lock:
+            new_parameters = dict(self.parameters)
+            for (name, value) in parameters.items():
+                if name == 'id':
+                    new_parameters[name] = str(value)
+                elif name in ('valueGain', 'saturationGain'):
+                    value = float(value)
+                    if value < 0:
+                        raise ValueError("{} must be positive".format(name))
+                    new_parameters[name] = value
+                elif name in self.CHANNEL_PARAMETERS:
+                    if not isinstance(value, list) or len(value) != 3:
+                        raise ValueError("{} must be a list of 3 values".format(name))
+                    new_parameters[name] = [float(component) for component in value]
+                else:
+                    self.logger.warning("Unsupported transform parameter: %s", name)
+            if any(value <= 0 for value in new_parameters['gamma']):
+                raise ValueError("gamma must be strictly positive")
+            self.state = (
+                new_parameters['valueGain'],
+                new_parameters['saturationGain'],
+                self._tables(new_parameters))
+            self.parameters = new_parameters
+            self.version += 1
+        for listener in self.listeners:
+            listener()
+
+    def to_dict(self):
+        """ Return the parameters, as reported by the serverinfo command """
+        with self.lock:
+            return {
+                name: list(value) if isinstance(value, list) else value
+                for (name, value) in self.parameters.items()}
+
+    def apply(self, colors):
+        """
+        Return the transformed colors.
+        colors is a (N, 3) array of 0. to 1. values. It is returned as is by the identity
+        transform, a new array is returned otherwise.
+        """
+        (value_gain, saturation_gain, tables) = self.state
+        if value_gain != 1. or saturation_gain != 1.:
+            colors = self._hsv_gains(colors, value_gain, saturation_gain)
+        if tables is not None:
+            indices = numpy.rint(numpy.clip(colors, 0., 1.) * 255.).astype(numpy.intp)
+            indices += numpy.arange(3) * 256
+            colors = tables[indices]
+        return colors
+
+    @classmethod
+    def _tables(cls, parameters):
+        """ Return the flat (3 * 256,) lookup tables of the channels, None if they are the
+        identity """
+        if all(parameters[name] == cls.DEFAULTS[name] for name in cls.CHANNEL_PARAMETERS):
+            return None
+        inputs = numpy.linspace(0., 1., 256)
+        tables = []
+        for channel in range(3):
+            (gamma, threshold, white, black) = [
+                parameters[name][channel] for name in cls.CHANNEL_PARAMETERS]
+            table = black + (white - black) * inputs ** gamma
+            table[inputs < threshold] = 0.
+            tables.append(table)
+        return numpy.clip(numpy.concatenate(tables), 0., 1.)
+
+    @staticmethod
+    def _hsv_gains(colors, value_gain, saturation_gain):
+        """
+        Multiply the HSV value and saturation of the colors, keeping their hue.
+        In HSV, each component is value * (1 - saturation * f) where
+        f = (value - component) / (value - min) only depends on the hue.
+        """
+        colors = numpy.asarray(colors, dtype=numpy.float64)
+        value = colors.max(axis=1, keepdims=True)
+        chroma = value - colors.min(axis=1, keepdims=True)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            saturation = numpy.where(value > 0, chroma / value, 0.)
+            hue_factors = numpy.where(chroma > 0, (value - colors) / chroma, 0.)
+        value = numpy.minimum(value * value_gain, 1.)
+        saturation = numpy.minimum(saturation * saturation_gain, 1.)
+        return value * (1. - saturation * hue_factors)
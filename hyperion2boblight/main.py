@@ -7,7 +7,47 @@ import logging
 import argparse
 import threading
 
-from hyperion2boblight import PriorityList, BoblightClient, HyperionServer
+from hyperion2boblight import (
+    PriorityList, BoblightFanout, HyperionServer, AsyncHyperionServer, ColorTransform)
+from hyperion2boblight.lib.mapping_cache import MappingCache
+from hyperion2boblight.lib.smoothing import Smoothing
+from hyperion2boblight.lib.effects import EffectRegistry
+from hyperion2boblight.lib.effects.worker_pool import EffectWorkerPool
+from hyperion2boblight.lib import json_codec
+from hyperion2boblight.lib.led_stream import LedStream
+from hyperion2boblight.lib.metrics import Metrics
+
+SERVER_CLASSES = {
+    'threaded': HyperionServer,
+    'asyncio': AsyncHyperionServer
+}
+
+def boblight_address(value):
+    """
+    Parse a boblight server address, given as host, host:port, [IPv6 address] or
+    [IPv6 address]:port. Return (host, port), port being None if not given.
+    """
+    if value.startswith('['):
+        (host, bracket, port) = value[1:].partition(']')
+        if not bracket or (port and not port.startswith(':')):
+            raise argparse.ArgumentTypeError("invalid address: '{}'".format(value))
+        port = port[1:]
+    elif value.count(':') > 1:
+        # An IPv6 address without port
+        (host, port) = (value, '')
+    else:
+        (host, _, port) = value.partition(':')
+    if not host:
+        raise argparse.ArgumentTypeError("missing host: '{}'".format(value))
+    if not port:
+        return (host, None)
+    try:
+        port = int(port)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid port: '{}'".format(value))
+    if not 0 < port < 65536:
+        raise argparse.ArgumentTypeError("invalid port: '{}'".format(value))
+    return (host, port)
 
 def main():
     """ Main function """
@@ -31,19 +71,142 @@ def main():
         default=19444,
         type=int
     )
+    arg_parser.add_argument(
+        "--server-mode", "-m",
+        dest="server_mode",
+        help="Hyperion server implementation: one thread per connection or a single "
+        "asyncio event loop (default: %(default)s)",
+        choices=sorted(SERVER_CLASSES.keys()),
+        default="threaded"
+    )
+    arg_parser.add_argument(
+        "--json-codec",
+        dest="json_codec",
+        help="JSON backend used to parse the commands and encode the replies (default: "
+        "orjson if installed, json otherwise)",
+        choices=sorted(json_codec.CODECS.keys()),
+        default=None
+    )
+    arg_parser.add_argument(
+        "--led-stream-fps",
+        dest="led_stream_fps",
+        help="Maximal number of frames per second streamed to the clients sending the "
+        "ledcolors command (default: 10)",
+        type=float,
+        default=10.
+    )
+    arg_parser.add_argument(
+        "--metrics",
+        help="Measure the commands handling and the frames sent, reported by the metrics "
+        "command",
+        action="store_true",
+        default=False
+    )
     arg_parser.add_argument(
         "--boblight-address", "-a",
-        dest="boblight_address",
-        help="Address of the boblight server to command (default: %(default)s)",
-        default="localhost"
+        dest="boblight_addresses",
+        metavar="BOBLIGHT_ADDRESS",
+        help="Address of a boblight server to command, as host, host:port or [IPv6]:port. "
+        "Repeat it to command several servers (default: localhost)",
+        action="append",
+        type=boblight_address,
+        default=None
     )
     arg_parser.add_argument(
         "--boblight-port", "-p",
         dest="boblight_port",
-        help="Port that boblight server is listening (default: %(default)s)",
+        help="Port that boblight servers are listening, when not given in their address "
+        "(default: %(default)s)",
         default=19445,
         type=int
     )
+    arg_parser.add_argument(
+        "--ping-interval",
+        dest="ping_interval",
+        help="Delay in seconds between two pings of the boblight server, used to measure "
+        "the round-trip time and detect stalled connections; 0 to disable "
+        "(default: %(default)s)",
+        default=5.,
+        type=float
+    )
+    arg_parser.add_argument(
+        "--report-interval",
+        dest="report_interval",
+        help="Delay in seconds between two logs of the boblight servers statistics; 0 to "
+        "disable (default: %(default)s)",
+        default=60.,
+        type=float
+    )
+    arg_parser.add_argument(
+        "--tolerance",
+        help="Minimal change of a color component (0. to 1.) for a light to be sent again "
+        "(default: %(default)s)",
+        default=0.,
+        type=float
+    )
+    arg_parser.add_argument(
+        "--keyframe-interval",
+        dest="keyframe_interval",
+        help="Send all the lights every N frames, even the unchanged ones; 0 to disable "
+        "(default: %(default)s)",
+        default=100,
+        type=int
+    )
+    arg_parser.add_argument(
+        "--output-fps",
+        dest="output_fps",
+        help="Number of frames per second rendered for effects and smoothing, which is the "
+        "maximal send rate when smoothing is enabled (default: %(default)s)",
+        default=10.,
+        type=float
+    )
+    arg_parser.add_argument(
+        "--effect-processes",
+        dest="effect_processes",
+        help="Number of processes rendering the effects, so that heavy effects do not slow "
+        "down the commands handling; 0 to render them in the main process "
+        "(default: %(default)s)",
+        default=0,
+        type=int
+    )
+    arg_parser.add_argument(
+        "--effect-deadline",
+        dest="effect_deadline",
+        help="Maximal duration in seconds of the rendering of an effect frame by the "
+        "effect processes, later frames are skipped (default: one output frame)",
+        default=None,
+        type=float
+    )
+    arg_parser.add_argument(
+        "--smoothing",
+        help="Smooth the transitions between colors (default: no smoothing)",
+        choices=Smoothing.KINDS,
+        default=None
+    )
+    arg_parser.add_argument(
+        "--smoothing-time",
+        dest="smoothing_time",
+        help="Settling time (linear) or time constant (exponential) of the smoothing, in "
+        "seconds (default: %(default)s)",
+        default=.1,
+        type=float
+    )
+    arg_parser.add_argument(
+        "--effects-dir",
+        dest="effects_dirs",
+        metavar="EFFECTS_DIR",
+        help="Directory of JSON effect descriptors, in addition to the built-in effects and "
+        "the installed ones. Repeat it to add several directories",
+        action="append",
+        default=[]
+    )
+    arg_parser.add_argument(
+        "--mapping-cache-dir",
+        dest="mapping_cache_dir",
+        help="Directory where the image to lights mappings are stored to be reused after a "
+        "restart (default: not stored)",
+        default=None
+    )
     arg_parser.add_argument(
         "--debug", "-d",
         help="Print debug messages",
@@ -63,17 +226,49 @@ def main():
 
     # Build base components
     priority_list = PriorityList()
-    client = BoblightClient(
-        (options.boblight_address, options.boblight_port),
-        priority_list
+    transform = ColorTransform()
+    effects = EffectRegistry(options.effects_dirs)
+    codec = json_codec.get_codec(options.json_codec)
+    led_stream = LedStream(options.led_stream_fps, codec)
+    metrics = Metrics() if options.metrics else None
+    effect_pool = None
+    if options.effect_processes > 0:
+        effect_pool = EffectWorkerPool(
+            options.effect_processes,
+            options.effect_deadline or 1. / options.output_fps,
+            options.effects_dirs)
+    boblight_addresses = [
+        (host, port if port is not None else options.boblight_port)
+        for (host, port) in options.boblight_addresses or [("localhost", None)]]
+    fanout = BoblightFanout(
+        boblight_addresses,
+        priority_list,
+        report_interval=options.report_interval,
+        led_stream=led_stream,
+        mapping_cache=MappingCache(directory=options.mapping_cache_dir),
+        tolerance=options.tolerance,
+        keyframe_interval=options.keyframe_interval,
+        ping_interval=options.ping_interval,
+        output_fps=options.output_fps,
+        smoothing=options.smoothing,
+        smoothing_time=options.smoothing_time,
+        transform=transform,
+        effects=effects,
+        effect_pool=effect_pool,
+        metrics=metrics
     )
-    server = HyperionServer(
+    server = SERVER_CLASSES[options.server_mode](
         (options.listening_address, options.listening_port),
-        priority_list
+        priority_list,
+        transform,
+        effects,
+        codec,
+        led_stream,
+        metrics
     )
 
     # Create threads
-    client_thread = threading.Thread(target=client.run)
+    client_thread = threading.Thread(target=fanout.run)
     server_thread = threading.Thread(target=server.serve_forever)
 
     # Launch threads
@@ -87,6 +282,8 @@ def main():
         logging.info("^C received. Closing server...")
         server.shutdown()
         server.server_close()
+    if effect_pool is not None:
+        effect_pool.close()
 
     logging.info('Exiting')
 
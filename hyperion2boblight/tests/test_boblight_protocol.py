@@ -0,0 +1,461 @@
+"""
+Boblight protocol unit tests, against a fake boblight server
+"""
+
+import random
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+import numpy
+
+from hyperion2boblight import BoblightClient, PriorityList
+from hyperion2boblight.lib.boblight_connection import BoblightConnection
+from hyperion2boblight.lib.boblight_fanout import BoblightFanout
+from hyperion2boblight.lib.image import HyperionImage
+from hyperion2boblight.lib.mapping_cache import MappingCache
+from hyperion2boblight.lib.effects import EffectRegistry
+from hyperion2boblight.lib.effects.effect import Effect
+
+class FakeBoblightServer:
+    """
+    A minimal boblight server, answering hello, get lights and ping.
+    Replies are sent in small random fragments to check that the client reassembles them.
+    Clients are handled one after the other, so that reconnections can be checked.
+    """
+
+    def __init__(self, lights):
+        self.lights = lights
+        self.received = []
+        self.sessions = [] # Lines received on each connection
+        self.hello_delay = 0. # Delay (in seconds) before answering hello
+        self.connection = None
+        self.server = socket.socket()
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('localhost', 0))
+        self.server.listen(1)
+        self.server_address = self.server.getsockname()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        """ Handle the clients until the server is closed """
+        while True:
+            try:
+                (connection, _) = self.server.accept()
+            except socket.error:
+                return
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.connection = connection
+            session = []
+            self.sessions.append(session)
+            try:
+                with connection:
+                    self.handle(connection, session)
+            except socket.error:
+                pass
+
+    def handle(self, connection, session):
+        """ Answer the lines of a client """
+        for line in connection.makefile('rb'):
+            line = line.strip()
+            self.received.append(line)
+            session.append(line)
+            if line == b'hello':
+                time.sleep(self.hello_delay)
+                self.send_fragmented(connection, b'hello\n')
+            elif line == b'get lights':
+                self.send_fragmented(connection, self.lights_listing())
+            elif line == b'ping':
+                self.send_fragmented(connection, b'ping 1\n')
+
+    def disconnect(self):
+        """ Reset the connection of the current client """
+        connection = self.connection
+        connection.setsockopt(
+            socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        connection.shutdown(socket.SHUT_RDWR)
+
+    def lights_listing(self):
+        """ Return the reply to the get lights command """
+        # Lights bounds are (left, right, top, bottom), and boblight sends the vertical scan
+        # range first
+        return b'lights %d\n' % len(self.lights) + b''.join(
+            b'light %s scan %s %s %s %s\n' % (
+                name.encode('utf-8'), bounds[2], bounds[3], bounds[0], bounds[1])
+            for (name, bounds) in self.lights)
+
+    @staticmethod
+    def send_fragmented(connection, data):
+        """ Send data in random size writes, with short pauses """
+        rand = random.Random(len(data))
+        while data:
+            size = rand.randint(1, 8192)
+            connection.sendall(data[:size])
+            data = data[size:]
+            time.sleep(0.0005)
+
+    def close(self):
+        """ Stop accepting connections """
+        self.server.close()
+
+# Two lights, each one scanning half of the screen
+TWO_LIGHTS = [('left', (b'0', b'50', b'0', b'100')), ('right', (b'50', b'100', b'0', b'100'))]
+
+class WhiteEffect(Effect):
+    """ An effect lighting all the lights in white """
+
+    def get_color(self, light=None):
+        return (1., 1., 1.)
+
+class TestBoblightProtocol:
+    """ Check the parsing of the boblight server replies """
+
+    @pytest.fixture
+    def lights(self):
+        """ 5000 lights, all around the screen """
+        return [
+            ('light{}'.format(i), (b'%d' % (i % 100), b'%.1f' % (i % 100 + .5), b'0', b'10'))
+            for i in range(5000)]
+
+    @pytest.yield_fixture
+    def boblightd(self, lights):
+        """ Start a fake boblight server """
+        server = FakeBoblightServer(lights)
+        yield server
+        server.close()
+
+    @pytest.yield_fixture
+    def client(self, boblightd):
+        """ A client connected to the fake server, handshake done """
+        client = BoblightClient(boblightd.server_address, PriorityList(), ping_interval=0)
+        assert client.connection.connect()
+        yield client
+        client.connection.close()
+
+    def test_boblight_protocol_get_lights(self, client, lights):
+        """ Every light of a large and fragmented listing is read """
+        assert len(client.lights) == 5000
+        assert client.lights.keys() == [name for (name, _) in lights]
+        assert client.lights['light4321'].left == pytest.approx(.21)
+        assert client.lights['light4321'].right == pytest.approx(.215)
+        assert client.lights['light4321'].bottom == pytest.approx(.1)
+        assert len(client.encoder) == 5000
+
+    def test_boblight_protocol_next_reply(self, client):
+        """ Nothing is left in the buffer after the listing: the next reply is read as is """
+        assert len(client.connection.reader) == 0
+        client.connection.ping()
+        assert client.connection.pings == 1
+
+    def test_boblight_protocol_get_lights_again(self, client, boblightd):
+        """ The listing can be read again on the same connection """
+        layout = client.lights.names
+        client.get_lights()
+        assert client.lights.names == layout
+        assert boblightd.received.count(b'get lights') == 2
+
+class TestBoblightClientSmoothing:
+    """ Check the frames sent while the smoothing is enabled """
+
+    @pytest.yield_fixture
+    def boblightd(self):
+        """ Start a fake boblight server with two lights """
+        server = FakeBoblightServer(TWO_LIGHTS)
+        yield server
+        server.close()
+
+    def last_color(self, boblightd):
+        """ Return the last color sent for the left light """
+        for line in reversed(boblightd.received[:]):
+            if line.startswith(b'set light left rgb '):
+                return [float(component) for component in line.split()[4:]]
+        return None
+
+    @pytest.mark.parametrize('smoothing, settling_time', [('linear', .2), ('exponential', .8)])
+    def test_boblight_client_smoothing_effect(self, boblightd, smoothing, settling_time):
+        """ The frames of an effect reach its colors once the smoothing settled, although
+        the effect sets the target on every frame """
+        effects = EffectRegistry(entry_points=False)
+        effects.register({'name': 'White'}, lambda: WhiteEffect)
+        priority_list = PriorityList()
+        client = BoblightClient(
+            boblightd.server_address, priority_list, ping_interval=0, output_fps=50.,
+            smoothing=smoothing, smoothing_time=.1, effects=effects)
+        thread = threading.Thread(target=client.run)
+        thread.start()
+        try:
+            priority_list.put(1, 'White')
+            deadline = time.monotonic() + settling_time + .3
+            while self.last_color(boblightd) != [1., 1., 1.] and time.monotonic() < deadline:
+                time.sleep(.01)
+            assert self.last_color(boblightd) == [1., 1., 1.]
+        finally:
+            priority_list.put(0, 'quit')
+            thread.join(5)
+
+class TestBoblightClientCommands:
+    """ Check the frames sent for the commands of the priority list """
+
+    @pytest.yield_fixture
+    def boblightd(self):
+        """ Start a fake boblight server with two lights """
+        server = FakeBoblightServer(TWO_LIGHTS)
+        yield server
+        server.close()
+
+    def test_boblight_client_bad_command(self, boblightd):
+        """ A command which cannot be handled does not stop the client """
+        priority_list = PriorityList()
+        client = BoblightClient(boblightd.server_address, priority_list, ping_interval=0)
+        thread = threading.Thread(target=client.run)
+        thread.start()
+        try:
+            priority_list.put(1, HyperionImage(numpy.zeros((0, 0, 3), dtype=numpy.uint8)))
+            # Let the client handle it, rather than replacing it in its mailbox
+            time.sleep(.2)
+            priority_list.put(1, [255, 255, 255])
+            deadline = time.monotonic() + 2.
+            expected = b'set light right rgb 1.000000 1.000000 1.000000'
+            while time.monotonic() < deadline and expected not in boblightd.received:
+                time.sleep(.01)
+            assert expected in boblightd.received
+            assert thread.is_alive()
+        finally:
+            priority_list.put(0, 'quit')
+            thread.join(5)
+
+    def test_boblight_client_tolerance(self, boblightd):
+        """ Only the lights which changed by more than the tolerance are sent, except in the
+        keyframes, and the bytes sent per frame are counted """
+        client = BoblightClient(
+            boblightd.server_address, PriorityList(), tolerance=.1, keyframe_interval=3,
+            ping_interval=0)
+        assert client.connection.connect()
+        try:
+            for color in ([0, 0, 0], [10, 10, 10], [255, 0, 0], [255, 0, 0]):
+                client.handle_command((1, color))
+            frames = [
+                b'set light left rgb 0.000000 0.000000 0.000000',
+                b'set light right rgb 0.000000 0.000000 0.000000',
+                # Second frame: no light moved by more than the tolerance
+                b'set light left rgb 1.000000 0.000000 0.000000',
+                b'set light right rgb 1.000000 0.000000 0.000000',
+                # Fourth frame: keyframe, although no light changed
+                b'set light left rgb 1.000000 0.000000 0.000000',
+                b'set light right rgb 1.000000 0.000000 0.000000'
+            ]
+            deadline = time.monotonic() + 2.
+            sent = []
+            while len(sent) < 6 and time.monotonic() < deadline:
+                time.sleep(.01)
+                sent = [line for line in boblightd.received if line.startswith(b'set light')]
+            assert sent == frames
+            assert client.encoder.lights_sent == 6
+            assert client.encoder.lights_skipped == 2
+            assert client.frames_sent == 4
+            assert client.bytes_sent == sum(len(line) + 1 for line in boblightd.received)
+            assert client.bytes_per_frame == client.bytes_sent / 4
+        finally:
+            client.connection.close()
+
+    def test_boblight_client_reconnect(self, boblightd):
+        """ When the connection is lost, the new one starts with the handshake, which
+        restores the priority and the colors of the last command """
+        priority_list = PriorityList()
+        client = BoblightClient(boblightd.server_address, priority_list, ping_interval=0)
+        thread = threading.Thread(target=client.run)
+        thread.start()
+        try:
+            priority_list.put(100, [0, 0, 0])
+            time.sleep(.1)
+            boblightd.hello_delay = .3
+            boblightd.disconnect()
+            # Each command changes the priority, so that the dropped writes hold commands
+            priority = 99
+            deadline = time.monotonic() + 2.
+            while len(boblightd.sessions) < 2 and time.monotonic() < deadline:
+                priority_list.put(priority, [255, 255, 255])
+                priority -= 1
+                time.sleep(.05)
+            time.sleep(.5)
+            assert len(boblightd.sessions) == 2
+            session = boblightd.sessions[1]
+            assert session[:2] == [b'hello', b'get lights']
+            assert session[2] == b'set priority %d' % client.priority
+            assert session[-1] == b'set light right rgb 1.000000 1.000000 1.000000'
+            assert client.connection.reconnects == 1
+            # The handshake is not part of the writes latency
+            assert client.send_latency_max < .3
+        finally:
+            priority_list.put(0, 'quit')
+            thread.join(5)
+
+    @pytest.mark.parametrize('command', ['Rainbow', [255, 255, 255]])
+    def test_boblight_client_ping_failure(self, boblightd, command, monkeypatch):
+        """ When a ping fails, the connection is restored by the thread sending the frames,
+        whether frames are rendered meanwhile or not """
+        handshakes = []
+        handshake = BoblightClient.handshake
+
+        def recorded_handshake(client):
+            handshakes.append(threading.current_thread().name)
+            handshake(client)
+
+        monkeypatch.setattr(BoblightClient, 'handshake', recorded_handshake)
+        priority_list = PriorityList()
+        client = BoblightClient(
+            boblightd.server_address, priority_list, ping_interval=.05, output_fps=100.)
+        thread = threading.Thread(target=client.run)
+        thread.start()
+        try:
+            priority_list.put(1, command)
+            time.sleep(.2)
+            boblightd.hello_delay = .2
+            boblightd.disconnect()
+            deadline = time.monotonic() + 3.
+            while time.monotonic() < deadline and not (
+                    len(boblightd.sessions) == 2 and len(boblightd.sessions[1]) > 4):
+                time.sleep(.01)
+            session = boblightd.sessions[1]
+            assert session[:3] == [b'hello', b'get lights', b'set priority 1']
+            assert session[3].startswith(b'set light left rgb ')
+            assert client.connection.reconnects == 1
+            assert len(handshakes) == 2
+            assert not any(name.endswith('-ping') for name in handshakes)
+            assert len(client.lights) == 2
+            assert thread.is_alive()
+        finally:
+            priority_list.put(0, 'quit')
+            thread.join(5)
+
+class TestBoblightConnection:
+    """ Check the reconnections and the pings of the connection """
+
+    @pytest.yield_fixture
+    def boblightd(self):
+        """ Start a fake boblight server with two lights """
+        server = FakeBoblightServer(TWO_LIGHTS)
+        yield server
+        server.close()
+
+    def test_boblight_connection_backoff(self, boblightd):
+        """ The delay between two connection attempts doubles, up to max_backoff """
+        attempts = []
+
+        def handshake():
+            attempts.append(time.monotonic())
+            if len(attempts) < 5:
+                raise socket.error('handshake failed')
+
+        connection = BoblightConnection(
+            boblightd.server_address, handshake, min_backoff=.02, max_backoff=.08,
+            ping_interval=0)
+        assert connection.connect()
+        delays = [second - first for (first, second) in zip(attempts, attempts[1:])]
+        assert len(delays) == 4
+        for (delay, backoff) in zip(delays, (.02, .04, .08, .08)):
+            assert backoff <= delay < backoff + .05
+        assert connection.connected
+        connection.close()
+
+    def test_boblight_connection_abort(self, boblightd):
+        """ An aborted connection stops waiting for its next attempt """
+        boblightd.close()
+        connection = BoblightConnection(boblightd.server_address, min_backoff=10.)
+        results = []
+        thread = threading.Thread(target=lambda: results.append(connection.connect()))
+        thread.start()
+        time.sleep(.1)
+        connection.abort()
+        thread.join(1.)
+        assert results == [False]
+        connection.close()
+
+    def test_boblight_connection_ping(self, boblightd):
+        """ Pings measure the round-trip time, and a server which does not answer is
+        reconnected by the next write """
+        lost = []
+        connection = BoblightConnection(
+            boblightd.server_address, ping_interval=0, lost=lambda: lost.append(True))
+        assert connection.connect()
+        connection.ping()
+        assert connection.pings == 1
+        assert connection.rtt > 0
+        while not boblightd.sessions:
+            time.sleep(.01)
+        boblightd.disconnect()
+        connection.ping()
+        assert connection.pings == 1
+        assert lost == [True]
+        assert not connection.connected
+        assert connection.reconnects == 0
+        assert not connection.sendall(b'hello\n')
+        assert connection.reconnects == 1
+        connection.ping()
+        assert connection.pings == 2
+        assert boblightd.received.count(b'ping') == 2
+        connection.close()
+
+class TestBoblightFanout:
+    """ Check the clients of several boblight servers fed by the same priority list """
+
+    @pytest.yield_fixture
+    def servers(self):
+        """ Start two fake boblight servers """
+        servers = [FakeBoblightServer(TWO_LIGHTS) for _ in range(2)]
+        yield servers
+        for server in servers:
+            server.close()
+
+    def test_boblight_fanout_shared_mapping(self, servers):
+        """ The clients sharing a mapping cache send the colors of the images they received
+        while their frames are sampled concurrently """
+        priority_list = PriorityList()
+        fanout = BoblightFanout(
+            [server.server_address for server in servers], priority_list, report_interval=0,
+            ping_interval=0, mapping_cache=MappingCache())
+        thread = threading.Thread(target=fanout.run)
+        thread.start()
+        try:
+            pixels = numpy.zeros((36, 64, 3), dtype=numpy.uint8)
+            pixels[:, :32] = 255
+            for _ in range(100):
+                priority_list.put(1, HyperionImage(pixels))
+                priority_list.put(1, HyperionImage(pixels[:, ::-1]))
+            priority_list.put(1, HyperionImage(pixels))
+            deadline = time.monotonic() + 2.
+            expected = [b'set light left rgb 1.000000 1.000000 1.000000',
+                        b'set light right rgb 0.000000 0.000000 0.000000']
+            while time.monotonic() < deadline and any(
+                    server.received[-2:] != expected for server in servers):
+                time.sleep(.01)
+            for server in servers:
+                assert server.received[-2:] == expected
+        finally:
+            priority_list.put(0, 'quit')
+            thread.join(5)
+
+    def test_boblight_fanout_effects(self, servers):
+        """ Each client renders its own instance of the effects """
+        priority_list = PriorityList()
+        fanout = BoblightFanout(
+            [server.server_address for server in servers], priority_list, report_interval=0,
+            ping_interval=0)
+        thread = threading.Thread(target=fanout.run)
+        thread.start()
+        try:
+            priority_list.put(1, 'Rainbow')
+            deadline = time.monotonic() + 2.
+            while time.monotonic() < deadline and not all(
+                    'Rainbow' in client.client_effects for client in fanout.clients):
+                time.sleep(.01)
+            (first, second) = (client.client_effects.get('Rainbow') for client in fanout.clients)
+            assert first is not None and second is not None
+            assert first is not second
+        finally:
+            priority_list.put(0, 'quit')
+            thread.join(5)
@@ -0,0 +1,31 @@
+"""
+Effect base class unit tests
+"""
+
+import numpy
+
+from hyperion2boblight.lib.effects.effect import Effect
+from hyperion2boblight.lib.light_table import BoblightLight, LightTable
+
+class LeftRightEffect(Effect):
+    """ A per-light effect: the lights of the left half are red, the others blue """
+    def get_color(self, light=None):
+        return (1., 0., 0.) if light.left < .5 else (0., 0., 1.)
+
+class TestEffect:
+    """ Define the Effect class features/behaviour """
+
+    def test_effect_render_per_light(self):
+        """ Effects only defining get_color are rendered light by light """
+        lights = LightTable.from_lights(
+            [BoblightLight(str(i), (i * 10, (i + 1) * 10), (0, 100)) for i in range(10)])
+        effect = LeftRightEffect()
+        colors = effect.render(lights, 1.)
+        assert colors.shape == (10, 3)
+        assert numpy.all(colors[:5] == (1., 0., 0.))
+        assert numpy.all(colors[5:] == (0., 0., 1.))
+        assert effect.time_step == 10
+
+    def test_effect_render_no_light(self):
+        """ Rendering without lights gives an empty frame """
+        assert LeftRightEffect().render(LightTable(), 0.).shape == (0, 3)
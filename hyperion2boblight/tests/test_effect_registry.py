@@ -0,0 +1,84 @@
+"""
+Effect registry unit tests
+"""
+
+import sys
+import json
+
+import pytest
+
+from hyperion2boblight.lib.effects import EffectRegistry
+from hyperion2boblight.lib.effects.rainbow import RainbowEffect
+
+EFFECT_MODULE = '''
+from hyperion2boblight.lib.effects.effect import Effect
+
+class BlinkEffect(Effect):
+    def get_color(self, light=None):
+        return (1., 1., 1.) if self.time_step % 2 else (0., 0., 0.)
+'''
+
+class TestEffectRegistry:
+    """ Define the EffectRegistry class features/behaviour """
+
+    @pytest.yield_fixture
+    def effects_dir(self, tmpdir):
+        """ A directory describing an effect, whose module is importable """
+        tmpdir.join('blink_effect_module.py').write(EFFECT_MODULE)
+        tmpdir.join('blink.json').write(json.dumps({
+            'name': 'Blink',
+            'script': 'blink.py',
+            'args': {'speed': 2},
+            'module': 'blink_effect_module',
+            'class': 'BlinkEffect'
+        }))
+        tmpdir.join('broken.json').write('{"name": "Broken"')
+        sys.path.insert(0, str(tmpdir))
+
+        yield str(tmpdir)
+
+        sys.path.remove(str(tmpdir))
+        sys.modules.pop('blink_effect_module', None)
+
+    def test_effect_registry_builtin(self):
+        """ The built-in effects are registered """
+        registry = EffectRegistry(entry_points=False)
+        assert 'Rainbow' in registry
+        assert 'Rainbow.py' in registry
+        assert 'Unknown' not in registry
+        assert registry.info[0] == {'name': 'Rainbow', 'script': 'Rainbow.py', 'args': {}}
+        assert isinstance(registry.get('Rainbow'), RainbowEffect)
+        assert registry.get('Rainbow.py') is registry.get('Rainbow')
+        with pytest.raises(KeyError):
+            registry.get('Unknown')
+
+    def test_effect_registry_directory(self, effects_dir):
+        """ Effects of a directory are discovered, and only imported when requested """
+        registry = EffectRegistry([effects_dir], entry_points=False)
+        assert registry.names() == ['Rainbow', 'Blink']
+        assert registry.info[1]['args'] == {'speed': 2}
+        assert registry.version == 2
+        assert 'blink_effect_module' not in sys.modules
+        effect = registry.get('Blink')
+        assert effect.__class__.__name__ == 'BlinkEffect'
+        assert 'blink_effect_module' in sys.modules
+
+    def test_effect_registry_create(self):
+        """ Created effects are not the instance shared by the callers of get """
+        registry = EffectRegistry(entry_points=False)
+        effect = registry.create('Rainbow')
+        assert isinstance(effect, RainbowEffect)
+        assert effect is not registry.get('Rainbow')
+        assert effect is not registry.create('Rainbow')
+        assert registry.get('Rainbow') is registry.get('Rainbow')
+
+    def test_effect_registry_register(self):
+        """ Registering a new effect publishes a new effects list """
+        registry = EffectRegistry(entry_points=False)
+        info = registry.info
+        registry.register({'name': 'Other'}, lambda: RainbowEffect)
+        assert registry.info is not info
+        assert len(info) == 1
+        assert registry.info[-1] == {'name': 'Other', 'script': 'Other.py', 'args': {}}
+        registry.register({'name': 'Other'}, lambda: None)
+        assert len(registry.info) == 2
@@ -0,0 +1,117 @@
+"""
+Effect scheduler unit tests
+"""
+
+import time
+import threading
+
+import pytest
+
+from hyperion2boblight.lib.effects.scheduler import EffectScheduler
+
+class TestEffectScheduler:
+    """ Define the EffectScheduler class features/behaviour """
+
+    @pytest.yield_fixture
+    def scheduler(self):
+        """ Create a running scheduler recording the rendered frames """
+        frames = []
+        scheduler = EffectScheduler(
+            lambda priority, effect, elapsed: frames.append((priority, effect, elapsed)),
+            fps=50.)
+        scheduler.rendered = frames
+        thread = threading.Thread(target=scheduler.run)
+        thread.start()
+
+        yield scheduler
+
+        scheduler.close()
+        thread.join()
+
+    def test_scheduler_fixed_rate(self, scheduler):
+        """ The displayed effect is rendered at the asked rate, with increasing times """
+        scheduler.show(1, 'effect')
+        time.sleep(0.5)
+        scheduler.hide()
+        frames = list(scheduler.rendered)
+        assert 15 <= len(frames) <= 30
+        assert all(frame[:2] == (1, 'effect') for frame in frames)
+        elapsed = [frame[2] for frame in frames]
+        assert elapsed == sorted(elapsed)
+        assert elapsed[0] < 0.02
+
+    def test_scheduler_hide(self, scheduler):
+        """ Nothing is rendered once the effects are hidden """
+        scheduler.show(1, 'effect')
+        time.sleep(0.1)
+        scheduler.hide()
+        time.sleep(0.05)
+        count = len(scheduler.rendered)
+        time.sleep(0.2)
+        assert len(scheduler.rendered) == count
+        assert not scheduler.is_displayed(1, 'effect')
+
+    def test_scheduler_one_effect_per_priority(self, scheduler):
+        """ Showing an effect replaces the one of the same priority, but showing the same
+        effect again keeps its start time """
+        scheduler.show(1, 'first')
+        time.sleep(0.1)
+        scheduler.show(1, 'first')
+        time.sleep(0.1)
+        assert scheduler.rendered[-1][2] > 0.15
+        scheduler.show(1, 'second')
+        time.sleep(0.1)
+        assert scheduler.is_displayed(1, 'second')
+        assert not scheduler.is_displayed(1, 'first')
+        assert scheduler.rendered[-1][1] == 'second'
+        assert scheduler.rendered[-1][2] < 0.15
+
+    def test_scheduler_skip_late_frames(self):
+        """ Frames whose deadline is missed are skipped and counted """
+        scheduler = EffectScheduler(lambda *args: time.sleep(0.05), fps=100.)
+        thread = threading.Thread(target=scheduler.run)
+        thread.start()
+        scheduler.show(1, 'slow')
+        time.sleep(0.5)
+        scheduler.close()
+        thread.join()
+        assert scheduler.frames <= 11
+        assert scheduler.missed >= 30
+
+    def test_scheduler_animate(self):
+        """ Without effect, frames are rendered until render returns False """
+        frames = []
+        scheduler = EffectScheduler(
+            lambda priority, effect, elapsed: frames.append(priority) or len(frames) < 5,
+            fps=100.)
+        thread = threading.Thread(target=scheduler.run)
+        thread.start()
+        scheduler.animate()
+        time.sleep(0.3)
+        assert frames == [None] * 5
+        scheduler.animate()
+        time.sleep(0.1)
+        scheduler.close()
+        thread.join()
+        assert frames == [None] * 6
+
+    def test_scheduler_render_error(self):
+        """ A frame which cannot be rendered does not stop the scheduler """
+        frames = []
+
+        def render(priority, effect, elapsed):
+            frames.append(effect)
+            if effect == 'broken':
+                raise ValueError('broken effect')
+
+        scheduler = EffectScheduler(render, fps=50.)
+        thread = threading.Thread(target=scheduler.run)
+        thread.start()
+        scheduler.show(1, 'broken')
+        time.sleep(0.1)
+        scheduler.show(1, 'effect')
+        time.sleep(0.1)
+        scheduler.close()
+        thread.join()
+        assert frames.count('broken') >= 2
+        assert 'effect' in frames
@@ -0,0 +1,100 @@
+"""
+Effect worker pool unit tests
+"""
+
+import sys
+import json
+import time
+
+import numpy
+import pytest
+
+from hyperion2boblight.lib.effects.rainbow import RainbowEffect
+from hyperion2boblight.lib.effects.worker_pool import EffectWorkerPool
+from hyperion2boblight.lib.light_table import LightTable
+
+EFFECT_MODULE = '''
+import time
+from hyperion2boblight.lib.effects.effect import Effect
+
+class SlowEffect(Effect):
+    def get_color(self, light=None):
+        time.sleep(0.2)
+        return (1., 1., 1.)
+'''
+
+class TestEffectWorkerPool:
+    """ Define the EffectWorkerPool class features/behaviour """
+
+    @pytest.yield_fixture
+    def pool(self, tmpdir):
+        """ A pool of one process, knowing a slow effect """
+        directory = tmpdir
+        directory.join('slow_effect_module.py').write(EFFECT_MODULE)
+        directory.join('slow.json').write(json.dumps({
+            'name': 'Slow', 'module': 'slow_effect_module', 'class': 'SlowEffect'}))
+        sys.path.insert(0, str(directory))
+        pool = EffectWorkerPool(1, deadline=1., directories=[str(directory)])
+        # Wait for the worker to be started
+        pool.executor.submit(time.sleep, 0).result()
+
+        yield pool
+
+        pool.close()
+        sys.path.remove(str(directory))
+
+    @pytest.fixture
+    def lights(self):
+        """ 300 lights """
+        return LightTable(
+            ['light{}'.format(i) for i in range(300)],
+            [(i / 300., (i + 1) / 300., 0., .1) for i in range(300)])
+
+    def test_worker_pool_render(self, pool, lights):
+        """ Frames rendered by the pool match the ones rendered in process, one call later """
+        effect = pool.effect('Rainbow')
+        try:
+            assert effect.render(lights, 4.2) is None
+            effect.pending.result()
+            colors = effect.render(lights, 7.)
+            assert colors.shape == (300, 3)
+            assert numpy.allclose(colors, RainbowEffect().render(lights, 4.2))
+            effect.pending.result()
+            assert numpy.allclose(effect.render(lights, 8.), RainbowEffect().render(lights, 7.))
+        finally:
+            effect.close()
+        stats = pool.stats()['Rainbow']
+        assert stats['frames'] == 3
+        assert stats['missed'] == 0
+        assert stats['cpu_time'] > 0
+
+    def test_worker_pool_no_wait(self, pool):
+        """ Asking a frame does not wait for the workers """
+        lights = LightTable(['a', 'b'], [(0., .5, 0., 1.), (.5, 1., 0., 1.)])
+        effect = pool.effect('Slow')
+        try:
+            start = time.monotonic()
+            assert effect.render(lights, 0.) is None
+            assert effect.render(lights, 0.1) is None
+            assert time.monotonic() - start < .2
+        finally:
+            effect.close()
+
+    def test_worker_pool_deadline(self, pool):
+        """ A frame missing its deadline is skipped, and no frame is asked until it is over """
+        lights = LightTable(['a', 'b'], [(0., .5, 0., 1.), (.5, 1., 0., 1.)])
+        pool.deadline = 0.1
+        effect = pool.effect('Slow')
+        try:
+            assert effect.render(lights, 0.) is None
+            assert effect.render(lights, 0.1) is None
+            time.sleep(1.)
+            assert effect.render(lights, 0.2) is None
+            time.sleep(1.)
+            pool.deadline = 1.
+            assert numpy.all(effect.render(lights, 0.3) == 1.)
+        finally:
+            effect.close()
+        stats = pool.stats()['Slow']
+        assert stats['missed'] == 2
+        assert stats['frames'] == 2
@@ -0,0 +1,61 @@
+"""
+Frame encoder unit tests
+"""
+
+import numpy
+import pytest
+
+from hyperion2boblight.lib.frame_encoder import FrameEncoder
+
+NAMES = ['left', 'right', 'top-3']
+
+def formatted(names, colors, header=b''):
+    """ Expected commands, as formatted by str.format """
+    return header + b''.join(
+        bytes('set light {0} rgb {1[0]:.6f} {1[1]:.6f} {1[2]:.6f}\n'.format(name, color), 'utf8')
+        for name, color in zip(names, colors))
+
+class TestFrameEncoder:
+    """ Frame encoder test class """
+
+    @pytest.fixture
+    def encoder(self):
+        """ Create an encoder with a keyframe every 3 frames """
+        return FrameEncoder(NAMES, tolerance=0.01, keyframe_interval=3)
+
+    def test_frame_encoder_format(self, encoder):
+        """ Check that lights are encoded like the '{:.6f}' format would do """
+        colors = numpy.random.RandomState(0).rand(3, 3)
+        colors[0] = (0., 1., 128/255)
+        header = b'set priority 128\n'
+        assert bytes(encoder.encode(colors, header)) == formatted(NAMES, colors, header)
+
+    def test_frame_encoder_delta(self, encoder):
+        """ Check that only the lights which changed more than the tolerance are encoded,
+        and that a keyframe is sent periodically """
+        colors = numpy.zeros((3, 3))
+        encoder.encode(colors)
+        colors[1] = (.5, .5, .5)
+        colors[2] = (.005, 0., 0.)
+        assert bytes(encoder.encode(colors)) == formatted(NAMES[1:2], colors[1:2])
+        assert bytes(encoder.encode(colors)) == b''
+        assert bytes(encoder.encode(colors)) == formatted(NAMES, colors)
+        assert encoder.lights_sent == 7
+        assert encoder.lights_skipped == 5
+
+    def test_frame_encoder_reset(self, encoder):
+        """ Check that all lights are encoded after a reset """
+        colors = numpy.zeros((3, 3))
+        encoder.encode(colors)
+        encoder.reset()
+        assert bytes(encoder.encode(colors)) == formatted(NAMES, colors)
+
+    def test_frame_encoder_no_keyframe(self):
+        """ Check that unchanged lights are never encoded again when keyframes are disabled """
+        encoder = FrameEncoder(NAMES, keyframe_interval=0)
+        colors = numpy.zeros((3, 3))
+        assert bytes(encoder.encode(colors)) == formatted(NAMES, colors)
+        for _ in range(200):
+            assert bytes(encoder.encode(colors)) == b''
+        assert encoder.lights_sent == 3
+        assert encoder.lights_skipped == 600
@@ -2,24 +2,27 @@
 """ Hyperion server unit tests """
 
 import json
+import time
+import base64
 import socket
 import threading
 
 import pytest
 
-from hyperion2boblight import HyperionServer, PriorityList
+from hyperion2boblight import HyperionServer, AsyncHyperionServer, PriorityList
+from hyperion2boblight.lib.metrics import Metrics
 
 MY_PRIORITY_LIST = PriorityList()
 
 class TestHyperionServer:
     """ Hyperion server test class """
 
-    @pytest.yield_fixture
+    @pytest.yield_fixture(params=[HyperionServer, AsyncHyperionServer])
     def server(self, request):
         """ Create the decoder to test """
         my_priority_list = getattr(request.module, "MY_PRIORITY_LIST", None)
         my_priority_list.clear()
-        server = HyperionServer(
+        server = request.param(
             ("localhost", 19444),
             my_priority_list)
         server_thread = threading.Thread(target=server.serve_forever)
@@ -51,6 +54,167 @@ class TestHyperionServer:
         reply = str(sending_socket.recv(1024), 'utf-8')
         reply_object = json.loads(reply)
         assert reply_object['success'] is True
+        assert 'Rainbow' in [effect['name'] for effect in reply_object['info']['effects']]
+
+    def test_hyperion_server_info_cache(self, server, sending_socket):
+        """ Check that the serverinfo reply is reused until the priorities change """
+        def server_info():
+            sending_socket.sendall(
+                bytes(json.dumps({'command':'serverinfo'}) + '\n', 'utf-8'))
+            data = b''
+            while not data.endswith(b'\n'):
+                data += sending_socket.recv(4096)
+            return data
+
+        first_reply = server_info()
+        cached = server.server_info
+        assert server_info() == first_reply
+        assert server.server_info is cached
+
+        MY_PRIORITY_LIST.put(42, [1, 2, 3])
+        reply_object = json.loads(str(server_info(), 'utf-8'))
+        assert reply_object['info']['priorities'] == [{'priority':42}]
+        assert server.server_info is not cached
+
+        # New data for the same priority, as while streaming, keep the reply
+        cached = server.server_info
+        MY_PRIORITY_LIST.put(42, [4, 5, 6])
+        assert json.loads(str(server_info(), 'utf-8')) == reply_object
+        assert server.server_info is cached
+
+    def test_hyperion_server_transform(self, server, sending_socket):
+        """ Check that the transform command changes the transform reported by the
+        serverinfo command """
+        message = {
+            'command':'transform',
+            'transform':{'id':'strip', 'gamma':[2.2, 2.0, 1.8], 'valueGain':0.8}
+        }
+        sending_socket.sendall(
+            bytes(json.dumps(message) + '\n', 'utf-8'))
+        reply_object = json.loads(str(sending_socket.recv(1024), 'utf-8'))
+        assert reply_object['success'] is True
+        assert server.transform.version == 1
+
+        message = {'command':'transform', 'transform':{'threshold':[2.2]}}
+        sending_socket.sendall(
+            bytes(json.dumps(message) + '\n', 'utf-8'))
+        reply_object = json.loads(str(sending_socket.recv(1024), 'utf-8'))
+        assert reply_object['success'] is False
+
+        sending_socket.sendall(
+            bytes(json.dumps({'command':'serverinfo'}) + '\n', 'utf-8'))
+        reply_object = json.loads(str(sending_socket.recv(4096), 'utf-8'))
+        transform = reply_object['info']['transform']
+        assert transform['id'] == 'strip'
+        assert transform['gamma'] == [2.2, 2.0, 1.8]
+        assert transform['valueGain'] == 0.8
+        assert transform['threshold'] == [0.0, 0.0, 0.0]
+
+    def test_hyperion_server_pipelined(self, sending_socket):
+        """ Check that commands sent together are all answered, in order """
+        messages = [
+            {'command':'color', 'priority':128, 'color':[128, 128, 128]},
+            {'command':'color', 'priority':64, 'color':[64, 64, 64]},
+            {'command':'unknown'}
+        ]
+        sending_socket.sendall(b''.join(
+            bytes(json.dumps(message) + '\n', 'utf-8') for message in messages))
+        data = b''
+        while data.count(b'\n') < 3:
+            data += sending_socket.recv(1024)
+        replies = [json.loads(str(line, 'utf-8')) for line in data.splitlines()]
+        assert [reply['success'] for reply in replies] == [True, True, False]
+        assert MY_PRIORITY_LIST.get_first() == (64, [64, 64, 64])
+        assert MY_PRIORITY_LIST.size() == 2
+
+    def test_hyperion_server_batch(self, sending_socket):
+        """ Check that an array of commands is applied at once, and answered by an array """
+        MY_PRIORITY_LIST.put(10, [10, 10, 10])
+        generation = MY_PRIORITY_LIST.generation
+        messages = [
+            {'command':'clearall'},
+            {'command':'color', 'priority':50, 'color':[50, 50, 50]},
+            {'command':'effect', 'priority':100, 'effect':{'name':'Rainbow'}},
+            {'command':'unknown'},
+            {'command':'serverinfo'}
+        ]
+        sending_socket.sendall(bytes(json.dumps(messages) + '\n', 'utf-8'))
+        data = b''
+        while not data.endswith(b'\n'):
+            data += sending_socket.recv(4096)
+        replies = json.loads(str(data, 'utf-8'))
+        assert [reply['success'] for reply in replies] == [True, True, True, False, True]
+        assert replies[4]['info']['priorities'] == [{'priority':50}, {'priority':100}]
+        assert MY_PRIORITY_LIST.get_first() == (50, [50, 50, 50])
+        assert MY_PRIORITY_LIST.generation == generation + 1
+
+    def test_hyperion_server_invalid_commands(self, sending_socket):
+        """ Check that invalid commands are answered with an error in their slot, without
+        losing the other replies nor the connection """
+        MY_PRIORITY_LIST.put(10, [10, 10, 10])
+        messages = [
+            {'command':'clearall'},
+            {'command':'color', 'priority':50, 'color':[50, 50, 50]},
+            {'command':'color', 'color':[60, 60, 60]},
+            {'command':'color', 'priority':'high', 'color':[70, 70, 70]}
+        ]
+        batch = bytes(json.dumps(messages) + '\n', 'utf-8')
+        color = bytes(json.dumps({'command':'color', 'priority':40, 'color':[1, 2, 3]}) + '\n',
+                      'utf-8')
+        with sending_socket.makefile('rb') as reader:
+            # The lines sent together are answered together
+            sending_socket.sendall(batch + b'{"command":\n' + color)
+            replies = json.loads(str(reader.readline(), 'utf-8'))
+            assert [reply['success'] for reply in replies] == [True, True, False, False]
+            assert replies[2]['error'] == 'Missing argument: priority'
+            assert json.loads(str(reader.readline(), 'utf-8'))['success'] is False
+            assert json.loads(str(reader.readline(), 'utf-8'))['success'] is True
+            assert MY_PRIORITY_LIST.get_first() == (40, [1, 2, 3])
+            assert MY_PRIORITY_LIST.get_priorities() == [40, 50]
+
+            # The connection is still open
+            sending_socket.sendall(bytes(json.dumps({'command':'serverinfo'}) + '\n', 'utf-8'))
+            assert json.loads(str(reader.readline(), 'utf-8'))['success'] is True
+
+    def test_hyperion_server_ledcolors(self, server, sending_socket):
+        """ Check that the colors published are streamed after ledstream-start, and not after
+        ledstream-stop """
+        with sending_socket.makefile('rb') as reader:
+            message = {'command':'ledcolors', 'subcommand':'ledstream-start'}
+            sending_socket.sendall(bytes(json.dumps(message) + '\n', 'utf-8'))
+            assert json.loads(str(reader.readline(), 'utf-8'))['success'] is True
+            server.led_stream.publish([[1., 0., 0.], [0., 0., 1.]])
+            update = json.loads(str(reader.readline(), 'utf-8'))
+            assert update['command'] == 'ledcolors-ledstream-update'
+            assert update['result']['leds'] == [255, 0, 0, 0, 0, 255]
+
+            message = {'command':'ledcolors', 'subcommand':'ledstream-stop'}
+            sending_socket.sendall(bytes(json.dumps(message) + '\n', 'utf-8'))
+            assert json.loads(str(reader.readline(), 'utf-8'))['success'] is True
+            assert not server.led_stream.subscribers
+
+            message = {'command':'ledcolors', 'subcommand':'imagestream-start'}
+            sending_socket.sendall(bytes(json.dumps(message) + '\n', 'utf-8'))
+            assert json.loads(str(reader.readline(), 'utf-8'))['success'] is False
+
+    def test_hyperion_server_metrics(self, server, sending_socket):
+        """ Check that the metrics command reports the commands handled, once enabled """
+        with sending_socket.makefile('rb') as reader:
+            message = bytes(json.dumps({'command':'metrics'}) + '\n', 'utf-8')
+            sending_socket.sendall(message)
+            assert json.loads(str(reader.readline(), 'utf-8'))['success'] is False
+
+            server.metrics = Metrics()
+            color = {'command':'color', 'priority':128, 'color':[1, 2, 3]}
+            sending_socket.sendall(bytes(json.dumps([color, color]) + '\n', 'utf-8'))
+            reader.readline()
+            assert MY_PRIORITY_LIST.get_timestamp(128) <= time.monotonic()
+            sending_socket.sendall(message)
+            reply_object = json.loads(str(reader.readline(), 'utf-8'))
+            assert reply_object['success'] is True
+            # The metrics command itself is counted once answered
+            assert reply_object['info']['counters']['commands']['total'] == 2
+            assert reply_object['info']['histograms']['command_time']['count'] == 1
 
     def test_hyperion_server_color(self, sending_socket):
         """ Check that decoder answers to the color command and put the
@@ -68,6 +232,24 @@ class TestHyperionServer:
         assert MY_PRIORITY_LIST.get_first() == (128, [128, 128, 128])
         assert MY_PRIORITY_LIST.size() == 1
 
+    def test_hyperion_server_color_duration(self, sending_socket):
+        """ Check that a color sent with a duration is removed from the priority_list once
+        the duration is over """
+        message = {
+            'command':'color',
+            'priority':128,
+            'color':[128, 128, 128],
+            'duration':200
+        }
+        sending_socket.sendall(
+            bytes(json.dumps(message) + '\n', 'utf-8'))
+        reply = str(sending_socket.recv(1024), 'utf-8')
+        reply_object = json.loads(reply)
+        assert reply_object['success'] is True
+        assert MY_PRIORITY_LIST.size() == 1
+        time.sleep(0.4)
+        assert MY_PRIORITY_LIST.size() == 0
+
     def test_hyperion_server_effect(self, sending_socket):
         """ Check that decoder answers to the effect command and put the
         right item in the priority_list"""
@@ -86,6 +268,25 @@ class TestHyperionServer:
         assert MY_PRIORITY_LIST.get_first() == (128, "Rainbow.py")
         assert MY_PRIORITY_LIST.size() == 1
 
+    def test_hyperion_server_image(self, sending_socket):
+        """ Check that decoder answers to the image command and put the
+        decoded image in the priority_list"""
+        message = {
+            'command':'image',
+            'priority':128,
+            'imagewidth':2,
+            'imageheight':1,
+            'imagedata':str(base64.b64encode(bytes([255, 0, 0, 0, 0, 255])), 'ascii')
+        }
+        sending_socket.sendall(
+            bytes(json.dumps(message) + '\n', 'utf-8'))
+        reply = str(sending_socket.recv(1024), 'utf-8')
+        reply_object = json.loads(reply)
+        assert reply_object['success'] is True
+        priority, image = MY_PRIORITY_LIST.get_first()
+        assert priority == 128
+        assert image.pixels.tolist() == [[[255, 0, 0], [0, 0, 255]]]
+
     def test_hyperion_server_clear(self, sending_socket):
         """ Check that decoder answer to the clear command and actually
         remove the item from list """
@@ -147,3 +348,13 @@ class TestHyperionServer:
         assert reply_object['success'] is True
         assert MY_PRIORITY_LIST.size() == 0
 
+
+    def test_hyperion_server_quit(self, sending_socket):
+        """ Check that decoder answers to the quit command and tell the other actors to quit """
+        message = {'command':'quit'}
+        sending_socket.sendall(
+            bytes(json.dumps(message) + '\n', 'utf-8'))
+        reply = str(sending_socket.recv(1024), 'utf-8')
+        reply_object = json.loads(reply)
+        assert reply_object['success'] is True
+        assert MY_PRIORITY_LIST.get_first() == (0, 'quit')
@@ -0,0 +1,109 @@
+"""
+Image processing unit tests
+"""
+
+import base64
+import threading
+
+import numpy
+import pytest
+
+from hyperion2boblight.lib.image import (
+    HyperionImage, LightRegionSampler, light_colors, light_rectangles)
+from hyperion2boblight.lib.boblight_client import BoblightLight
+
+class TestImage:
+    """ Image decoding and light colors computation test class """
+
+    @pytest.fixture
+    def lights(self):
+        """ Lights as defined in include/boblight/boblight.conf, plus an overlapping one """
+        return [
+            BoblightLight('left', (0, 50), (0, 100)),
+            BoblightLight('right', (50, 100), (0, 100)),
+            BoblightLight('top', (0, 100), (0, 50)),
+        ]
+
+    @pytest.fixture
+    def image(self):
+        """ A 4x2 image: red on the left half, blue on the right half of the top row,
+        green on the right half of the bottom row """
+        pixels = numpy.zeros((2, 4, 3), dtype=numpy.uint8)
+        pixels[:, :2] = (255, 0, 0)
+        pixels[0, 2:] = (0, 0, 255)
+        pixels[1, 2:] = (0, 255, 0)
+        return HyperionImage(pixels)
+
+    def test_image_from_base64(self, image):
+        """ Check that base64 packed RGB data is decoded in a (height, width, 3) array """
+        data = base64.b64encode(image.pixels.tobytes()).decode('ascii')
+        decoded = HyperionImage.from_base64(data, 4, 2)
+        assert (decoded.width, decoded.height) == (4, 2)
+        assert (decoded.pixels == image.pixels).all()
+
+    def test_image_from_base64_wrong_size(self, image):
+        """ Check that data not matching the dimensions is rejected """
+        data = base64.b64encode(image.pixels.tobytes()).decode('ascii')
+        with pytest.raises(ValueError):
+            HyperionImage.from_base64(data, 4, 4)
+
+    def test_image_from_base64_empty(self):
+        """ Check that images without pixels are rejected """
+        with pytest.raises(ValueError):
+            HyperionImage.from_base64('', 0, 0)
+        with pytest.raises(ValueError):
+            HyperionImage.from_base64('', -2, 0)
+
+    def test_light_rectangles(self, lights):
+        """ Check that relative scanning areas are converted to pixel bounds """
+        x_0, x_1, y_0, y_1 = light_rectangles(lights, 4, 2)
+        assert list(x_0) == [0, 2, 0]
+        assert list(x_1) == [2, 4, 4]
+        assert list(y_0) == [0, 0, 0]
+        assert list(y_1) == [2, 2, 1]
+
+    def test_light_colors(self, image, lights):
+        """ Check that each light takes the mean color of its scanning area """
+        colors = light_colors(image, lights)
+        assert colors.shape == (3, 3)
+        assert numpy.allclose(colors[0], (1., 0., 0.))
+        assert numpy.allclose(colors[1], (0., .5, .5))
+        assert numpy.allclose(colors[2], (.5, 0., .5))
+
+    def test_light_region_sampler(self):
+        """ Check that the summed-area table gives the same means as a direct computation,
+        for random overlapping areas and successive frames """
+        random = numpy.random.RandomState(42)
+        lights = []
+        for i in range(50):
+            left, right = sorted(random.randint(0, 101, 2))
+            top, bottom = sorted(random.randint(0, 101, 2))
+            lights.append(BoblightLight(str(i), (left, right), (top, bottom)))
+        sampler = LightRegionSampler(lights, 64, 36)
+        x_0, x_1, y_0, y_1 = light_rectangles(lights, 64, 36)
+        for _ in range(2):
+            pixels = random.randint(0, 256, (36, 64, 3)).astype(numpy.uint8)
+            expected = [
+                pixels[y_0[i]:y_1[i], x_0[i]:x_1[i]].reshape(-1, 3).mean(axis=0) / 255.
+                for i in range(len(lights))
+            ]
+            assert numpy.allclose(sampler.sample(pixels), expected)
+
+    def test_light_region_sampler_threads(self, lights):
+        """ Check that threads sampling different frames with the same sampler do not
+        corrupt each other's means """
+        sampler = LightRegionSampler(lights, 64, 36)
+        errors = []
+
+        def sample(value):
+            pixels = numpy.full((36, 64, 3), value, dtype=numpy.uint8)
+            for _ in range(200):
+                if not numpy.allclose(sampler.sample(pixels), value / 255.):
+                    errors.append(value)
+
+        threads = [threading.Thread(target=sample, args=(value,)) for value in (0, 255)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors
@@ -0,0 +1,45 @@
+"""
+JSON codec unit tests
+"""
+
+import json
+
+import pytest
+
+from hyperion2boblight.lib import json_codec
+
+class TestJsonCodec:
+    """ Define the JSON codecs features/behaviour """
+
+    @pytest.fixture(params=sorted(json_codec.CODECS))
+    def codec(self, request):
+        """ Each available codec """
+        return json_codec.get_codec(request.param)
+
+    def test_json_codec_loads(self, codec):
+        """ Commands are parsed from bytes, bytearray and memoryview """
+        command = {'command': 'color', 'priority': 128, 'color': [1, 2, 3], 'name': 'café'}
+        line = json.dumps(command).encode('utf-8') + b'\n'
+        assert codec.loads(line) == command
+        assert codec.loads(bytearray(line)) == command
+        assert codec.loads(memoryview(line)) == command
+        with pytest.raises(ValueError):
+            codec.loads(b'{"command":')
+
+    def test_json_codec_dumps(self, codec):
+        """ Replies are encoded in bytes lines """
+        reply = codec.dumps({'success': False, 'error': 'café'})
+        assert reply.endswith(b'\n')
+        assert reply.count(b'\n') == 1
+        assert json.loads(reply.decode('utf-8')) == {'success': False, 'error': 'café'}
+
+    def test_json_codec_constants(self):
+        """ Constant replies are encoded once """
+        assert json.loads(json_codec.SUCCESS.decode('utf-8')) == {'success': True}
+        assert json.loads(json_codec.FAILURE.decode('utf-8')) == {'success': False}
+
+    def test_json_codec_unavailable(self):
+        """ Asking for an unknown backend fails """
+        with pytest.raises(ValueError):
+            json_codec.get_codec('unknown')
+        assert json_codec.get_codec() in json_codec.CODECS.values()
@@ -0,0 +1,70 @@
+"""
+LED stream unit tests
+"""
+
+import json
+import time
+
+import numpy
+import pytest
+
+from hyperion2boblight import Empty
+from hyperion2boblight.lib.led_stream import LedStream
+
+class TestLedStream:
+    """ Define the LedStream class features/behaviour """
+
+    @pytest.fixture
+    def led_stream(self):
+        """ Create a stream of 20 frames per second """
+        return LedStream(fps=20.)
+
+    def test_led_stream_encode(self, led_stream):
+        """ Frames are ledcolors updates of 8 bits colors """
+        data = led_stream.encode(numpy.array([[1., .5, 0.], [0., 2., -1.]]))
+        assert data.endswith(b'\n')
+        assert json.loads(str(data, 'utf-8')) == {
+            'command': 'ledcolors-ledstream-update',
+            'result': {'leds': [255, 128, 0, 0, 255, 0]},
+            'success': True
+        }
+
+    def test_led_stream_shared_frames(self, led_stream):
+        """ Each frame is encoded once and posted to every subscriber """
+        calls = []
+        first = led_stream.subscribe()
+        second = led_stream.subscribe(lambda: calls.append(True))
+        led_stream.publish(numpy.ones((3, 3)))
+        data = first.get(timeout=1)
+        assert second.get(timeout=1) is data
+        assert calls == [True]
+        assert led_stream.encoded == 1
+        led_stream.unsubscribe(first)
+        led_stream.unsubscribe(second)
+
+    def test_led_stream_rate(self, led_stream):
+        """ Frames published faster than the rate are coalesced, the newest one is sent """
+        mailbox = led_stream.subscribe()
+        start = time.monotonic()
+        while time.monotonic() - start < .5:
+            led_stream.publish(numpy.random.random((10, 3)))
+        led_stream.publish(numpy.zeros((10, 3)))
+        time.sleep(.2)
+        assert 5 <= led_stream.encoded <= 14
+        assert json.loads(str(mailbox.get(timeout=1), 'utf-8'))['result']['leds'] == [0] * 30
+        assert mailbox.dropped == led_stream.encoded - 1
+        led_stream.unsubscribe(mailbox)
+
+    def test_led_stream_current_colors(self, led_stream):
+        """ A new subscriber gets the current colors, and the thread stops without
+        subscriber """
+        led_stream.publish(numpy.zeros((2, 3)))
+        assert led_stream.thread is None
+        mailbox = led_stream.subscribe()
+        assert mailbox.get(timeout=1)
+        led_stream.unsubscribe(mailbox)
+        time.sleep(led_stream.interval * 12)
+        assert led_stream.thread is None
+        led_stream.publish(numpy.ones((2, 3)))
+        with pytest.raises(Empty):
+            mailbox.get(timeout=.1)
@@ -0,0 +1,59 @@
+"""
+Light table unit tests
+"""
+
+import numpy
+import pytest
+
+from hyperion2boblight.lib.light_table import BoblightLight, LightTable
+
+class TestLightTable:
+    """ Define the LightTable class features/behaviour """
+
+    @pytest.fixture
+    def table(self):
+        """ Lights as defined in include/boblight/boblight.conf, plus a top one """
+        return LightTable(
+            ['left', 'right', 'top'],
+            [(0., .5, 0., 1.), (.5, 1., 0., 1.), (0., 1., 0., .25)])
+
+    def test_light_table_arrays(self, table):
+        """ Bounds, centers and sizes are available as arrays """
+        assert numpy.allclose(table.left, [0., .5, 0.])
+        assert numpy.allclose(table.bottom, [1., 1., .25])
+        assert numpy.allclose(table.centers, [(.25, .5), (.75, .5), (.5, .125)])
+        assert numpy.allclose(table.sizes, [(.5, 1.), (.5, 1.), (1., .25)])
+
+    def test_light_table_dict(self, table):
+        """ The table behaves like a dict of BoblightLight keyed by names """
+        assert len(table) == 3
+        assert list(table) == ['left', 'right', 'top']
+        assert 'right' in table
+        assert 'bottom' not in table
+        assert table['right'].left == .5
+        assert table['right'] is table['right']
+        assert [light.name for light in table.values()] == table.keys()
+        assert dict(table.items())['top'].height == .25
+        with pytest.raises(KeyError):
+            table['bottom']
+
+    def test_light_table_from_lights(self):
+        """ A table built from BoblightLight objects holds their scanning areas """
+        lights = [BoblightLight('a', (10, 30), (20, 60)), BoblightLight('b', (0, 100), (0, 5))]
+        table = LightTable.from_lights(lights)
+        assert table.keys() == ['a', 'b']
+        assert numpy.allclose(table.bounds, [(.1, .3, .2, .6), (0., 1., 0., .05)])
+        assert table['a'].width == pytest.approx(.2)
+        assert table['a'].height == pytest.approx(.4)
+
+    def test_light_table_contains(self, table):
+        """ contains() matches BoblightLight.contains for all points and lights at once """
+        points = numpy.random.RandomState(0).rand(50, 2)
+        expected = [[light.contains(point) for light in table.values()] for point in points]
+        assert (table.contains(points) == numpy.array(expected)).all()
+
+    def test_light_table_nearest(self, table):
+        """ nearest() returns the light whose center is the closest """
+        assert list(table.nearest([(0., .5), (.9, .9), (.5, 0.)])) == [0, 1, 2]
+        with pytest.raises(ValueError):
+            LightTable().nearest([(0., 0.)])
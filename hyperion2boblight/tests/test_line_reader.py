@@ -0,0 +1,50 @@
+"""
+Line reader unit tests
+"""
+
+from hyperion2boblight.lib.line_reader import LineReader
+
+def chunked_recv(data, size):
+    """ Return a recv function giving data in chunks of size bytes, then b'' """
+    chunks = [data[i:i + size] for i in range(0, len(data), size)]
+    return lambda _: chunks.pop(0) if chunks else b''
+
+class TestLineReader:
+    """ Define the LineReader class features/behaviour """
+
+    def test_line_reader_fragmented(self):
+        """ Lines split over several chunks are put back together """
+        data = b''.join(b'line %d\n' % i for i in range(1000))
+        reader = LineReader(chunked_recv(data, 7))
+        assert reader.readlines(1000) == data.splitlines(keepends=True)
+        assert reader.readline() == b''
+
+    def test_line_reader_many_lines_per_chunk(self):
+        """ Lines received in a single chunk are returned one by one """
+        reader = LineReader(chunked_recv(b'a\nb\nc\npartial', 1 << 20))
+        assert reader.readline() == b'a\n'
+        assert reader.readlines(2) == [b'b\n', b'c\n']
+        assert len(reader) == 7
+        # The last line is returned without line end when the stream ends
+        assert reader.readlines(2) == []
+        assert reader.readline() == b''
+
+    def test_line_reader_feed(self):
+        """ Data can be pushed into the reader, lines are available once complete """
+        reader = LineReader()
+        reader.feed(b'hel')
+        assert reader.next_line() is None
+        reader.feed(b'lo\nping')
+        assert reader.next_line() == b'hello\n'
+        assert reader.next_line() is None
+        reader.feed(b' 1\n')
+        assert reader.next_line() == b'ping 1\n'
+        assert len(reader) == 0
+
+    def test_line_reader_read(self):
+        """ read() returns the buffered bytes first, then receives """
+        reader = LineReader(chunked_recv(b'first\nsecond', 100))
+        assert reader.readline() == b'first\n'
+        assert reader.read(3) == b'sec'
+        assert reader.read(100) == b'ond'
+        assert reader.read(100) == b''
@@ -0,0 +1,82 @@
+"""
+Frame mailbox unit tests
+"""
+
+import time
+import threading
+
+import pytest
+
+from hyperion2boblight import Empty
+from hyperion2boblight.lib.mailbox import FrameMailbox
+
+class TestFrameMailbox:
+    """ Define the FrameMailbox class features/behaviour """
+
+    @pytest.fixture
+    def mailbox(self):
+        """ Create an empty mailbox """
+        return FrameMailbox()
+
+    def test_mailbox_get_empty(self, mailbox):
+        """ Getting from an empty mailbox must raise Empty once the timeout expired """
+        with pytest.raises(Empty):
+            mailbox.get(timeout=0.1)
+
+    def test_mailbox_latest_wins(self, mailbox):
+        """ The consumer only gets the newest item, overwritten ones are counted """
+        for i in range(10):
+            mailbox.put(i)
+        assert mailbox.get() == 9
+        assert mailbox.dropped == 9
+        assert mailbox.posted == 10
+        with pytest.raises(Empty):
+            mailbox.get(timeout=0.1)
+
+    def test_mailbox_wait_item(self, mailbox):
+        """ A call to get() must return as soon as an item is posted """
+        def put_item_worker():
+            """ Function to post an item after a short pause """
+            time.sleep(0.5)
+            mailbox.put('item')
+        worker_thread = threading.Thread(target=put_item_worker)
+        start = time.time()
+        worker_thread.start()
+        assert mailbox.get(timeout=5) == 'item'
+        assert time.time() - start < 2
+        worker_thread.join()
+        assert mailbox.dropped == 0
+
+    def test_mailbox_maxsize(self):
+        """ A larger mailbox keeps the newest items, in order """
+        mailbox = FrameMailbox(maxsize=3)
+        for i in range(5):
+            mailbox.put(i)
+        assert len(mailbox) == 3
+        assert [mailbox.get(), mailbox.get(), mailbox.get()] == [2, 3, 4]
+        assert mailbox.dropped == 2
+        with pytest.raises(ValueError):
+            FrameMailbox(maxsize=0)
+
+    def test_mailbox_repeat(self, mailbox):
+        """ The last consumed item can be posted again, unless a newer one is pending """
+        mailbox.repeat()
+        with pytest.raises(Empty):
+            mailbox.get(timeout=0.1)
+        mailbox.put('first')
+        assert mailbox.get() == 'first'
+        mailbox.repeat()
+        assert mailbox.get(timeout=0.1) == 'first'
+        mailbox.put('second')
+        mailbox.repeat()
+        assert mailbox.get(timeout=0.1) == 'second'
+        assert mailbox.dropped == 0
+
+    def test_mailbox_drop(self, mailbox):
+        """ Items dropped by the consumer are counted with the overwritten ones """
+        mailbox.put('first')
+        mailbox.put('second')
+        mailbox.get()
+        mailbox.drop()
+        assert mailbox.dropped == 2
+        assert mailbox.posted == 2
@@ -0,0 +1,30 @@
+"""
+Command line unit tests
+"""
+
+import argparse
+
+import pytest
+
+from hyperion2boblight.main import boblight_address
+
+class TestMain:
+    """ Check the parsing of the command line arguments """
+
+    @pytest.mark.parametrize('value, address', [
+        ('localhost', ('localhost', None)),
+        ('boblight.lan:19334', ('boblight.lan', 19334)),
+        ('[::1]:19334', ('::1', 19334)),
+        ('[fe80::1]', ('fe80::1', None)),
+        ('fe80::1', ('fe80::1', None))
+    ])
+    def test_main_boblight_address(self, value, address):
+        """ Hosts, host names with a port and IPv6 addresses are accepted """
+        assert boblight_address(value) == address
+
+    @pytest.mark.parametrize('value', [
+        'host:abc', 'host:70000', ':19333', '[::1', '[::1]19333', '[::1]:abc', '[]:19333'])
+    def test_main_boblight_address_invalid(self, value):
+        """ Invalid addresses are reported as usage errors """
+        with pytest.raises(argparse.ArgumentTypeError):
+            boblight_address(value)
@@ -0,0 +1,82 @@
+"""
+Mapping cache unit tests
+"""
+
+import os
+
+import numpy
+import pytest
+
+from hyperion2boblight.lib.mapping_cache import MappingCache
+from hyperion2boblight.lib.light_table import BoblightLight, LightTable
+
+class TestMappingCache:
+    """ Mapping cache test class """
+
+    @pytest.fixture
+    def lights(self):
+        """ Lights as defined in include/boblight/boblight.conf """
+        return [
+            BoblightLight('left', (0, 50), (0, 100)),
+            BoblightLight('right', (50, 100), (0, 100)),
+        ]
+
+    def test_mapping_cache_reuse(self, lights):
+        """ Check that the same sampler is returned for the same layout and resolution """
+        cache = MappingCache()
+        sampler = cache.get(lights, 64, 36)
+        assert cache.get(lights, 64, 36) is sampler
+        assert cache.get(lights, 32, 18) is not sampler
+        assert cache.get(lights[:1], 64, 36) is not sampler
+
+    def test_mapping_cache_light_table(self, lights):
+        """ A light table has the same layout as the lights it holds """
+        table = LightTable.from_lights(lights)
+        assert MappingCache.layout_hash(table) == MappingCache.layout_hash(lights)
+        cache = MappingCache()
+        assert cache.get(table, 64, 36) is cache.get(lights, 64, 36)
+
+    def test_mapping_cache_lru(self, lights):
+        """ Check that the least recently used resolution is evicted """
+        cache = MappingCache(size=2)
+        sampler = cache.get(lights, 64, 36)
+        cache.get(lights, 32, 18)
+        cache.get(lights, 64, 36)
+        cache.get(lights, 16, 9)
+        assert cache.get(lights, 64, 36) is sampler
+        assert len(cache.samplers) == 2
+        assert (MappingCache.layout_hash(lights), 32, 18) not in cache.samplers
+
+    def test_mapping_cache_directory(self, lights, tmpdir):
+        """ Check that mappings stored on disk are reloaded by a new cache """
+        directory = str(tmpdir.join('mappings'))
+        sampler = MappingCache(directory=directory).get(lights, 64, 36)
+        assert len(os.listdir(directory)) == 1
+
+        reloaded = MappingCache(directory=directory).get(lights, 64, 36)
+        assert reloaded is not sampler
+        assert (reloaded.corners == sampler.corners).all()
+        pixels = numpy.zeros((36, 64, 3), dtype=numpy.uint8)
+        pixels[:, :32] = 255
+        assert numpy.allclose(reloaded.sample(pixels), [[1., 1., 1.], [0., 0., 0.]])
+
+    def test_mapping_cache_invalid_file(self, lights, tmpdir):
+        """ Check that a mapping on disk which does not fit the frames is computed again """
+        directory = str(tmpdir.join('mappings'))
+        sampler = MappingCache(directory=directory).get(lights, 64, 36)
+        path = os.path.join(directory, os.listdir(directory)[0])
+        numpy.savez(path, corners=sampler.corners + 65 * 37, scales=sampler.scales)
+
+        reloaded = MappingCache(directory=directory).get(lights, 64, 36)
+        assert (reloaded.corners == sampler.corners).all()
+
+    def test_mapping_cache_store_error(self, lights, tmpdir, monkeypatch):
+        """ Check that a failure to write a mapping is only logged """
+        def failing_replace(source, destination):
+            os.unlink(source)
+            raise OSError('read-only')
+        monkeypatch.setattr(os, 'replace', failing_replace)
+        directory = str(tmpdir.join('mappings'))
+        cache = MappingCache(directory=directory)
+        assert len(cache.get(lights, 64, 36)) == 2
+        assert os.listdir(directory) == []
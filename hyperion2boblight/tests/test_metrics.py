@@ -0,0 +1,56 @@
+"""
+Metrics unit tests
+"""
+
+import json
+import time
+
+from hyperion2boblight.lib.metrics import Metrics, Histogram
+
+class TestMetrics:
+    """ Define the metrics features/behaviour """
+
+    def test_histogram_buckets(self):
+        """ Values are counted in the first bucket whose bound is not lower """
+        histogram = Histogram((.001, .01, .1))
+        for value in (.0005, .001, .005, .05, 1.):
+            histogram.observe(value)
+        result = histogram.to_dict()
+        assert result['buckets'] == [[.001, 2], [.01, 1], [.1, 1], [None, 1]]
+        assert result['count'] == 5
+        assert result['max'] == 1.
+        assert abs(result['mean'] - 1.0565 / 5) < 1e-9
+
+    def test_metrics_registry(self):
+        """ Instruments are created once per name """
+        metrics = Metrics()
+        assert metrics.counter('frames') is metrics.counter('frames')
+        assert metrics.histogram('latency') is metrics.histogram('latency')
+        assert metrics.histogram('latency').to_dict()['mean'] == 0.
+
+    def test_metrics_to_dict(self):
+        """ Counters report their total and rate, gauges are called when read """
+        metrics = Metrics(rate_interval=.1)
+        metrics.counter('commands').add(10)
+        metrics.histogram('latency').observe(.002)
+        metrics.gauge('dropped', lambda: 3)
+        time.sleep(.1)
+        result = metrics.to_dict()
+        assert result['counters']['commands']['total'] == 10
+        assert 0 < result['counters']['commands']['rate'] <= 100
+        assert result['histograms']['latency']['count'] == 1
+        assert result['gauges'] == {'dropped': 3}
+        json.dumps(result)
+
+    def test_metrics_rate_interval(self):
+        """ Rates are computed over at least rate_interval seconds """
+        metrics = Metrics(rate_interval=.2)
+        counter = metrics.counter('frames')
+        counter.add(10)
+        time.sleep(.2)
+        metrics.to_dict()
+        counter.add(10)
+        result = metrics.to_dict()
+        # Still computed from the start, not from the last call
+        assert result['counters']['frames']['rate'] < 20 / .2 * 1.01
+        assert result['counters']['frames']['rate'] > 10 / .2 * .5
@@ -131,3 +131,154 @@ class TestPriorityList:
         returned_tuple = non_empty_priority_list.wait_new_item() # Wait for a new item
         assert returned_tuple == expected_tuple
 
+
+    def test_priority_list_generation(self, non_empty_priority_list):
+        """ The generation must only change when the first item changes """
+        generation = non_empty_priority_list.generation
+        non_empty_priority_list.put(64, 64)
+        non_empty_priority_list.remove(255)
+        non_empty_priority_list.put(1, 1)
+        assert non_empty_priority_list.generation == generation
+        non_empty_priority_list.put(1, 2)
+        assert non_empty_priority_list.generation == generation + 1
+        non_empty_priority_list.remove(1)
+        assert non_empty_priority_list.generation == generation + 2
+        non_empty_priority_list.clear()
+        assert non_empty_priority_list.generation == generation + 3
+
+    def test_priority_list_version(self, non_empty_priority_list):
+        """ The version must change on any modification """
+        version = non_empty_priority_list.version
+        non_empty_priority_list.put(3, 3)
+        assert non_empty_priority_list.version == version + 1
+        non_empty_priority_list.remove(3)
+        assert non_empty_priority_list.version == version + 2
+        non_empty_priority_list.remove(3)
+        assert non_empty_priority_list.version == version + 2
+        non_empty_priority_list.clear()
+        assert non_empty_priority_list.version == version + 3
+        non_empty_priority_list.clear()
+        assert non_empty_priority_list.version == version + 3
+
+    def test_priority_list_priorities_version(self, non_empty_priority_list):
+        """ The priorities version must only change when a priority is added or removed """
+        version = non_empty_priority_list.priorities_version
+        non_empty_priority_list.put(3, 3)
+        assert non_empty_priority_list.priorities_version == version + 1
+        non_empty_priority_list.put(3, 4)
+        assert non_empty_priority_list.priorities_version == version + 1
+        non_empty_priority_list.remove(3)
+        assert non_empty_priority_list.priorities_version == version + 2
+        non_empty_priority_list.clear()
+        assert non_empty_priority_list.priorities_version == version + 3
+        non_empty_priority_list.clear()
+        assert non_empty_priority_list.priorities_version == version + 3
+
+    def test_priority_list_transaction(self, non_empty_priority_list):
+        """ The modifications of a transaction must be published once, at its end """
+        generation = non_empty_priority_list.generation
+        with non_empty_priority_list.transaction():
+            non_empty_priority_list.clear()
+            non_empty_priority_list.put(50, 50)
+            with non_empty_priority_list.transaction():
+                non_empty_priority_list.put(100, 100)
+            assert non_empty_priority_list.generation == generation
+        assert non_empty_priority_list.generation == generation + 1
+        assert non_empty_priority_list.get_first() == (50, 50)
+        assert non_empty_priority_list.wait_generation(generation) == (generation + 1, (50, 50))
+
+        with non_empty_priority_list.transaction():
+            non_empty_priority_list.put(200, 200)
+        assert non_empty_priority_list.generation == generation + 1
+
+    def test_priority_list_subscribe(self, non_empty_priority_list):
+        """ Each subscription must get the changes of the first item, the newest ones being
+        kept when they are not consumed """
+        generation = non_empty_priority_list.generation
+        first = non_empty_priority_list.get_first()
+        changes = []
+        with non_empty_priority_list.subscribe(
+                maxsize=2, listener=lambda *change: changes.append(change)) as subscription:
+            with non_empty_priority_list.subscribe() as latest:
+                assert subscription.get(timeout=0.1) == (generation, first)
+                non_empty_priority_list.put(64, 64) # Not the first item
+                non_empty_priority_list.put(0, 0)
+                non_empty_priority_list.put(0, 1)
+                non_empty_priority_list.clear()
+                assert subscription.get(timeout=0.1) == (generation + 2, (0, 1))
+                assert subscription.get(timeout=0.1) == (generation + 3, None)
+                assert subscription.dropped == 1
+                assert latest.get(timeout=0.1) == (generation + 3, None)
+                assert latest.dropped == 3
+                assert changes == [
+                    (generation + 1, (0, 0)), (generation + 2, (0, 1)), (generation + 3, None)]
+            non_empty_priority_list.put(1, 1)
+            assert subscription.get(timeout=0.1) == (generation + 4, (1, 1))
+            assert latest.mailbox.posted == 4
+        assert not non_empty_priority_list.subscriptions
+
+    def test_priority_list_subscribe_empty(self, empty_priority_list):
+        """ Subscribing to an empty list must not post anything """
+        with empty_priority_list.subscribe() as subscription:
+            with pytest.raises(Empty):
+                subscription.get(timeout=0.1)
+
+    def test_priority_list_timestamps(self, empty_priority_list):
+        """ The reception time of the items is kept while they are in the list """
+        empty_priority_list.put(1, 1, timestamp=12.5)
+        empty_priority_list.put(2, 2)
+        assert empty_priority_list.get_timestamp(1) == 12.5
+        assert empty_priority_list.get_timestamp(2) is None
+        empty_priority_list.put(1, 3)
+        assert empty_priority_list.get_timestamp(1) is None
+        empty_priority_list.put(2, 2, timestamp=13.)
+        empty_priority_list.remove(2)
+        assert empty_priority_list.get_timestamp(2) is None
+
+    def test_priority_list_wait_generation(self, non_empty_priority_list):
+        """ A call to wait_generation() must return immediately if the first item changed
+        since the given generation, even if the change happened before the call """
+        generation = non_empty_priority_list.generation
+        non_empty_priority_list.put(0, 0)
+        non_empty_priority_list.put(0, 10)
+        start = time.time()
+        assert non_empty_priority_list.wait_generation(generation) == (generation + 2, (0, 10))
+        assert time.time() - start < 0.5
+        new_generation = non_empty_priority_list.wait_generation(generation + 2, timeout=0.2)
+        assert new_generation == (generation + 2, (0, 10))
+        non_empty_priority_list.clear()
+        assert non_empty_priority_list.wait_generation(generation + 2) == (generation + 3, None)
+
+    def test_priority_list_many_removes(self, empty_priority_list):
+        """ Removed priorities must not accumulate """
+        empty_priority_list.put(1, 1)
+        for _ in range(1000):
+            empty_priority_list.put(2, 2)
+            empty_priority_list.remove(2)
+        assert empty_priority_list.get_first() == (1, 1)
+        assert len(empty_priority_list.heap) < 100
+
+    def test_priority_list_expiry(self, non_empty_priority_list):
+        """ An item put with a duration must be removed when its duration is over, and
+        waiters must only be woken up if it was the first item """
+        generation = non_empty_priority_list.generation
+        non_empty_priority_list.put(64, 64, duration=0.2)
+        non_empty_priority_list.put(0, 0, duration=0.5)
+        assert non_empty_priority_list.size() == 5
+        time.sleep(0.3)
+        assert non_empty_priority_list.size() == 4
+        assert non_empty_priority_list.generation == generation + 1
+        assert non_empty_priority_list.wait_generation(generation + 1, timeout=2) == \
+            (generation + 2, (1, 1))
+        assert non_empty_priority_list.size() == 3
+
+    def test_priority_list_expiry_renewed(self, empty_priority_list):
+        """ Putting an item again must replace its duration """
+        empty_priority_list.put(1, 1, duration=0.2)
+        empty_priority_list.put(1, 1, duration=0.6)
+        empty_priority_list.put(2, 2, duration=0.2)
+        empty_priority_list.put(2, 2)
+        time.sleep(0.4)
+        assert empty_priority_list.get_priorities() == [1, 2]
+        time.sleep(0.4)
+        assert empty_priority_list.get_priorities() == [2]
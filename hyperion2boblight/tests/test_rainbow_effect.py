@@ -2,7 +2,11 @@
 Rainbow light effect unit tests
 """
 
+import numpy
+import pytest
+
 from hyperion2boblight.lib.effects import rainbow
+from hyperion2boblight.lib.light_table import LightTable
 
 class TestRainbowEffect:
     """ Raibow effect test class """
@@ -29,3 +33,24 @@ class TestRainbowEffect:
         assert (0., 0., 1.) in commands # Blue
         assert (1., 0., 1.) in commands # Purple
 
+
+    def test_rainbow_effect_seek(self):
+        """ Seeking gives the same color as incrementing step by step, the hue being
+        interpolated between steps """
+        rainbow_instance = rainbow.RainbowEffect()
+        rainbow_instance.reset()
+        for _ in range(42):
+            rainbow_instance.increment()
+        expected = rainbow_instance.get_color(None)
+        rainbow_instance.seek(42 * rainbow_instance.step_duration)
+        assert rainbow_instance.get_color(None) == pytest.approx(expected, abs=1e-3)
+        rainbow_instance.seek(0.)
+        assert rainbow_instance.get_color(None) == (1., 0., 0.)
+
+    def test_rainbow_effect_render(self):
+        """ All the lights get the color of the current hue """
+        rainbow_instance = rainbow.RainbowEffect()
+        colors = rainbow_instance.render(
+            LightTable([str(i) for i in range(300)]), 12.3)
+        assert colors.shape == (300, 3)
+        assert numpy.all(colors == rainbow_instance.get_color(None))
@@ -0,0 +1,71 @@
+"""
+Smoothing unit tests
+"""
+
+import numpy
+import pytest
+
+from hyperion2boblight.lib.smoothing import Smoothing
+
+class TestSmoothing:
+    """ Define the Smoothing class features/behaviour """
+
+    def test_smoothing_linear(self):
+        """ The linear smoothing reaches the target after the time constant """
+        smoothing = Smoothing('linear', 1.)
+        smoothing.reset(numpy.zeros((4, 3)))
+        smoothing.set_target(numpy.ones((4, 3)), now=10.)
+        assert smoothing.step(now=10.25)
+        assert numpy.allclose(smoothing.colors, .25)
+        assert smoothing.step(now=10.5)
+        assert numpy.allclose(smoothing.colors, .5)
+        # A new target starts from the current colors
+        smoothing.set_target(numpy.zeros((4, 3)), now=10.5)
+        assert smoothing.step(now=11.)
+        assert numpy.allclose(smoothing.colors, .25)
+        assert not smoothing.step(now=12.)
+        assert numpy.all(smoothing.colors == 0.)
+        assert not smoothing.step(now=13.)
+
+    def test_smoothing_exponential(self):
+        """ The exponential smoothing covers 63% of the distance every time constant, and
+        snaps to the target once close enough """
+        smoothing = Smoothing('exponential', 1.)
+        smoothing.reset(numpy.zeros((4, 3)))
+        smoothing.set_target(numpy.ones((4, 3)), now=0.)
+        assert smoothing.step(now=1.)
+        assert numpy.allclose(smoothing.colors, 1. - numpy.exp(-1.))
+        assert smoothing.step(now=2.)
+        assert numpy.allclose(smoothing.colors, 1. - numpy.exp(-2.))
+        assert not smoothing.step(now=10.)
+        assert numpy.all(smoothing.colors == 1.)
+
+    def test_smoothing_retarget(self):
+        """ Setting the target on every frame does not restart the transition """
+        smoothing = Smoothing('linear', 1.)
+        smoothing.reset(numpy.zeros((4, 3)))
+        smoothing.set_target(numpy.ones((4, 3)), now=0.)
+        assert smoothing.step(now=.5)
+        # The same target again: the transition goes on
+        smoothing.set_target(numpy.ones((4, 3)), now=.75)
+        assert not smoothing.step(now=1.)
+        assert numpy.all(smoothing.colors == 1.)
+        # A new target set after the last step moves the colors from that step
+        smoothing.set_target(numpy.zeros((4, 3)), now=1.)
+        assert smoothing.step(now=1.5)
+        assert numpy.allclose(smoothing.colors, .5)
+        smoothing.set_target(numpy.ones((4, 3)), now=2.)
+        assert smoothing.step(now=2.)
+        assert numpy.allclose(smoothing.colors, .75)
+
+    def test_smoothing_lights_changed(self):
+        """ The target is reached at once when the number of lights changes """
+        smoothing = Smoothing('linear', 1.)
+        smoothing.set_target(numpy.ones((2, 3)), now=0.)
+        assert not smoothing.step(now=0.)
+        assert numpy.all(smoothing.colors == 1.)
+
+    def test_smoothing_kind(self):
+        """ Unknown kinds of smoothing are rejected """
+        with pytest.raises(ValueError):
+            Smoothing('cubic')
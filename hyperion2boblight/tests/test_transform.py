@@ -0,0 +1,78 @@
+"""
+Color transform unit tests
+"""
+
+import colorsys
+
+import numpy
+import pytest
+
+from hyperion2boblight import ColorTransform
+
+class TestColorTransform:
+    """ Define the ColorTransform class features/behaviour """
+
+    @pytest.fixture
+    def colors(self):
+        """ Random 8 bits colors, plus black, white and a gray """
+        colors = numpy.random.RandomState(0).randint(0, 256, (100, 3)) / 255.
+        colors[:3] = [(0., 0., 0.), (1., 1., 1.), (128 / 255.,) * 3]
+        return colors
+
+    def test_transform_identity(self, colors):
+        """ The default transform returns the colors untouched """
+        transform = ColorTransform()
+        assert transform.identity
+        assert transform.apply(colors) is colors
+        transform.update({'gamma': [1., 1., 1.], 'valueGain': 1.})
+        assert transform.identity
+        assert transform.version == 1
+
+    def test_transform_lookup_tables(self, colors):
+        """ Each channel follows the Hyperion formula """
+        parameters = {
+            'gamma': [2.2, 1.8, 1.],
+            'threshold': [.1, 0., .2],
+            'whitelevel': [.9, 1., .8],
+            'blacklevel': [.05, 0., 0.]
+        }
+        transform = ColorTransform(parameters)
+        assert not transform.identity
+        expected = numpy.empty_like(colors)
+        for channel in range(3):
+            (gamma, threshold, white, black) = [
+                parameters[name][channel]
+                for name in ('gamma', 'threshold', 'whitelevel', 'blacklevel')]
+            expected[:, channel] = numpy.where(
+                colors[:, channel] < threshold,
+                0., black + (white - black) * colors[:, channel] ** gamma)
+        assert numpy.allclose(transform.apply(colors), expected)
+
+    def test_transform_hsv_gains(self, colors):
+        """ Value and saturation gains keep the hue of the colors """
+        transform = ColorTransform({'valueGain': .5, 'saturationGain': 1.5})
+        expected = []
+        for color in colors:
+            (hue, saturation, value) = colorsys.rgb_to_hsv(*color)
+            expected.append(colorsys.hsv_to_rgb(hue, min(saturation * 1.5, 1.), value * .5))
+        assert numpy.allclose(transform.apply(colors), expected)
+
+    def test_transform_invalid(self):
+        """ An invalid parameter is rejected, and nothing is changed """
+        transform = ColorTransform()
+        with pytest.raises(ValueError):
+            transform.update({'valueGain': 2., 'gamma': [1., 1.]})
+        with pytest.raises(ValueError):
+            transform.update({'gamma': [0., 1., 1.]})
+        assert transform.to_dict() == ColorTransform.DEFAULTS
+        assert transform.version == 0
+
+    def test_transform_listener(self):
+        """ Listeners are called after each change """
+        transform = ColorTransform()
+        changes = []
+        transform.add_listener(lambda: changes.append(transform.version))
+        transform.update({'id': 'strip', 'saturationGain': 1.2})
+        assert changes == [1]
+        assert transform.to_dict()['id'] == 'strip'
+        assert transform.to_dict()['saturationGain'] == 1.2
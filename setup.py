@@ -1,7 +1,7 @@
 """ Installation module """
 import sys
 
-from setuptools import setup
+from setuptools import setup, find_packages
 from setuptools.command.test import test as TestCommand
 
 class PyTest(TestCommand):
@@ -31,7 +31,10 @@ setup(
     (as the Hyperion Remote smartphone app) to control your boblight server.""",
     classifiers=[
         'Development Status :: 4 - Beta',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
         'License :: OSI Approved :: MIT License'
         ],
     keywords='hyperion boblight',
@@ -39,7 +42,11 @@ setup(
     author='Alexis BRENON',
     author_email='brenon.alexis+hyperion2boblight@gmail.com',
     license='MIT',
-    packages=['hyperion2boblight'],
+    packages=find_packages(),
+    python_requires='>=3.7',
+    package_data={'hyperion2boblight.lib.effects': ['*.json']},
+    install_requires=['numpy'],
+    extras_require={'fast': ['orjson']},
     zip_safe=False,
     tests_require=['pytest'],
     cmdclass={'test':PyTest},